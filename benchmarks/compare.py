@@ -0,0 +1,57 @@
+"""Compares two benchmark results and reports regressions.
+
+    python -m benchmarks.compare baseline.json results.json --threshold 10
+
+Exits with status 1 when any result got worse by more than the threshold.
+"""
+
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = {"MiB/s", "ops/s"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("baseline")
+    parser.add_argument("results")
+    parser.add_argument(
+        "--threshold", type=float, default=10, help="Allowed change in percent"
+    )
+    args = parser.parse_args(argv)
+
+    baseline = _load(args.baseline)
+    regressions = 0
+    for key, result in _load(args.results).items():
+        if key not in baseline or not baseline[key]["value"]:
+            continue
+        change = (result["value"] / baseline[key]["value"] - 1) * 100
+        worse = -change if result["unit"] in HIGHER_IS_BETTER else change
+        regressed = worse > args.threshold
+        regressions += regressed
+        print(
+            f"{'REGRESSION' if regressed else 'ok':<10} {_label(key):<60} "
+            f"{baseline[key]['value']:>12.6g} -> {result['value']:>12.6g} "
+            f"{result['unit']:<6} {change:+.1f}%"
+        )
+
+    sys.exit(1 if regressions else 0)
+
+
+def _load(path):
+    with open(path) as f:
+        results = json.load(f)["results"]
+    return {
+        (result["name"], tuple(sorted(result["params"].items()))): result
+        for result in results
+    }
+
+
+def _label(key):
+    name, params = key
+    return name + "".join(f" {param}={value}" for param, value in params)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Offline benchmarks of the Uplyfile client, storage, mapper and URL builder.
+
+All network I/O goes to a `UplyfileEmulator` on localhost, so results are
+reproducible without API keys. Run from the repository root:
+
+    python -m benchmarks.run --output results.json
+
+Results are written as JSON and can be compared between releases with
+`python -m benchmarks.compare`.
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+
+from uplyfile_django.emulator import UplyfileEmulator
+
+MIB = 1024 * 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--output", help="Write results to this file")
+    parser.add_argument(
+        "--upload-sizes", type=_sizes, default=[64 * 1024, MIB, 16 * MIB]
+    )
+    parser.add_argument("--listing-sizes", type=_sizes, default=[1000, 100000, 1000000])
+    parser.add_argument("--mapper-sizes", type=_sizes, default=[1000, 100000])
+    parser.add_argument("--open-sizes", type=_sizes, default=[MIB, 32 * MIB])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir, UplyfileEmulator() as server:
+        _setup_django(tmp_dir)
+        results = [
+            *bench_upload(server, args.upload_sizes, args.repeat),
+            *bench_get_file_url(server, args.listing_sizes),
+            *bench_mapper(tmp_dir, args.mapper_sizes, args.repeat),
+            *bench_open_memory(server, tmp_dir, args.open_sizes),
+            *bench_uplyimage(args.repeat),
+        ]
+
+    report = {"meta": _meta(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def bench_upload(server, sizes, repeat):
+    from uplyfile_django.lib.uplyfile import Uplyfile
+
+    uply = Uplyfile("benchmark", "benchmark", base_api_url=server.api_url)
+    for size in sizes:
+        data = os.urandom(size)
+        timings = _measure(
+            lambda: uply.upload(f"file-{size}.bin", io.BytesIO(data)), repeat
+        )
+        _forget_files(server)
+        yield _result("upload.seconds", statistics.median(timings), "s", size=size)
+        yield _result(
+            "upload.throughput",
+            size / MIB / statistics.median(timings),
+            "MiB/s",
+            size=size,
+        )
+
+
+def bench_get_file_url(server, listing_sizes):
+    from uplyfile_django.lib.uplyfile import Uplyfile
+
+    content = io.BytesIO(b"benchmark content")
+    for listing_size in listing_sizes:
+        _fill_listing(server, listing_size - 1)
+        server.store("target.bin", content.getvalue())
+
+        uply = Uplyfile("benchmark", "benchmark", base_api_url=server.api_url)
+        (cold,) = _measure(lambda: uply.get_file_url(content), 1)
+        warm = _measure(lambda: uply.get_file_url(content), 1000)
+        _forget_files(server)
+
+        yield _result("get_file_url.cold", cold, "s", listing_size=listing_size)
+        yield _result(
+            "get_file_url.warm",
+            statistics.median(warm),
+            "s",
+            listing_size=listing_size,
+        )
+
+
+def bench_mapper(tmp_dir, sizes, repeat):
+    from uplyfile_django.storage.file_to_url_mapper import FileToUrlMapper
+
+    for size in sizes:
+        path = os.path.join(tmp_dir, f"mappings-{size}.json")
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    f"media/file-{i}.png": f"https://uplycdn.com/p/{i:012x}/f.png"
+                    for i in range(size)
+                },
+                f,
+            )
+
+        load = _measure(lambda: FileToUrlMapper(path), repeat)
+        mapper = FileToUrlMapper(path)
+        flush = _measure(mapper.flush, repeat)
+        yield _result("mapper.load", statistics.median(load), "s", entries=size)
+        yield _result("mapper.flush", statistics.median(flush), "s", entries=size)
+
+        sqlite_path = os.path.join(tmp_dir, f"mappings-{size}.sqlite3")
+        sqlite_mapper = FileToUrlMapper(sqlite_path, backend="sqlite")
+        sqlite_mapper.save_many(mapper.mappings)
+        load = _measure(lambda: FileToUrlMapper(sqlite_path, backend="sqlite"), repeat)
+        save = _measure(lambda: sqlite_mapper.save("media/new.png", "url"), repeat)
+        yield _result("mapper.sqlite.load", statistics.median(load), "s", entries=size)
+        yield _result("mapper.sqlite.save", statistics.median(save), "s", entries=size)
+
+        log_path = os.path.join(tmp_dir, f"mappings-{size}.log")
+        log_mapper = FileToUrlMapper(log_path, backend="log")
+        log_mapper.save_many(mapper.mappings)
+        load = _measure(lambda: FileToUrlMapper(log_path, backend="log"), repeat)
+        save = _measure(lambda: log_mapper.save("media/new.png", "url"), repeat)
+        yield _result("mapper.log.load", statistics.median(load), "s", entries=size)
+        yield _result("mapper.log.save", statistics.median(save), "s", entries=size)
+
+
+def bench_open_memory(server, tmp_dir, sizes):
+    from uplyfile_django.storage import UplyfileStorage
+
+    storage = UplyfileStorage(mappings_file=os.path.join(tmp_dir, "open.json"))
+    for size in sizes:
+        record = server.store(f"file-{size}.bin", os.urandom(size))
+        storage.mapper.save(record["original_name"], record["url"]["full"])
+
+        tracemalloc.start()
+        with storage._open(record["original_name"]) as f:
+            for _ in f.chunks():
+                pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        _forget_files(server)
+
+        yield _result("open.peak_memory", peak, "bytes", size=size)
+        yield _result("open.peak_memory_ratio", peak / size, "x", size=size)
+
+
+def bench_uplyimage(repeat, count=10000):
+    from uplyfile_django.lib.uplyfile import UplyImage
+
+    def build_urls():
+        for _ in range(count):
+            UplyImage("https://uplycdn.com/project/abcdef/image.png").resize(
+                "200", "100"
+            ).quality(80).blur(5).url
+
+    timings = _measure(build_urls, repeat)
+    yield _result("uplyimage.urls", count / statistics.median(timings), "ops/s")
+
+
+def _measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started_at)
+    return timings
+
+
+def _result(name, value, unit, **params):
+    return {"name": name, "params": params, "value": value, "unit": unit}
+
+
+def _fill_listing(server, count):
+    for i in range(count):
+        etag = f"{i:032x}"
+        server.files[etag] = {
+            "etag": etag,
+            "file_size_bytes": i,
+            "url": {"full": f"{server.url}/{server.project}/{i:012x}/file-{i}.bin"},
+        }
+
+
+def _forget_files(server):
+    server.files.clear()
+    server.contents.clear()
+    server.etags.clear()
+    server.modified.clear()
+
+
+def _setup_django(tmp_dir):
+    settings.configure(
+        UPLYFILE_STORAGE={
+            "PUBLIC_KEY": "benchmark",
+            "SECRET_KEY": "benchmark",
+            "MAPPINGS_FILE": os.path.join(tmp_dir, "uplyfile.json"),
+        }
+    )
+    django.setup()
+
+
+def _meta():
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def _sizes(value):
+    return [int(size) for size in value.split(",")]
+
+
+if __name__ == "__main__":
+    main()
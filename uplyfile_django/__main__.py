@@ -0,0 +1,83 @@
+"""Command line tools of uplyfile_django.
+
+Synchronize a directory with the project configured in Django settings:
+
+    DJANGO_SETTINGS_MODULE=mysite.settings python -m uplyfile_django sync static/
+"""
+
+import argparse
+import os
+import sys
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m uplyfile_django")
+    parser.add_argument(
+        "--settings", help="Django settings module, instead of DJANGO_SETTINGS_MODULE"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sync = commands.add_parser(
+        "sync", help="Upload files of a directory which aren't in the project yet"
+    )
+    sync.add_argument("directory", help="Directory to synchronize")
+    sync.add_argument("--prefix", default="", help="Prefix of the mapped names")
+    sync.add_argument(
+        "--workers", type=int, default=8, help="Concurrent hashes and uploads"
+    )
+    sync.add_argument(
+        "--dry-run", action="store_true", help="Only list the planned transfers"
+    )
+    sync.add_argument("--mappings-file", help="Instead of the MAPPINGS_FILE setting")
+    sync.add_argument("--public-key", help="Instead of the PUBLIC_KEY setting")
+    sync.add_argument("--secret-key", help="Instead of the SECRET_KEY setting")
+    return parser.parse_args(argv)
+
+
+def run_sync(args, stdout=sys.stdout):
+    from .storage import UplyfileStorage, sync
+
+    storage = UplyfileStorage(
+        mappings_file=args.mappings_file,
+        public_key=args.public_key,
+        secret_key=args.secret_key,
+    )
+    entries = sync.plan(storage, args.directory, args.prefix, args.workers)
+    pending = sync.transfers(entries)
+    pending_bytes = sum(entry.size for entry in pending)
+    stdout.write(
+        f"{len(entries)} files, {len(pending)} to upload "
+        f"({sync.format_size(pending_bytes)})\n"
+    )
+
+    if args.dry_run:
+        for entry in pending:
+            stdout.write(f"upload {entry.name} ({sync.format_size(entry.size)})\n")
+        return 0
+
+    progress = sync.Progress(stdout, pending)
+    result = sync.sync(storage, entries, args.workers, progress)
+    stdout.write(
+        f"Uploaded {len(result.uploaded)} files "
+        f"({sync.format_size(result.sent_bytes)}) in {result.duration:.1f}s, "
+        f"{sync.format_rate(result.sent_bytes, result.duration)}; "
+        f"{len(result.present)} already present, {len(result.failed)} failed\n"
+    )
+    for name, error in result.failed:
+        stdout.write(f"failed {name}: {error}\n")
+    return 1 if result.failed else 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.settings:
+        os.environ["DJANGO_SETTINGS_MODULE"] = args.settings
+
+    import django
+
+    django.setup()
+    return run_sync(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
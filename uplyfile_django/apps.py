@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class UplyfileDjangoConfig(AppConfig):
     name = "uplyfile_django"
+
+    def ready(self):
+        from .lib import transport
+        from .storage.utils import transport_options
+
+        transport.configure(**transport_options())
@@ -0,0 +1,19 @@
+"""A local emulator of the Uplyfile API, for tests and load tests run offline.
+
+It implements the project files listing, multipart and chunked uploads (the
+latter described in `uplyfile_django.lib.chunked_upload`), serves uploaded
+files and the `?metadata=extra` image metadata used by `UplyImage`. API
+requests are checked for a valid `Uply-Signature` when the emulator is given
+credentials. Latency, error rate and bandwidth can be set to emulate a slow
+or unreliable API. Files are kept in memory.
+
+Run it in-process, e.g. from the `uplyfile_emulator` pytest fixture in
+`uplyfile_django.emulator.pytest_plugin`, or as a standalone process shared
+by many clients:
+
+    python -m uplyfile_django.emulator --port 8080 --credentials public:secret
+"""
+
+from .server import DEFAULT_METADATA, UplyfileEmulator
+
+__all__ = ["DEFAULT_METADATA", "UplyfileEmulator"]
@@ -0,0 +1,61 @@
+import argparse
+
+from .server import UplyfileEmulator
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m uplyfile_django.emulator",
+        description="Runs a local emulator of the Uplyfile API",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--project", default="emulator")
+    parser.add_argument(
+        "--credentials",
+        action="append",
+        metavar="PUBLIC_KEY:SECRET_KEY",
+        help="Accepted API keys, may be repeated. Any signature is accepted if omitted",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Seconds every request is delayed by"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="Fraction of requests answered with 503",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=int,
+        help="Bytes per second a single connection may transfer",
+    )
+    parser.add_argument("--seed", type=int, help="Seed of the random failures")
+    args = parser.parse_args(argv)
+
+    credentials = None
+    if args.credentials:
+        credentials = dict(pair.split(":", 1) for pair in args.credentials)
+
+    emulator = UplyfileEmulator(
+        host=args.host,
+        port=args.port,
+        project=args.project,
+        credentials=credentials,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        bandwidth=args.bandwidth,
+        seed=args.seed,
+    )
+    print(f"Uplyfile API emulator listening on {emulator.api_url}", flush=True)
+    try:
+        emulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""pytest fixtures running the Uplyfile API emulator.
+
+Enable them in a `conftest.py` with:
+
+    pytest_plugins = ["uplyfile_django.emulator.pytest_plugin"]
+"""
+
+import pytest
+
+from ..lib.uplyfile import Uplyfile
+from .server import UplyfileEmulator
+
+PUBLIC_KEY = "emulator-public-key"
+SECRET_KEY = "emulator-secret-key"
+
+
+@pytest.fixture
+def uplyfile_emulator():
+    """An emulator accepting requests signed with `PUBLIC_KEY` and `SECRET_KEY`"""
+    with UplyfileEmulator(credentials={PUBLIC_KEY: SECRET_KEY}) as emulator:
+        yield emulator
+
+
+@pytest.fixture
+def uplyfile_emulator_client(uplyfile_emulator):
+    """An `Uplyfile` client talking to `uplyfile_emulator`"""
+    return Uplyfile(PUBLIC_KEY, SECRET_KEY, base_api_url=uplyfile_emulator.api_url)
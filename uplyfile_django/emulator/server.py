@@ -0,0 +1,438 @@
+import datetime
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_METADATA = {
+    "labels": [],
+    "objects": [],
+    "explicit_content": {
+        "adult": "VERY_UNLIKELY",
+        "medical": "VERY_UNLIKELY",
+        "racy": "VERY_UNLIKELY",
+        "spoof": "VERY_UNLIKELY",
+        "violence": "VERY_UNLIKELY",
+    },
+}
+
+
+class UplyfileEmulator:
+    """Runs the emulated API on a background thread.
+
+    Attributes:
+        credentials (dict): Secret keys by public keys accepted by the API,
+            None to accept any signature
+        latency (float): Seconds every request is delayed by
+        error_rate (float): Fraction of requests answered with 503
+        bandwidth (int): Bytes per second a single connection may transfer,
+            None for no limit
+        files (dict): Details of uploaded files by their etags
+        contents (dict): Content of uploaded files by their uids
+        etags (dict): Etags of uploaded files by their uids
+        modified (dict): Upload timestamps of files by their uids, sent as
+            `Last-Modified`
+        metadata (dict): `extra` metadata of images by their uids, returned
+            for `?metadata=extra` instead of `DEFAULT_METADATA`
+        uploads (dict): Unfinished chunked uploads by their ids
+        received_bytes (int): Number of chunk bytes accepted so far
+        fail_chunks (int): Number of following chunk requests answered with 503
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        project="emulator",
+        credentials=None,
+        latency=0,
+        error_rate=0,
+        bandwidth=None,
+        seed=None,
+    ):
+        """Create an emulator listening on given address.
+
+        Args:
+            host (str): Address to listen on
+            port (int): Port to listen on, a free one is picked when 0
+            project (str): Name of the project, part of file URLs
+            credentials (dict): Secret keys by public keys accepted by the API
+            latency (float): Seconds every request is delayed by
+            error_rate (float): Fraction of requests answered with 503
+            bandwidth (int): Bytes per second a single connection may transfer
+            seed (int): Seed of the random failures, for reproducible runs
+        """
+        self.project = project
+        self.credentials = credentials
+        self.latency = latency
+        self.error_rate = error_rate
+        self.bandwidth = bandwidth
+        self.files = {}
+        self.contents = {}
+        self.etags = {}
+        self.modified = {}
+        self.metadata = {}
+        self.uploads = {}
+        self.received_bytes = 0
+        self.fail_chunks = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._listing_body = None
+        self._httpd = _Server((host, port), _handler_class(self))
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        return f"{self.url}/api"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self._thread.start()
+
+    def serve_forever(self, poll_interval=0.5):
+        """Handles requests on the current thread until `stop` is called"""
+        self._httpd.serve_forever(poll_interval=poll_interval)
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def store(self, name, data):
+        """Adds a file to the project and returns its details"""
+        etag = hashlib.md5(data).hexdigest()
+        uid = uuid.uuid4().hex[:12]
+        uploaded_at = time.time()
+        created = datetime.datetime.fromtimestamp(uploaded_at, datetime.timezone.utc)
+        record = {
+            "content_type": "",
+            "created": created.isoformat().replace("+00:00", "Z"),
+            "modified": created.isoformat().replace("+00:00", "Z"),
+            "etag": etag,
+            "file_size_bytes": len(data),
+            "original_name": name,
+            "project_name": self.project,
+            "uid": uid,
+            "url": {
+                "base": f"{self.url}/{self.project}/{uid}",
+                "full": f"{self.url}/{self.project}/{uid}/{name}",
+                "name": name,
+                "operational": f"{self.url}/{self.project}/{uid}/",
+            },
+        }
+        with self._lock:
+            self.files[etag] = record
+            self.contents[uid] = data
+            self.etags[uid] = etag
+            self.modified[uid] = uploaded_at
+            self._listing_body = None
+        return record
+
+    def listing_body(self):
+        """Returns the serialized project listing, reused until files change"""
+        with self._lock:
+            if self._listing_body is None:
+                self._listing_body = json.dumps(list(self.files.values())).encode()
+            return self._listing_body
+
+    def is_signed(self, headers):
+        """Checks `Uply-*` headers the way `Uplyfile._gen_headers` builds them"""
+        if self.credentials is None:
+            return True
+
+        secret_key = self.credentials.get(headers.get("Uply-Public-Key"))
+        expires = headers.get("Uply-Expires", "")
+        signature = hashlib.sha256(f"{secret_key}{expires}".encode("utf-8"))
+        try:
+            expired = float(expires) < time.time()
+        except ValueError:
+            return False
+        return (
+            secret_key is not None
+            and not expired
+            and signature.hexdigest() == headers.get("Uply-Signature")
+        )
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def _handler_class(server):
+    class Handler(_EmulatorRequestHandler):
+        emulator = server
+
+    return Handler
+
+
+class _EmulatorRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    emulator = None
+
+    UPLOAD_RE = re.compile(r"^/api/\w+/upload/chunked/(?:(\w+)/(complete/)?)?$")
+    MULTIPART_UPLOAD_RE = re.compile(r"^/api/\w+/upload/$")
+    LIST_RE = re.compile(r"^/api/\w+/files/$")
+    FILE_RE = re.compile(r"^/\w+/(\w+)/(?:[^/]+/)*([^/]*)$")
+    RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def do_HEAD(self):
+        self._handle(self._head)
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def do_PUT(self):
+        self._handle(self._put)
+
+    def _handle(self, method):
+        if self.emulator.latency:
+            time.sleep(self.emulator.latency)
+        if self.emulator.should_fail():
+            self._read_body()
+            return self._send_json(503, {"detail": "Service unavailable."})
+        if self._path.startswith("/api/") and not self.emulator.is_signed(self.headers):
+            self._read_body()
+            return self._send_json(403, {"detail": "Invalid signature."})
+        method()
+
+    @property
+    def _path(self):
+        return urlsplit(self.path).path
+
+    def _get(self):
+        if self.LIST_RE.match(self._path):
+            return self._send(200, self.emulator.listing_body(), "application/json")
+
+        uid, name = self._matched_file()
+        if uid in self.emulator.contents:
+            if not name:
+                return self._send_metadata(uid)
+            return self._send_content(uid)
+
+        upload = self._matched_upload()
+        if upload is None:
+            return self._send_json(404, {"detail": "Not found."})
+        self._send_json(200, {"offset": len(upload["data"])})
+
+    def _head(self):
+        uid, name = self._matched_file()
+        content = self.emulator.contents.get(uid) if name else None
+        self.send_response(404 if content is None else 200)
+        self.send_header("Content-Length", str(len(content or b"")))
+        if content is not None:
+            for header, value in self._validators(uid).items():
+                self.send_header(header, value)
+        self.end_headers()
+
+    def _post(self):
+        if self.MULTIPART_UPLOAD_RE.match(self._path):
+            return self._multipart_upload()
+
+        match = self.UPLOAD_RE.match(self._path)
+        if match is None:
+            return self._send_json(404, {"detail": "Not found."})
+
+        upload_id, complete = match.groups()
+        if upload_id is None:
+            return self._start_upload()
+
+        upload = self._matched_upload()
+        if upload is None or not complete:
+            return self._send_json(404, {"detail": "Not found."})
+        if len(upload["data"]) != upload["size"]:
+            return self._send_json(400, {"detail": "Upload is incomplete."})
+
+        with self.emulator._lock:
+            del self.emulator.uploads[upload_id]
+        self._send_json(200, self.emulator.store(upload["name"], bytes(upload["data"])))
+
+    def _put(self):
+        upload = self._matched_upload()
+        body = self._read_body()
+        if upload is None:
+            return self._send_json(404, {"detail": "Not found."})
+
+        with self.emulator._lock:
+            if self.emulator.fail_chunks > 0:
+                self.emulator.fail_chunks -= 1
+                return self._send_json(503, {"detail": "Service unavailable."})
+
+            start = int(re.match(r"bytes (\d+)-", self.headers["Content-Range"])[1])
+            if start != len(upload["data"]):
+                return self._send_json(409, {"offset": len(upload["data"])})
+
+            upload["data"] += body
+            self.emulator.received_bytes += len(body)
+        self._send_json(200, {"offset": len(upload["data"])})
+
+    def _start_upload(self):
+        details = json.loads(self._read_body())
+        upload_id = uuid.uuid4().hex
+        with self.emulator._lock:
+            self.emulator.uploads[upload_id] = {
+                "name": details["name"],
+                "size": details["size"],
+                "data": bytearray(),
+            }
+        self._send_json(201, {"upload_id": upload_id, "offset": 0})
+
+    def _multipart_upload(self):
+        boundary = self.headers["Content-Type"].split("boundary=", 1)[1].encode()
+        body = self._read_body()
+        part = body.split(b"--" + boundary)[1]
+        headers, data = part.split(b"\r\n\r\n", 1)
+        name = re.search(rb'filename="([^"]*)"', headers)[1].decode("utf-8")
+        record = self.emulator.store(name, data[: -len(b"\r\n")])
+
+        self.send_response(303)
+        self.send_header("Location", record["url"]["full"])
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _validators(self, uid):
+        return {
+            "ETag": f'"{self.emulator.etags[uid]}"',
+            "Last-Modified": formatdate(self.emulator.modified[uid], usegmt=True),
+        }
+
+    def _is_not_modified(self, uid):
+        if "If-None-Match" in self.headers:
+            return self.headers["If-None-Match"] == self._validators(uid)["ETag"]
+        try:
+            since = parsedate_to_datetime(self.headers["If-Modified-Since"])
+        except (TypeError, ValueError):
+            return False
+        return int(self.emulator.modified[uid]) <= since.timestamp()
+
+    def _send_content(self, uid):
+        """Sends a file, or the single byte range asked for in a Range header
+
+        Conditional requests matching the `ETag` or `Last-Modified` of the
+        file are answered with 304.
+        """
+        content = self.emulator.contents[uid]
+        validators = self._validators(uid)
+        if self._is_not_modified(uid):
+            self.send_response(304)
+            for header, value in validators.items():
+                self.send_header(header, value)
+            self.send_header("Content-Length", "0")
+            return self.end_headers()
+
+        match = self.RANGE_RE.match(self.headers.get("Range", ""))
+        if match is None or match.groups() == ("", ""):
+            return self._send(200, content, "application/octet-stream", validators)
+
+        start, end = match.groups()
+        if not start:
+            start, end = max(len(content) - int(end), 0), len(content) - 1
+        start = int(start)
+        end = min(int(end), len(content) - 1) if end else len(content) - 1
+        if start >= len(content) or start > end:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(content)}")
+            self.send_header("Content-Length", "0")
+            return self.end_headers()
+
+        self._send(
+            206,
+            content[start : end + 1],
+            "application/octet-stream",
+            {**validators, "Content-Range": f"bytes {start}-{end}/{len(content)}"},
+        )
+
+    def _send_metadata(self, uid):
+        query = parse_qs(urlsplit(self.path).query)
+        if query.get("metadata") != ["extra"]:
+            return self._send_json(404, {"detail": "Not found."})
+
+        record = next(r for r in self.emulator.files.values() if r["uid"] == uid)
+        extra = self.emulator.metadata.get(uid, DEFAULT_METADATA)
+        self._send_json(200, {**record, "extra": extra})
+
+    def _matched_file(self):
+        match = self.FILE_RE.match(self._path)
+        return match.groups() if match else (None, None)
+
+    def _matched_upload(self):
+        match = self.UPLOAD_RE.match(self._path)
+        if match is None or match.group(1) is None:
+            return None
+        return self.emulator.uploads.get(match.group(1))
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding") != "chunked":
+            return self._read(int(self.headers.get("Content-Length", 0)))
+
+        body = bytearray()
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            body += self._read(size)
+            self.rfile.readline()
+            if size == 0:
+                return bytes(body)
+
+    def _read(self, size):
+        if not self.emulator.bandwidth:
+            return self.rfile.read(size)
+
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.rfile.read(min(size - len(data), 64 * 1024))
+            if not chunk:
+                break
+            data += chunk
+            time.sleep(len(chunk) / self.emulator.bandwidth)
+        return bytes(data)
+
+    def _send_json(self, status_code, data):
+        self._send(status_code, json.dumps(data).encode("utf-8"), "application/json")
+
+    def _send(self, status_code, body, content_type, headers=None):
+        self.send_response(status_code)
+        self.send_header("Content-Type", content_type)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        if not self.emulator.bandwidth:
+            return self.wfile.write(body)
+
+        for start in range(0, len(body), 64 * 1024):
+            chunk = body[start : start + 64 * 1024]
+            time.sleep(len(chunk) / self.emulator.bandwidth)
+            self.wfile.write(chunk)
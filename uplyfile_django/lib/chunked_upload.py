@@ -0,0 +1,157 @@
+"""Resumable uploads of large files sent as a series of chunks.
+
+Chunk protocol, relative to the API URL:
+    POST upload/chunked/
+        JSON body `{"name", "size", "etag"}`; answers `{"upload_id", "offset"}`
+    GET upload/chunked/<upload_id>/
+        answers `{"offset"}`, the number of bytes confirmed by the server
+    PUT upload/chunked/<upload_id>/
+        chunk body with a `Content-Range: bytes <start>-<end>/<size>` header,
+        answers `{"offset"}`. A chunk which doesn't start at the confirmed
+        offset is rejected with 409 and the confirmed offset in the body.
+    POST upload/chunked/<upload_id>/complete/
+        answers the uploaded file details, the same as an entry of the
+        project files list
+
+This protocol is an assumption of this library rather than a documented
+Uplyfile endpoint; only the bundled emulator implements it.
+"""
+
+import json
+import os
+import tempfile
+
+from . import transport
+from .retry import RetryPolicy, Retrying
+
+
+class UploadJournal:
+    """Keeps track of unfinished chunked uploads in a local directory.
+
+    Every upload has its own small JSON file, so concurrent uploads don't
+    contend for a single journal and a crash can corrupt at most one entry.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(
+            tempfile.gettempdir(), "uplyfile-journal"
+        )
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def save(self, key, entry):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(key))
+
+    def discard(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+
+class ChunkedUploader:
+    """Uploads a file in chunks, resuming from the last confirmed chunk.
+
+    Every request is retried on its own, sharing the circuit breaker of the
+    client.
+
+    Attributes:
+        chunk_size (int): Number of bytes sent in a single request
+        retrying (Retrying): Retry policy and circuit breaker of the requests
+    """
+
+    def __init__(
+        self, uplyfile, journal, chunk_size=8 * 1024 * 1024, max_retries=5, backoff=0.5
+    ):
+        self.uplyfile = uplyfile
+        self.journal = journal
+        self.chunk_size = chunk_size
+        self.retrying = Retrying(
+            RetryPolicy(max_attempts=max_retries + 1, backoff=backoff),
+            uplyfile.retrying.circuit_breaker,
+        )
+        self._endpoint = f"{uplyfile._api_url}/upload/chunked/"
+
+    def upload(self, name, content, size):
+        """Uploads a file, continuing an interrupted upload of the same content
+
+        Args:
+            name (str): A name for the uploaded file
+            content (File): A seekable file opened in binary mode
+            size (int): Size of the file in bytes
+
+        Returns:
+            dict: Details of the uploaded file
+        """
+        etag = self.uplyfile._md5sum(content)
+        key = f"{etag}-{size}"
+        entry = self.journal.get(key)
+        offset = self._confirmed_offset(entry["upload_id"]) if entry else None
+        if offset is None:
+            entry = self._start(name, size, etag)
+            offset = entry["offset"]
+            self.journal.save(key, entry)
+
+        while offset < size:
+            content.seek(offset)
+            chunk = content.read(self.chunk_size)
+            offset = self._send_chunk(entry["upload_id"], chunk, offset, size)
+            self.journal.save(key, {**entry, "offset": offset})
+
+        response = self._request(
+            "post", f"{self._endpoint}{entry['upload_id']}/complete/"
+        )
+        self.journal.discard(key)
+        return response.json()
+
+    def _start(self, name, size, etag):
+        response = self._request(
+            "post", self._endpoint, json={"name": name, "size": size, "etag": etag}
+        )
+        return response.json()
+
+    def _confirmed_offset(self, upload_id):
+        response = self._request(
+            "get", f"{self._endpoint}{upload_id}/", allowed_statuses=(404,)
+        )
+        if response.status_code == 404:
+            return None
+        return response.json()["offset"]
+
+    def _send_chunk(self, upload_id, chunk, offset, size):
+        end = offset + len(chunk) - 1
+        response = self._request(
+            "put",
+            f"{self._endpoint}{upload_id}/",
+            data=chunk,
+            extra_headers={"Content-Range": f"bytes {offset}-{end}/{size}"},
+            allowed_statuses=(409,),
+        )
+        return response.json()["offset"]
+
+    def _request(self, method, url, extra_headers=None, allowed_statuses=(), **kwargs):
+        response = self.retrying.call(
+            lambda: self.uplyfile._session.request(
+                method,
+                url,
+                headers={**self.uplyfile._gen_headers(), **(extra_headers or {})},
+                timeout=transport.timeout(),
+                **kwargs,
+            )
+        )
+        self.uplyfile._handle_api_errors(response.text, response.status_code)
+        if response.status_code not in allowed_statuses:
+            response.raise_for_status()
+        return response
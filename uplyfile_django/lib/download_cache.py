@@ -0,0 +1,185 @@
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from .file_lock import locked
+
+# Temporary files of writers which died are removed after this long.
+ABANDONED_TMP_AGE = 60 * 60
+
+CachedFile = collections.namedtuple("CachedFile", ["file", "etag", "last_modified"])
+
+
+class DownloadCache:
+    """Downloaded files kept on disk by URL, bounded by their total size.
+
+    Every file is stored next to a small JSON file with its validators
+    (`ETag` and `Last-Modified`), so it can be revalidated with a
+    conditional request. The mtime of a file is its last use and the least
+    recently used files are removed once the cache outgrows `max_bytes`.
+
+    Several processes can share a directory: files are written to temporary
+    files and renamed into place, and eviction holds an exclusive lock. A file
+    that was opened stays readable even if it is evicted meanwhile.
+
+    The total size of the stored files is kept in a small sidecar file updated
+    under the lock, so the directory is only scanned once the total exceeds
+    `max_bytes` (or the sidecar is missing).
+
+    Attributes:
+        directory (str): Directory the files are stored in
+        max_bytes (int): Maximum total size of the stored files
+    """
+
+    def __init__(self, directory, max_bytes=1024**3):
+        """Create a DownloadCache stored in given directory.
+
+        Args:
+            directory (str): Directory the files are stored in, created when
+                missing
+            max_bytes (int): Maximum total size of the stored files
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url):
+        """Returns the `CachedFile` stored for given URL or None
+
+        Its file is open for reading and its use is recorded for eviction.
+        """
+        data_path, meta_path = self._paths(url)
+        try:
+            # Metadata is published after the data, so it is read first.
+            with open(meta_path) as f:
+                meta = json.load(f)
+            fileobj = open(data_path, "rb")
+        except (OSError, ValueError):
+            return None
+
+        try:
+            os.utime(data_path)
+        except OSError:
+            pass
+        return CachedFile(fileobj, meta.get("etag"), meta.get("last_modified"))
+
+    def put(self, url, chunks, etag=None, last_modified=None):
+        """Stores a file downloaded from given URL and returns it opened
+
+        Args:
+            url (str): URL the file was downloaded from
+            chunks (iterable): Content of the file in chunks of bytes
+            etag (str): `ETag` header of the response, if any
+            last_modified (str): `Last-Modified` header of the response, if any
+
+        Returns:
+            file: The stored file, open for reading from the beginning
+        """
+        data_path, meta_path = self._paths(url)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                size = f.tell()
+            fileobj = open(tmp_path, "rb")
+            with self._locked():
+                replaced_size = _file_size(data_path)
+                os.replace(tmp_path, data_path)
+                total = self._add_to_total(size - replaced_size)
+        except BaseException:
+            _unlink(tmp_path)
+            raise
+
+        meta = {"url": url, "etag": etag, "last_modified": last_modified}
+        self._write_atomically(meta_path, json.dumps(meta).encode("utf-8"))
+        if total is None or total > self.max_bytes:
+            self.evict()
+        return fileobj
+
+    def remove(self, url):
+        """Removes the file stored for given URL, if any"""
+        data_path, meta_path = self._paths(url)
+        with self._locked():
+            size = _file_size(data_path)
+            _unlink(meta_path)
+            _unlink(data_path)
+            if size:
+                self._add_to_total(-size)
+
+    def evict(self):
+        """Removes the least recently used files above `max_bytes`
+
+        The whole directory is scanned, which also corrects the running total.
+        """
+        with self._locked():
+            entries = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    if entry.name.endswith(".tmp"):
+                        if time.time() - stat.st_mtime > ABANDONED_TMP_AGE:
+                            _unlink(entry.path)
+                    elif "." not in entry.name:
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                _unlink(path + ".json")
+                _unlink(path)
+                total -= size
+            self._write_atomically(self._total_path, str(total).encode("ascii"))
+
+    @property
+    def _total_path(self):
+        return os.path.join(self.directory, ".total")
+
+    def _locked(self):
+        return locked(os.path.join(self.directory, ".lock"))
+
+    def _add_to_total(self, size):
+        """Adds to the running total, must be called under the lock
+
+        Returns:
+            int: The new total or None when it isn't known yet
+        """
+        try:
+            with open(self._total_path) as f:
+                total = int(f.read()) + size
+        except (OSError, ValueError):
+            return None
+        self._write_atomically(self._total_path, str(total).encode("ascii"))
+        return total
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        data_path = os.path.join(self.directory, key)
+        return data_path, data_path + ".json"
+
+    def _write_atomically(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def _file_size(path):
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,238 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class EtagIndex:
+    """Index of project files by etag, persisted in a SQLite database.
+
+    The database can be shared by all processes on a host, so a new process
+    doesn't need to download the project listing before its first lookup.
+    Lookups go through the primary key B-tree and don't load the listing
+    into memory.
+
+    Attributes:
+        path (str): Path of the database file
+        max_age (float): Number of seconds after which the index is stale
+            and gets refreshed from the project listing
+        refresh_wait (float): Number of seconds a lookup waits for a refresh
+            started by another process
+    """
+
+    def __init__(
+        self,
+        path,
+        max_age=60 * 60,
+        batch_size=1000,
+        lease_timeout=5 * 60,
+        refresh_wait=10,
+    ):
+        """Create an EtagIndex stored in given file.
+
+        Args:
+            path (str): Path of the database file, created when missing
+            max_age (float): Number of seconds after which the index is stale
+            batch_size (int): Number of records written in one transaction
+                during a refresh
+            lease_timeout (float): Number of seconds after which a refresh
+                started by another process is considered abandoned
+            refresh_wait (float): Number of seconds a lookup waits for a
+                refresh started by another process before it is answered
+                from the stale index
+        """
+        self.path = path
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.lease_timeout = lease_timeout
+        self.refresh_wait = refresh_wait
+        self._local = threading.local()
+        self._create_tables()
+
+    @property
+    def _connection(self):
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None
+            )
+            self._local.connection.execute("PRAGMA journal_mode=WAL")
+            self._local.pid = os.getpid()
+
+        return self._local.connection
+
+    def get(self, etag):
+        """Returns details of a file with given etag or None when not indexed"""
+        row = self._connection.execute(
+            "SELECT record FROM files WHERE etag = ?", (etag,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def has_size(self, size):
+        """Returns whether any indexed file has given size in bytes"""
+        row = self._connection.execute(
+            "SELECT 1 FROM files "
+            "WHERE json_extract(record, '$.file_size_bytes') = ? LIMIT 1",
+            (size,),
+        ).fetchone()
+        return row is not None
+
+    def has_url(self, url):
+        """Returns whether any indexed file is served from given URL"""
+        row = self._connection.execute(
+            "SELECT 1 FROM files WHERE json_extract(record, '$.url.full') = ? LIMIT 1",
+            (url,),
+        ).fetchone()
+        return row is not None
+
+    def get_by_url(self, url):
+        """Returns details of a file served from given URL or None"""
+        row = self._connection.execute(
+            "SELECT record FROM files "
+            "WHERE json_extract(record, '$.url.full') = ? LIMIT 1",
+            (url,),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add(self, record):
+        """Adds or replaces details of a single file"""
+        self._connection.execute(
+            "INSERT OR REPLACE INTO files (etag, record, generation) VALUES "
+            "(?, ?, COALESCE((SELECT value FROM meta WHERE key = 'generation'), 0))",
+            (record["etag"], json.dumps(record)),
+        )
+
+    @property
+    def refreshed_at(self):
+        return self._meta("refreshed_at")
+
+    def is_stale(self):
+        refreshed_at = self.refreshed_at
+        return refreshed_at is None or time.time() - refreshed_at > self.max_age
+
+    def refresh(self, project_files, force=False):
+        """Replaces the content of the index with given project files
+
+        Records are written in batches while `project_files` is consumed, so
+        the listing doesn't have to be held in memory. Files missing from the
+        listing are removed at the end. When another process is already
+        refreshing the index, or it has been refreshed in the meantime, the
+        refresh is skipped.
+
+        Args:
+            project_files (iterable): Details of all files from the project
+            force (bool): Refresh even if the index isn't stale
+
+        Returns:
+            bool: True if the index was refreshed, False if it was skipped
+        """
+        generation = self._acquire_refresh_lease(force)
+        if generation is None:
+            return False
+
+        try:
+            batch = []
+            for project_file in project_files:
+                batch.append(
+                    (project_file["etag"], json.dumps(project_file), generation)
+                )
+                if len(batch) >= self.batch_size:
+                    self._write_batch(batch)
+                    batch = []
+            self._write_batch(batch)
+
+            with self._transaction():
+                self._connection.execute(
+                    "DELETE FROM files WHERE generation < ?", (generation,)
+                )
+                self._set_meta("refreshed_at", time.time())
+        finally:
+            with self._transaction():
+                self._set_meta("lease_until", None)
+        return True
+
+    def wait_for_refresh(self, timeout=None, poll_interval=0.1):
+        """Waits until no other process is refreshing the index
+
+        Args:
+            timeout (float): Maximum number of seconds to wait, defaults to
+                `refresh_wait`
+            poll_interval (float): Number of seconds between checks
+
+        Returns:
+            bool: False if a refresh was still in progress after `timeout`
+        """
+        timeout = self.refresh_wait if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            lease_until = self._meta("lease_until")
+            if lease_until is None or lease_until <= time.time():
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+
+    def _acquire_refresh_lease(self, force):
+        with self._transaction():
+            lease_until = self._meta("lease_until")
+            if lease_until is not None and lease_until > time.time():
+                return None
+            if not force and not self.is_stale():
+                return None
+
+            generation = (self._meta("generation") or 0) + 1
+            self._set_meta("generation", generation)
+            self._set_meta("lease_until", time.time() + self.lease_timeout)
+        return generation
+
+    def _write_batch(self, batch):
+        with self._transaction():
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO files (etag, record, generation) "
+                "VALUES (?, ?, ?)",
+                batch,
+            )
+
+    def _meta(self, key):
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def _transaction(self):
+        return _Transaction(self._connection)
+
+    def _create_tables(self):
+        with self._transaction():
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "etag TEXT PRIMARY KEY, record TEXT NOT NULL, generation INTEGER"
+                ")"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS files_size "
+                "ON files (json_extract(record, '$.file_size_bytes'))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS files_url "
+                "ON files (json_extract(record, '$.url.full'))"
+            )
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __enter__(self):
+        self._connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._connection.execute("ROLLBACK" if exc_type else "COMMIT")
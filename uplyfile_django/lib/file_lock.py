@@ -0,0 +1,33 @@
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+@contextlib.contextmanager
+def locked(path, shared=False):
+    """Holds a lock on the file at given path, created when missing
+
+    The lock is advisory and held across processes. Windows has no shared
+    locks, so there a shared lock is an exclusive one.
+
+    Args:
+        path (str): Path of the lock file
+        shared (bool): Whether other shared locks may be held at once
+    """
+    with open(path, "wb") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+            return
+
+        import msvcrt
+
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+import time
+
+from . import hashing
+
+# Files modified this recently may still change within the same mtime tick,
+# so their hashes aren't stored, like git does with "racily clean" entries.
+RACY_WINDOW_NS = 2 * 10**9
+
+
+class HashCache:
+    """Persistent md5 sums of files on disk, keyed by their stat fields.
+
+    A stored hash is only returned while the path, size, mtime and inode of
+    the file are all unchanged, so unchanged files are never read again.
+    File-like objects which aren't regular files on disk are always hashed.
+
+    Attributes:
+        path (str): Path of the database file
+    """
+
+    def __init__(self, path):
+        """Create a HashCache stored in given file.
+
+        Args:
+            path (str): Path of the database file, created when missing
+        """
+        self.path = path
+        self._local = threading.local()
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+            "inode INTEGER, etag TEXT NOT NULL"
+            ")"
+        )
+
+    @property
+    def _connection(self):
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None
+            )
+            self._local.connection.execute("PRAGMA journal_mode=WAL")
+            self._local.pid = os.getpid()
+
+        return self._local.connection
+
+    def md5sum(self, fileobj):
+        """Returns the md5 hex digest of a file, read only when not cached"""
+        entry = self.entry(fileobj)
+        etag = self.get(entry)
+        if etag is None:
+            etag = hashing.md5sum(fileobj)
+            self.set(entry, etag)
+        return etag
+
+    def entry(self, fileobj):
+        """Returns the (path, stat) of a regular file on disk or None"""
+        return hashing.disk_entry(fileobj)
+
+    def get(self, entry):
+        """Returns the stored md5 of a file if none of its stat fields changed"""
+        if entry is None:
+            return None
+        path, stat = entry
+        row = self._connection.execute(
+            "SELECT etag FROM hashes "
+            "WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+            (path, stat.st_size, stat.st_mtime_ns, stat.st_ino),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, entry, etag):
+        """Stores the md5 of a file hashed while it had the stat of `entry`
+
+        Nothing is stored when the file changed since, or it was modified too
+        recently to rule out a change the mtime can't tell apart.
+        """
+        if entry is None:
+            return
+        path, stat = entry
+        try:
+            unchanged = _stat_key(os.stat(path)) == _stat_key(stat)
+        except OSError:
+            return
+        if not unchanged or time.time_ns() - stat.st_mtime_ns < RACY_WINDOW_NS:
+            return
+
+        self._connection.execute(
+            "INSERT OR REPLACE INTO hashes (path, size, mtime_ns, inode, etag) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns, stat.st_ino, etag),
+        )
+
+
+def _stat_key(stat):
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
@@ -0,0 +1,139 @@
+"""md5 etags of file-like objects, computed with as little copying as possible.
+
+Content held in memory (`io.BytesIO`, Django's `ContentFile` and
+`InMemoryUploadedFile`) is hashed straight from its buffer, regular files on
+disk are memory-mapped and anything else is read in large blocks. hashlib
+releases the GIL while hashing big buffers, so `md5_many` hashes files in
+parallel on a thread pool.
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import stat
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def md5sum(fileobj, blocksize=BLOCK_SIZE):
+    """Returns the md5 hex digest of the whole content of a file-like object
+
+    The file is rewound to the beginning afterwards.
+
+    Args:
+        fileobj (File): A binary file-like object, e.g. an open file,
+            `io.BytesIO` or any of Django's `File` classes
+        blocksize (int): Number of bytes read at a time when the file can be
+            neither mapped nor accessed as a buffer
+
+    Returns:
+        str: The md5 hex digest
+    """
+    if "b" not in getattr(fileobj, "mode", "b"):
+        raise ValueError("Open file in binary mode in order to use this operation")
+
+    raw = unwrap_file(fileobj)
+    if isinstance(raw, io.BytesIO):
+        with raw.getbuffer() as buffer:
+            digest = hashlib.md5(buffer).hexdigest()
+    else:
+        fileno = regular_file_fileno(raw)
+        if fileno is None:
+            return _md5_read(fileobj, blocksize)
+        digest = _md5_mapped(raw, fileno)
+
+    fileobj.seek(0)
+    return digest
+
+
+def md5_path(path):
+    """Returns the md5 hex digest of a file at given path"""
+    with open(path, "rb") as f:
+        return md5sum(f)
+
+
+def md5_many(fileobjs, max_workers=4, return_exceptions=False):
+    """Hashes many file-like objects in parallel
+
+    Args:
+        fileobjs (iterable): File-like objects accepted by `md5sum`
+        max_workers (int): Number of hashing threads
+        return_exceptions (bool): Return the exception raised while hashing
+            an object in its place instead of raising it
+
+    Returns:
+        list: md5 hex digests in the order of `fileobjs`
+    """
+
+    def hash_one(fileobj):
+        try:
+            return md5sum(fileobj)
+        except Exception as e:
+            if return_exceptions:
+                return e
+            raise
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(hash_one, fileobjs))
+
+
+def unwrap_file(fileobj):
+    """Returns the actual file object wrapped by Django's `File` classes"""
+    while True:
+        if isinstance(fileobj, tempfile.SpooledTemporaryFile):
+            # Its fileno() would move the content from memory to disk.
+            fileobj = fileobj._file
+        elif hasattr(fileobj, "file") and not isinstance(fileobj, io.IOBase):
+            fileobj = fileobj.file
+        else:
+            return fileobj
+
+
+def disk_entry(fileobj):
+    """Returns the (real path, stat) of a regular file on disk or None
+
+    None is also returned when the file at the path of `fileobj` was replaced
+    since it was opened.
+    """
+    raw = unwrap_file(fileobj)
+    name = getattr(raw, "name", None)
+    fileno = regular_file_fileno(raw)
+    if not isinstance(name, str) or fileno is None:
+        return None
+
+    stat = os.fstat(fileno)
+    try:
+        same_file = os.path.samestat(stat, os.stat(name))
+    except OSError:
+        return None
+    return (os.path.realpath(name), stat) if same_file else None
+
+
+def regular_file_fileno(fileobj):
+    """Returns the file descriptor of a regular file on disk or None"""
+    try:
+        fileno = fileobj.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+    return fileno if stat.S_ISREG(os.fstat(fileno).st_mode) else None
+
+
+def _md5_mapped(fileobj, fileno):
+    if fileobj.writable():
+        fileobj.flush()
+    if os.fstat(fileno).st_size == 0:
+        return hashlib.md5().hexdigest()
+    with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped:
+        return hashlib.md5(mapped).hexdigest()
+
+
+def _md5_read(fileobj, blocksize):
+    _hash = hashlib.md5()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(blocksize), b""):
+        _hash.update(block)
+    fileobj.seek(0)
+    return _hash.hexdigest()
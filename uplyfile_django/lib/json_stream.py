@@ -0,0 +1,98 @@
+import codecs
+import json
+
+
+class JsonArrayParser:
+    """Incrementally parses a JSON array, element by element.
+
+    Bytes are fed in arbitrary pieces and every element is returned as soon as
+    it is complete, so only the not yet parsed tail of the document is kept in
+    memory.
+    """
+
+    WHITESPACE = " \t\n\r"
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._started = False
+        self._finished = False
+        self._expect_separator = False
+        self._empty = True
+
+    def feed(self, data):
+        """Parses the next piece of the document
+
+        Args:
+            data (bytes): The next piece of the document
+
+        Returns:
+            list: Elements completed by this piece
+        """
+        self._buffer += self._text_decoder.decode(data)
+        return self._parse(final=False)
+
+    def close(self):
+        """Parses what is left of the document
+
+        Returns:
+            list: Elements completed by the end of the document
+
+        Raises:
+            ValueError: when the document isn't a complete JSON array
+        """
+        self._buffer += self._text_decoder.decode(b"", final=True)
+        elements = self._parse(final=True)
+        if not self._finished or self._buffer.strip(self.WHITESPACE):
+            raise ValueError("Incomplete or malformed JSON array")
+        return elements
+
+    def _parse(self, final):
+        elements = []
+        pos = 0
+        buffer = self._buffer
+        while not self._finished:
+            while pos < len(buffer) and buffer[pos] in self.WHITESPACE:
+                pos += 1
+            if pos == len(buffer):
+                break
+
+            if not self._started:
+                if buffer[pos] != "[":
+                    raise ValueError("JSON document isn't an array")
+                self._started = True
+                pos += 1
+            elif buffer[pos] == "]" and (self._expect_separator or self._empty):
+                self._finished = True
+                pos += 1
+            elif self._expect_separator:
+                if buffer[pos] != ",":
+                    raise ValueError(f"Expected ',' at position {pos}")
+                self._expect_separator = False
+                pos += 1
+            else:
+                try:
+                    element, end = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise ValueError("Incomplete or malformed JSON array")
+                    break
+                # A number at the very end of the buffer may still be continued.
+                if end == len(buffer) and not final:
+                    break
+                elements.append(element)
+                self._expect_separator = True
+                self._empty = False
+                pos = end
+
+        self._buffer = buffer[pos:]
+        return elements
+
+
+def iter_json_array(chunks):
+    """Yields elements of a JSON array read from an iterable of byte chunks"""
+    parser = JsonArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
@@ -0,0 +1,277 @@
+"""In-process metrics of all Uplyfile I/O.
+
+Metrics are collected in `registry`, which is disabled by default. While it
+is disabled the instrumented calls cost a single attribute lookup. Collected
+metrics are exported by pluggable exporters, e.g.:
+
+    from uplyfile_django.lib import metrics
+
+    metrics.registry.enabled = True
+    metrics.registry.add_exporter(metrics.LoggingExporter())
+    ...
+    metrics.registry.export()
+"""
+
+import bisect
+import functools
+import logging
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Counter:
+    """A value which only goes up, kept separately for every set of labels"""
+
+    type = "counter"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        """Returns a list of (name suffix, labels, value) tuples"""
+        with self._lock:
+            return [("", dict(key), value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Counts observed values in buckets, kept separately for every set of labels"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            bucket_counts, _, _ = values = self._values[key]
+            bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            values[1] += value
+            values[2] += 1
+
+    def count(self, **labels):
+        values = self._values.get(tuple(sorted(labels.items())))
+        return values[2] if values else 0
+
+    def samples(self):
+        """Returns a list of (name suffix, labels, value) tuples"""
+        samples = []
+        with self._lock:
+            for key, (bucket_counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), bucket_counts):
+                    cumulative += bucket_count
+                    labels = {**dict(key), "le": str(bound)}
+                    samples.append(("_bucket", labels, cumulative))
+                samples.append(("_sum", dict(key), total))
+                samples.append(("_count", dict(key), count))
+        return samples
+
+
+class Registry:
+    """Keeps metrics by name and hands them to the exporters.
+
+    Attributes:
+        enabled (bool): Whether instrumented calls record anything
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._metrics = {}
+        self._exporters = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation):
+        """Returns the counter of given name, created on first use"""
+        return self._get_or_create(Counter, name, documentation)
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        """Returns the histogram of given name, created on first use"""
+        return self._get_or_create(Histogram, name, documentation, buckets)
+
+    def collect(self):
+        """Returns all registered metrics sorted by name"""
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def clear(self):
+        """Removes all registered metrics"""
+        with self._lock:
+            self._metrics = {}
+
+    def add_exporter(self, exporter):
+        """Adds an object with an `export(registry)` method"""
+        self._exporters.append(exporter)
+
+    def export(self):
+        """Passes the registry to all exporters"""
+        for exporter in self._exporters:
+            exporter.export(self)
+
+    def _get_or_create(self, metric_class, name, *args):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = metric_class(name, *args)
+            return self._metrics[name]
+
+
+registry = Registry()
+
+
+class PrometheusExporter:
+    """Renders metrics in the Prometheus text exposition format.
+
+    When `path` is given, `export` writes the metrics to that file atomically,
+    so it can be read by the node exporter's textfile collector.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def render(self, registry):
+        lines = []
+        for metric in registry.collect():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, registry):
+        if self.path is None:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.render(registry))
+        os.replace(tmp_path, self.path)
+
+
+class LoggingExporter:
+    """Logs every sample of every metric as a single line"""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("uplyfile_django.metrics")
+        self.level = level
+
+    def export(self, registry):
+        for metric in registry.collect():
+            for suffix, labels, value in metric.samples():
+                self.logger.log(
+                    self.level,
+                    "%s%s%s %s",
+                    metric.name,
+                    suffix,
+                    _format_labels(labels),
+                    value,
+                )
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in sorted(labels.items())
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def timed(operation):
+    """Decorates a function to record its latency and failures
+
+    Args:
+        operation (str): Value of the `operation` label
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return fn(*args, **kwargs)
+
+            started_at = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                registry.counter(
+                    "uplyfile_errors_total", "Failed Uplyfile operations"
+                ).inc(operation=operation)
+                raise
+            finally:
+                observe_duration(operation, time.perf_counter() - started_at)
+
+        return wrapper
+
+    return decorator
+
+
+def observe_duration(operation, seconds):
+    if registry.enabled:
+        registry.histogram(
+            "uplyfile_operation_duration_seconds", "Latency of Uplyfile operations"
+        ).observe(seconds, operation=operation)
+
+
+def count_response(operation, status_code):
+    if registry.enabled:
+        registry.counter(
+            "uplyfile_responses_total", "Uplyfile responses by status code"
+        ).inc(operation=operation, status=status_code)
+
+
+def count_bytes_sent(operation, amount):
+    if registry.enabled and amount is not None:
+        registry.counter("uplyfile_sent_bytes_total", "Bytes sent to Uplyfile").inc(
+            amount, operation=operation
+        )
+
+
+def count_bytes_received(operation, amount):
+    if registry.enabled and amount is not None:
+        registry.counter(
+            "uplyfile_received_bytes_total", "Bytes received from Uplyfile"
+        ).inc(amount, operation=operation)
+
+
+def count_cache_lookup(hit):
+    if registry.enabled:
+        registry.counter(
+            "uplyfile_cache_lookups_total", "Etag lookups answered by the cache"
+        ).inc(result="hit" if hit else "miss")
+
+
+def counted_received(operation, chunks):
+    """Returns `chunks`, counting their bytes as received when enabled"""
+    if not registry.enabled:
+        return chunks
+    return _counted_received(operation, chunks)
+
+
+def _counted_received(operation, chunks):
+    for chunk in chunks:
+        count_bytes_received(operation, len(chunk))
+        yield chunk
@@ -0,0 +1,139 @@
+import hashlib
+import io
+import uuid
+
+_HTML5_REPLACEMENTS = {
+    **{code: f"%{code:02X}" for code in range(0x20) if code != 0x1B},
+    ord('"'): "%22",
+}
+
+
+class MultipartEncoder:
+    """Streams a multipart/form-data body holding a single file field.
+
+    The body is produced lazily in `chunk_size` pieces, so the whole file is
+    never held in memory, whatever its size. Any binary file-like object can be
+    used as a source: plain files, `io.BytesIO` and Django's `File`,
+    `ContentFile` and `UploadedFile` family.
+
+    Attributes:
+        boundary (str): The multipart boundary
+        length (int): Size of the encoded body in bytes or None when the size
+            of the source couldn't be determined up front
+        etag (str): md5 sum of the file computed while it was streamed,
+            None until the whole file has been read
+        size (int): Number of bytes read from the file, None until the whole
+            file has been read
+        rewindable (bool): Whether the body can be produced again, for
+            instance to retry a failed request
+    """
+
+    def __init__(
+        self, field_name, filename, fileobj, content_type=None, chunk_size=64 * 1024
+    ):
+        """Create an encoder for given file.
+
+        Args:
+            field_name (str): Name of the form field
+            filename (str): File name sent in the `Content-Disposition` header
+            fileobj (File): A binary file-like object
+            content_type (str): MIME type of the file, omitted when None
+            chunk_size (int): Number of bytes read from the source at a time
+        """
+        self.boundary = uuid.uuid4().hex
+        self.etag = None
+        self.size = None
+        self.chunk_size = chunk_size
+        self._fileobj = fileobj
+        self._preamble = self._part_headers(field_name, filename, content_type)
+        self._epilogue = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self.rewindable = is_seekable(fileobj)
+
+        size = file_size(fileobj)
+        self.length = (
+            None if size is None else len(self._preamble) + size + len(self._epilogue)
+        )
+
+    def __len__(self):
+        if self.length is None:
+            raise TypeError("Size of the encoded body is unknown")
+        return self.length
+
+    def __iter__(self):
+        if self.rewindable:
+            self._fileobj.seek(0)
+        md5 = hashlib.md5()
+        size = 0
+        yield self._preamble
+        for chunk in iter(lambda: self._fileobj.read(self.chunk_size), b""):
+            md5.update(chunk)
+            size += len(chunk)
+            yield chunk
+        self.etag = md5.hexdigest()
+        self.size = size
+        yield self._epilogue
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    @property
+    def body(self):
+        """Request body accepted by `requests`.
+
+        The encoder itself is used when its length is known, which makes
+        `requests` send a `Content-Length` header. Otherwise a plain iterator
+        is returned and the body goes out with chunked transfer encoding.
+        """
+        return self if self.length is not None else iter(self)
+
+    def _part_headers(self, field_name, filename, content_type):
+        headers = (
+            f"--{self.boundary}\r\n"
+            f"Content-Disposition: form-data; "
+            f'name="{self._quote(field_name)}"; filename="{self._quote(filename)}"\r\n'
+        )
+        if content_type is not None:
+            headers += f"Content-Type: {content_type}\r\n"
+        return f"{headers}\r\n".encode("utf-8")
+
+    def _quote(self, value):
+        # As the HTML5 form encoding of urllib3: control characters are
+        # percent-encoded, so a name can't inject part headers.
+        return value.replace("\\", "\\\\").translate(_HTML5_REPLACEMENTS)
+
+
+def file_size(fileobj):
+    """Returns the size of a file-like object, rewinding it to the beginning
+
+    Args:
+        fileobj (File): A file-like object
+
+    Returns:
+        int: Size of the file in bytes
+        None: when the size couldn't be determined
+    """
+    if is_seekable(fileobj):
+        fileobj.seek(0, io.SEEK_END)
+        size = fileobj.tell()
+        fileobj.seek(0)
+        return size
+
+    return getattr(fileobj, "size", None)
+
+
+def is_seekable(fileobj):
+    """Returns whether a file-like object supports seeking"""
+    try:
+        return fileobj.seekable()
+    except ValueError:
+        return False
+    except AttributeError:
+        pass
+
+    # Objects without `seekable`, e.g. SpooledTemporaryFile before Python 3.11,
+    # are seekable when they can tell their position.
+    try:
+        return callable(fileobj.seek) and fileobj.tell() is not None
+    except (AttributeError, OSError, ValueError):
+        return False
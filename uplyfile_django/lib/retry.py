@@ -0,0 +1,192 @@
+import email.utils
+import random
+import threading
+import time
+
+import requests
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while its circuit breaker is open"""
+
+
+class RetryPolicy:
+    """Decides which failed requests are retried and how long to wait.
+
+    Delays grow exponentially with full jitter, unless the response carries
+    a `Retry-After` header, which is honored up to `max_backoff` seconds.
+
+    Attributes:
+        max_attempts (int): Maximum number of attempts, including the first one
+        backoff (float): Upper bound of the delay before the first retry
+        max_backoff (float): Upper bound of any delay
+        retry_statuses (tuple): Response status codes which are retried
+    """
+
+    def __init__(
+        self,
+        max_attempts=3,
+        backoff=0.5,
+        max_backoff=30,
+        retry_statuses=(408, 429, 500, 502, 503, 504),
+    ):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = retry_statuses
+
+    def delay(self, attempt, response=None):
+        """Returns the number of seconds to wait before retrying given attempt
+
+        Args:
+            attempt (int): Number of the failed attempt, starting from 0
+            response: The failed response, if any
+        """
+        retry_after = self._retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def _retry_after(self, response):
+        value = response.headers.get("Retry-After") if response is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time())
+
+
+class CircuitBreaker:
+    """Stops calling the API for a while after it keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail fast with `CircuitOpenError`. Once `recovery_timeout` seconds pass a
+    single trial call is let through; its success closes the circuit, its
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if (
+                time.monotonic() - self._opened_at < self.recovery_timeout
+                or self._trial_in_progress
+            ):
+                raise CircuitOpenError("Uplyfile API is unavailable, try again later")
+            self._trial_in_progress = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name, **kwargs):
+    """Returns the circuit breaker of given name shared by the whole process
+
+    Args:
+        name (str): Usually the API URL, so all clients of one API share it
+        **kwargs: Arguments of a `CircuitBreaker` created on first use
+    """
+    with _circuit_breakers_lock:
+        if name not in _circuit_breakers:
+            _circuit_breakers[name] = CircuitBreaker(**kwargs)
+        return _circuit_breakers[name]
+
+
+class Retrying:
+    """Calls the API according to a retry policy, guarded by a circuit breaker"""
+
+    NETWORK_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+    def __init__(self, policy, circuit_breaker):
+        self.policy = policy
+        self.circuit_breaker = circuit_breaker
+
+    def call(self, send, before_retry=None):
+        """Sends a request, retrying it on network errors and retryable statuses
+
+        Args:
+            send (callable): Sends the request and returns the response
+            before_retry (callable): Called with the network error (or None)
+                and the failed response (or None) before every retry. It may
+                return a not None value to stop retrying and return that value
+                instead, or raise to stop retrying altogether
+
+        Returns:
+            The last response or the value returned by `before_retry`
+        """
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_call()
+            error, response = None, None
+            try:
+                response = send()
+            except self.NETWORK_ERRORS as e:
+                error = e
+            except BaseException:
+                # Also ends a trial call, so the circuit doesn't stay open.
+                self.circuit_breaker.record_failure()
+                raise
+
+            if error is None and response.status_code < 500:
+                self.circuit_breaker.record_success()
+            else:
+                self.circuit_breaker.record_failure()
+
+            retryable = error is not None or (
+                response.status_code in self.policy.retry_statuses
+            )
+            if not retryable or attempt + 1 >= self.policy.max_attempts:
+                if error is not None:
+                    raise error
+                return response
+
+            if before_retry is not None:
+                result = before_retry(error, response)
+                if result is not None:
+                    return result
+
+            time.sleep(self.policy.delay(attempt, response))
+            attempt += 1
+
+
+def close_failed_response(error, response):
+    """A `before_retry` hook of `Retrying.call` releasing failed responses
+
+    Streamed responses hold their connection until they are closed, so one
+    left open on every retry could exhaust the connection pool.
+    """
+    if response is not None:
+        response.close()
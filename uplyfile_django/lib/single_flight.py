@@ -0,0 +1,54 @@
+import threading
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into a single call.
+
+    The first thread calling `do` with a key runs the function; threads
+    calling it with the same key meanwhile wait for that call and share its
+    result or its exception. Once the call finishes the next one runs again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Runs `fn` unless a call with the same key is already in flight
+
+        Args:
+            key: Identifies calls which can share one result
+            fn (callable): Called without arguments
+
+        Returns:
+            The value returned by `fn` in this or the shared call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
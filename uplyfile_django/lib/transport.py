@@ -0,0 +1,107 @@
+"""Process-wide HTTP transport shared by every Uplyfile client.
+
+All clients use a single `requests.Session`, so keep-alive connections are
+reused across objects instead of every object opening its own pool. The
+session is recreated in a child process after a fork, so prefork servers
+never share sockets between workers.
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_OPTIONS = {
+    "pool_connections": 10,
+    "pool_maxsize": 10,
+    "connect_timeout": 3.05,
+    "read_timeout": 10,
+    "keep_alive": True,
+}
+
+_options = dict(DEFAULT_OPTIONS)
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def configure(**options):
+    """Changes options of the transport
+
+    The current session is dropped only when an option actually changes, so
+    calling it again with the same options is cheap.
+
+    Args:
+        pool_connections (int): Number of hosts kept in the connection pool
+        pool_maxsize (int): Number of connections kept per host
+        connect_timeout (float): Seconds to wait for a connection
+        read_timeout (float): Seconds to wait between bytes of a response
+        keep_alive (bool): Whether connections are reused between requests
+    """
+    unknown = set(options) - set(DEFAULT_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown transport options: {', '.join(sorted(unknown))}")
+
+    global _options
+    new_options = {**_options, **options}
+    if new_options != _options:
+        with _lock:
+            _options = new_options
+            _close_session()
+
+
+def get_session():
+    """Returns the session shared by the current process"""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = _create_session()
+                _session_pid = os.getpid()
+    return _session
+
+
+def timeout():
+    """Returns a (connect, read) timeout tuple accepted by `requests`"""
+    return (_options["connect_timeout"], _options["read_timeout"])
+
+
+def reset():
+    """Closes the shared session, a new one is created on next use"""
+    with _lock:
+        _close_session()
+
+
+def _create_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=_options["pool_connections"],
+        pool_maxsize=_options["pool_maxsize"],
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not _options["keep_alive"]:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def _close_session():
+    global _session, _session_pid
+    if _session is not None and _session_pid == os.getpid():
+        _session.close()
+    _session = None
+    _session_pid = None
+
+
+def _forget_session_after_fork():
+    # Sockets inherited from the parent must not be used nor shut down here,
+    # the parent may still be talking over them.
+    global _lock, _session, _session_pid
+    _lock = threading.Lock()
+    _session = None
+    _session_pid = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_session_after_fork)
@@ -1,14 +1,31 @@
-import os
-import re
+import asyncio
+import collections
 import datetime
 import hashlib
 import mimetypes
-import requests
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 
+from . import hashing, metrics, transport
+from .chunked_upload import ChunkedUploader, UploadJournal
+from .json_stream import JsonArrayParser, iter_json_array
+from .multipart import MultipartEncoder, file_size, is_seekable
+from .retry import RetryPolicy, Retrying, close_failed_response, get_circuit_breaker
+from .single_flight import SingleFlight
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
 
-class Uplyfile:
-    """Provide various methods to interact with Uplyfile's API.
+
+class _UplyfileBase:
+    """Request signing and project listing helpers shared by the API clients.
 
     Attributes:
         expiration_time (int): The time after the signature used in a request expires
@@ -23,6 +40,8 @@ class Uplyfile:
         base_api_url="https://uplycdn.com/api",
         api_v="v1",
         signature_expiration=60 * 60 * 24,
+        absent_ttl=60,
+        listing_max_age=3600,
     ):
         """Create an Uplyfile object with given seckret and public keys.
 
@@ -34,6 +53,11 @@ class Uplyfile:
             api_v (str): An API version
             signature_expiration (int):
                 The time after the signature used in a request expires
+            absent_ttl (float): Number of seconds for which a file missing from
+                the project listing is remembered as absent
+            listing_max_age (float): Number of seconds for which the cached
+                project listing answers cache misses. Once it is older, a miss
+                downloads the listing again
         """
         if signature_expiration < 0:
             raise ValueError("Expiration time can't have negative value")
@@ -45,15 +69,253 @@ class Uplyfile:
         self.expiration_time = signature_expiration
         self.secret_key = secret_key
         self.public_key = public_key
+        self.absent_ttl = absent_ttl
+        self.listing_max_age = listing_max_age
+        self.cache_stats = CacheStats()
         self._cached_project_files_dict = {}
+        self._cached_sizes = set()
+        self._cached_urls = {}
+        self._listing_loaded_at = None
+        self._known_absent = {}
+        self._remembered = {}
+        self._cache_lock = threading.Lock()
+
+    def _gen_headers(self):
+        current_time = datetime.datetime.now(datetime.timezone.utc)
+        exp_date = str(current_time.timestamp() + self.expiration_time)
+        return {
+            "Uply-Public-Key": self.public_key,
+            "Uply-Expires": exp_date,
+            "Uply-Signature": self._gen_signature(exp_date),
+        }
+
+    def _gen_signature(self, exp_date):
+        return hashlib.sha256(
+            f"{self.secret_key}{exp_date}".encode("utf-8")
+        ).hexdigest()
+
+    def _md5sum(self, fp):
+        return hashing.md5sum(fp)
+
+    def _handle_api_errors(self, info, status_code):
+        if status_code == 403:
+            raise AuthException(
+                f"Permission denied, check your API keys\n \
+                Detailed info: {info}"
+            )
+
+    def _group_project_files_by_etag(self, project_files_list):
+        return {e["etag"]: e for e in project_files_list}
+
+    def _cached_record(self, file_hash):
+        return self._cached_project_files_dict.get(file_hash)
+
+    def _may_have_size(self, size):
+        return size in self._cached_sizes
+
+    def url_listed_at(self, url):
+        """Returns when a file with given URL was last seen in the project
+
+        Only the cached project listing is consulted, no request is made.
+
+        Args:
+            url (str): file URL hosted in Uplyfile CDN
+
+        Returns:
+            float: Timestamp of the listing (or upload) the URL was seen in
+            None: when the URL isn't in the cached listing
+        """
+        return self._cached_urls.get(url, (None, None))[0]
+
+    def record_for_url(self, url):
+        """Returns details of the file with given URL from the cached listing
+
+        No request is made.
+
+        Args:
+            url (str): file URL hosted in Uplyfile CDN
+
+        Returns:
+            dict: Details of the file as returned by the project listing
+            None: when the URL isn't in the cached listing
+        """
+        etag = self._cached_urls.get(url, (None, None))[1]
+        return self._cached_record(etag) if etag is not None else None
+
+    def _cached_file_url(self, file_hash):
+        return (self._cached_record(file_hash) or {}).get("url", {}).get("full")
+
+    def _listing_is_fresh(self):
+        return (
+            self._listing_loaded_at is not None
+            and time.time() - self._listing_loaded_at <= self.listing_max_age
+        )
+
+    def _lookup_cached(self, file_hash):
+        """Looks a file up without downloading the project listing
+
+        Returns:
+            tuple: (True, url) when the cache knows the answer, url being None
+                for files known to be absent, (False, None) otherwise
+        """
+        url = self._cached_file_url(file_hash)
+        known_absent = self._known_absent.get(file_hash, 0) > time.time()
+        if url is None and not known_absent and self._listing_is_fresh():
+            # A miss in a warm listing is an answer too.
+            self._remember_absent(file_hash)
+            known_absent = True
+        if url is not None or known_absent:
+            with self._cache_lock:
+                self.cache_stats.hits += 1
+            metrics.count_cache_lookup(hit=True)
+            return True, url
+
+        with self._cache_lock:
+            self.cache_stats.misses += 1
+        metrics.count_cache_lookup(hit=False)
+        return False, None
+
+    def _lookup_refreshed(self, file_hash):
+        url = self._cached_file_url(file_hash)
+        # A refresh which was skipped doesn't prove the file is absent.
+        if url is None and self._listing_is_fresh():
+            self._remember_absent(file_hash)
+        return url
+
+    def _set_listing(self, project_files, started_at=None):
+        """Replaces the cached listing with given project files
+
+        Records remembered since `started_at`, when the listing was requested,
+        may be missing from it, so they are kept. It defaults to now, for
+        `project_files` which are downloaded while they are consumed here.
+        """
+        started_at = time.time() if started_at is None else started_at
+        # The new dict is fully built before it replaces the old one, so
+        # readers see either the old listing or the new one, never a part.
+        project_files_dict = self._group_project_files_by_etag(project_files)
+        sizes = {e.get("file_size_bytes") for e in project_files_dict.values()}
+        loaded_at = time.time()
+        urls = {
+            e["url"]["full"]: (loaded_at, e["etag"])
+            for e in project_files_dict.values()
+            if "full" in e.get("url", {})
+        }
+        with self._cache_lock:
+            self._remembered = {
+                etag: (remembered_at, record)
+                for etag, (remembered_at, record) in self._remembered.items()
+                if remembered_at >= started_at
+            }
+            for remembered_at, record in self._remembered.values():
+                project_files_dict.setdefault(record["etag"], record)
+                sizes.add(record.get("file_size_bytes"))
+                if "full" in record.get("url", {}):
+                    urls[record["url"]["full"]] = (remembered_at, record["etag"])
+            self._cached_project_files_dict = project_files_dict
+            self._cached_sizes = sizes
+            self._cached_urls = urls
+            self._listing_loaded_at = loaded_at
+            self._known_absent = {}
+
+    def _remember(self, record):
+        with self._cache_lock:
+            # Kept until a listing requested after this replaces the cache.
+            self._remembered[record["etag"]] = (time.time(), record)
+            self._cached_project_files_dict[record["etag"]] = record
+            self._cached_sizes.add(record.get("file_size_bytes"))
+            if "full" in record.get("url", {}):
+                url = record["url"]["full"]
+                self._cached_urls[url] = (time.time(), record["etag"])
+            self._known_absent.pop(record["etag"], None)
+
+    def _remember_absent(self, file_hash):
+        now = time.time()
+        with self._cache_lock:
+            if len(self._known_absent) >= 10000:
+                self._known_absent = {
+                    k: expires
+                    for k, expires in self._known_absent.items()
+                    if expires > now
+                }
+            self._known_absent[file_hash] = now + self.absent_ttl
+
+
+class Uplyfile(_UplyfileBase):
+    """Provide various methods to interact with Uplyfile's API.
+
+    An Uplyfile object can be shared between threads. Threads missing the
+    cache at the same time share a single download of the project listing.
+
+    Attributes:
+        expiration_time (int): The time after the signature used in a request expires
+        secret_key (str): An Uplyfile's API secret_key key
+        public_key (str): An Uplyfile's API public key
+        spool_max_size (int): Number of bytes of a non-seekable source kept in
+            memory by `get_or_upload` before it is spooled to disk
+    """
+
+    spool_max_size = 8 * 1024 * 1024
+
+    def __init__(
+        self,
+        *args,
+        chunked_upload_threshold=None,
+        chunk_size=8 * 1024 * 1024,
+        journal_dir=None,
+        etag_index=None,
+        retry_policy=None,
+        circuit_breaker=None,
+        hash_cache=None,
+        **kwargs,
+    ):
+        """Create an Uplyfile object with given seckret and public keys.
+
+        Accepts the same arguments as `_UplyfileBase` and additionally:
+
+        Args:
+            chunked_upload_threshold (int): Files of at least this many bytes
+                are sent in resumable chunks. Disabled when None
+            chunk_size (int): Size of a single chunk in bytes
+            journal_dir (str): Directory keeping the progress of unfinished
+                chunked uploads. Defaults to a directory in the system temp dir
+            etag_index (EtagIndex): A persistent index consulted by
+                `get_file_url` instead of the in-memory listing cache
+            retry_policy (RetryPolicy): Decides which failed API calls are
+                retried. Defaults to `RetryPolicy()`
+            circuit_breaker (CircuitBreaker): Makes API calls fail fast while
+                the API is unhealthy. Defaults to a breaker shared by all
+                clients of the same API URL in the process
+            hash_cache (HashCache): Persistent md5 sums of files on disk, so
+                unchanged files aren't read to compute their etags
+        """
+        super().__init__(*args, **kwargs)
+        self.chunked_upload_threshold = chunked_upload_threshold
+        self.chunk_size = chunk_size
+        self.journal_dir = journal_dir
+        self.etag_index = etag_index
+        self.hash_cache = hash_cache
+        self.retrying = Retrying(
+            retry_policy or RetryPolicy(),
+            circuit_breaker or get_circuit_breaker(self._api_url),
+        )
+        self._refreshes = SingleFlight()
+        self._chunked_uploader_lock = threading.Lock()
 
     @property
     def _session(self):
-        if not hasattr(self, "_session_obj"):
-            self._session_obj = requests.Session()
+        return transport.get_session()
 
-        return self._session_obj
+    @property
+    def _chunked_uploader(self):
+        with self._chunked_uploader_lock:
+            if not hasattr(self, "_chunked_uploader_obj"):
+                self._chunked_uploader_obj = ChunkedUploader(
+                    self, UploadJournal(self.journal_dir), chunk_size=self.chunk_size
+                )
 
+        return self._chunked_uploader_obj
+
+    @metrics.timed("file_exists")
     def file_exists(self, url):
         """Checks if Uplyfile returns 200 HTTP status code for given URL
 
@@ -63,12 +325,23 @@ class Uplyfile:
         Returns:
             boolean: True if file exists, False otherwise
         """
-        response = self._session.head(url)
+        response = self.retrying.call(
+            lambda: self._session.head(url, timeout=transport.timeout())
+        )
+        metrics.count_response("file_exists", response.status_code)
         return response.status_code == 200
 
     def get_file_url(self, content, use_cached=True):
         """Gets an URL of uploaded file from Uplyfile API
 
+        Uploaded files are added to the cache right away and files missing
+        from the project are remembered as absent for `absent_ttl` seconds.
+        A miss downloads the whole listing only once the cached one is older
+        than `listing_max_age` seconds. When the
+        client has an `etag_index`, it is consulted instead of the in-memory
+        cache and only refreshed from the project listing once it gets stale.
+        `cache_stats` counts how many lookups were answered by the cache.
+
         Args:
             content (File): A file opened in 'rb' mode
 
@@ -76,17 +349,156 @@ class Uplyfile:
             str: An URL of a file
             None: when matching file couldn't be found
         """
-        file_hash = self._md5sum(content)
-        if not use_cached or not self._cached_project_files_dict:
-            self._cached_project_files_dict = self._group_project_files_by_etag(
-                self.list_project_files()
-            )
+        return self._find_file_url(self._md5sum(content), use_cached)
 
-        return (
-            self._cached_project_files_dict.get(file_hash, {})
-            .get("url", {})
-            .get("full")
+    def _find_file_url(self, file_hash, use_cached=True):
+        loaded_at = self._listing_loaded_at
+        if use_cached:
+            answered, url = self._lookup_cached(file_hash)
+            if answered:
+                return url
+
+        self._refresh_listing(force=not use_cached, loaded_at=loaded_at)
+        return self._lookup_refreshed(file_hash)
+
+    def refresh_listing_if_stale(self):
+        """Downloads the project listing unless the cached one is fresh
+
+        The cached listing is fresh for `listing_max_age` seconds, or while
+        `etag_index` isn't stale. Threads asking at the same time share one
+        download.
+
+        Returns:
+            boolean: True if the listing is fresh afterwards, False otherwise
+        """
+        loaded_at = self._listing_loaded_at
+        if not self._listing_is_fresh():
+            self._refresh_listing(loaded_at=loaded_at)
+        return self._listing_is_fresh()
+
+    def _refresh_listing(self, force=False, loaded_at=None):
+        """Downloads the project listing once for all threads needing it
+
+        Threads asking while a refresh is in flight wait for it and share it.
+        Unless forced, the refresh is skipped when the listing was reloaded
+        since it was `loaded_at`, e.g. by a refresh which ended just before.
+        When another process is refreshing `etag_index`, its refresh is waited
+        for instead, up to `etag_index.refresh_wait` seconds; if it doesn't
+        finish in time, lookups are answered from the stale index.
+        """
+
+        def refresh():
+            if not force and loaded_at != self._listing_loaded_at:
+                return
+            if self.etag_index is not None:
+                if not self.etag_index.refresh(self.iter_project_files(), force=force):
+                    self.etag_index.wait_for_refresh()
+                    if self.etag_index.is_stale():
+                        return
+                with self._cache_lock:
+                    self._listing_loaded_at = time.time()
+                    self._known_absent = {}
+            else:
+                self._set_listing(self.iter_project_files())
+
+        self._refreshes.do(force, refresh)
+
+    def _cached_record(self, file_hash):
+        if self.etag_index is not None:
+            return self.etag_index.get(file_hash)
+        return super()._cached_record(file_hash)
+
+    def _listing_is_fresh(self):
+        if self.etag_index is not None:
+            return not self.etag_index.is_stale()
+        return super()._listing_is_fresh()
+
+    def _md5sum(self, fp):
+        if self.hash_cache is not None:
+            return self.hash_cache.md5sum(fp)
+        return super()._md5sum(fp)
+
+    def _may_have_size(self, size):
+        if self.etag_index is not None:
+            return self.etag_index.has_size(size)
+        return super()._may_have_size(size)
+
+    def url_listed_at(self, url):
+        listed_at = super().url_listed_at(url)
+        if listed_at is None and self.etag_index is not None:
+            if self.etag_index.has_url(url):
+                return self.etag_index.refreshed_at
+        return listed_at
+
+    def record_for_url(self, url):
+        record = super().record_for_url(url)
+        if record is None and self.etag_index is not None:
+            return self.etag_index.get_by_url(url)
+        return record
+
+    def file_headers(self, url):
+        """Returns headers of a HEAD response for given URL
+
+        Args:
+            url (str): file URL hosted in Uplyfile CDN
+
+        Returns:
+            dict: Headers of the response
+            None: when the file doesn't exist
+        """
+        response = self.retrying.call(
+            lambda: self._session.head(url, timeout=transport.timeout())
+        )
+        metrics.count_response("file_headers", response.status_code)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.headers
+
+    def _remember(self, record):
+        if self.etag_index is not None:
+            self.etag_index.add(record)
+        super()._remember(record)
+
+    def iter_project_files(self, chunk_size=64 * 1024):
+        """Iterate over all files from the project
+
+        The listing is parsed incrementally while it is downloaded, so files
+        are yielded as they arrive and the whole response is never held in
+        memory at once.
+
+        Args:
+            chunk_size (int): Number of bytes read from the response at a time
+
+        Yields:
+            dict: Details of a file
+        """
+        started_at = time.perf_counter()
+        response = self.retrying.call(
+            lambda: self._session.get(
+                self._UPLY_ENDPOINTS["list_project_files"],
+                headers=self._gen_headers(),
+                timeout=transport.timeout(),
+                stream=True,
+            ),
+            before_retry=close_failed_response,
         )
+        metrics.count_response("list_project_files", response.status_code)
+        try:
+            if response.status_code != 200:
+                self._handle_api_errors(response.text, response.status_code)
+                response.raise_for_status()
+
+            yield from iter_json_array(
+                metrics.counted_received(
+                    "list_project_files", response.iter_content(chunk_size)
+                )
+            )
+        finally:
+            response.close()
+            metrics.observe_duration(
+                "list_project_files", time.perf_counter() - started_at
+            )
 
     def list_project_files(self):
         """List all files from the project
@@ -94,76 +506,461 @@ class Uplyfile:
         Returns:
             list: List of files details
         """
-        response = self._session.get(
-            self._UPLY_ENDPOINTS["list_project_files"],
-            headers=self._gen_headers(),
-            timeout=10,
-        )
-        self._handle_api_errors(response.text, response.status_code)
-        response.raise_for_status()
-
-        json_data = response.json()
-        self._cached_project_files_dict = self._group_project_files_by_etag(json_data)
-        return json_data
+        started_at = time.time()
+        project_files = list(self.iter_project_files())
+        self._set_listing(project_files, started_at)
+        return project_files
 
+    @metrics.timed("upload")
     def upload(self, name, content):
         """Uploads a file with given name to the Uplyfile's API
 
+        The multipart body is streamed from `content` in fixed-size chunks,
+        so memory usage doesn't depend on the size of the file. Files of at
+        least `chunked_upload_threshold` bytes are sent in resumable chunks.
+        The uploaded file is added to the etag cache right away. Before an
+        upload whose response was lost or failed is retried, the project
+        listing is checked in case the file went through, so it isn't
+        uploaded twice.
+
         Args:
             name (str): A name for the uploaded file
             content (File): The uploaded file
         Returns:
             A Requests library object with API response data
         """
-        response = self._session.post(
-            self._UPLY_ENDPOINTS["upload"],
-            headers=self._gen_headers(),
-            files={"file": (name, content, mimetypes.guess_type(name)[0])},
-            timeout=10,
+        if self.chunked_upload_threshold is not None:
+            size = file_size(content)
+            if size is not None and size >= self.chunked_upload_threshold:
+                record = self._chunked_uploader.upload(name, content, size)
+                metrics.count_bytes_sent("upload", size)
+                self._remember(record)
+                return record["url"]["full"]
+
+        hash_cache_entry = (
+            self.hash_cache.entry(content) if self.hash_cache is not None else None
+        )
+        encoder = MultipartEncoder("file", name, content, mimetypes.guess_type(name)[0])
+
+        def before_retry(error, response):
+            if not encoder.rewindable:
+                if error is not None:
+                    raise error
+                return response
+            # The whole body was sent, so the upload may have gone through
+            # even though a network error or a retryable status came back.
+            if encoder.etag is not None:
+                return self._find_file_url(encoder.etag, use_cached=False)
+
+        response = self.retrying.call(
+            lambda: self._session.post(
+                self._UPLY_ENDPOINTS["upload"],
+                headers={**self._gen_headers(), "Content-Type": encoder.content_type},
+                data=encoder.body,
+                timeout=transport.timeout(),
+            ),
+            before_retry=before_retry,
         )
+        if isinstance(response, str):
+            # The previous attempt went through, only its response was lost.
+            return response
+
+        metrics.count_response("upload", response.status_code)
+        metrics.count_bytes_sent("upload", encoder.length)
         self._handle_api_errors(response.text, response.status_code)
         response.raise_for_status()
+        if encoder.etag is not None:
+            if self.hash_cache is not None:
+                self.hash_cache.set(hash_cache_entry, encoder.etag)
+            self._remember(
+                {
+                    "etag": encoder.etag,
+                    "original_name": name,
+                    "file_size_bytes": encoder.size,
+                    "url": {"full": response.url},
+                }
+            )
         return response.url
 
-    def _gen_headers(self):
-        current_time = datetime.datetime.now(datetime.timezone.utc)
-        exp_date = str(current_time.timestamp() + self.expiration_time)
-        return {
-            "Uply-Public-Key": self.public_key,
-            "Uply-Expires": exp_date,
-            "Uply-Signature": self._gen_signature(exp_date),
-        }
+    def get_or_upload(self, name, content):
+        """Returns the URL of content already in the project or uploads it
 
-    def _gen_signature(self, exp_date):
-        return hashlib.sha256(
-            f"{self.secret_key}{exp_date}".encode("utf-8")
-        ).hexdigest()
+        Unlike `get_file_url` followed by `upload`, the content is usually
+        read once. When no file in the project has the same size, it can't be
+        known yet, so it is uploaded right away and its etag is computed while
+        it is streamed. Only content matching the size of a known file is
+        hashed up front, and not even that when `hash_cache` knows the file
+        is unchanged since it was hashed last time. Non-seekable sources are
+        spooled once, hashed on the way, and uploaded from the spool when
+        needed.
+
+        Args:
+            name (str): A name for the file if it gets uploaded
+            content (File): A file opened in 'rb' mode
+
+        Returns:
+            str: An URL of the file
+        """
+        if not is_seekable(content):
+            spooled, file_hash = self._spool(content)
+            with spooled:
+                return self._find_file_url(file_hash) or self.upload(name, spooled)
+
+        if self.hash_cache is not None:
+            file_hash = self.hash_cache.get(self.hash_cache.entry(content))
+            if file_hash is not None:
+                return self._find_file_url(file_hash) or self.upload(name, content)
+
+        size = file_size(content)
+        loaded_at = self._listing_loaded_at
+        if not self._may_have_size(size) and not self._listing_is_fresh():
+            self._refresh_listing(loaded_at=loaded_at)
+        if not self._may_have_size(size):
+            return self.upload(name, content)
+
+        return self._find_file_url(self._md5sum(content)) or self.upload(name, content)
 
-    def _md5sum(self, fp, blocksize=65536):
-        if "b" not in fp.mode:
-            raise ValueError("Open file in binary mode in order to use this operation")
+    def _spool(self, content, blocksize=65536):
+        spooled = tempfile.SpooledTemporaryFile(max_size=self.spool_max_size)
         _hash = hashlib.md5()
-        fp.seek(0)
-        for block in iter(lambda: fp.read(blocksize), b""):
+        for block in iter(lambda: content.read(blocksize), b""):
             _hash.update(block)
-        fp.seek(0)
-        return _hash.hexdigest()
+            spooled.write(block)
+        spooled.seek(0)
+        return spooled, _hash.hexdigest()
 
-    def _handle_api_errors(self, info, status_code):
-        if status_code == 403:
-            raise AuthException(
-                f"Permission denied, check your API keys\n \
-                Detailed info: {info}"
+    def upload_many(self, items, max_workers=8):
+        """Uploads many files concurrently on a bounded pool of worker threads
+
+        Content that is already known to the project (by its md5 etag) isn't
+        uploaded again and files with identical content inside the batch are
+        uploaded only once. A failure of one file doesn't abort the others.
+
+        Args:
+            items (iterable): Pairs of (name, content) as accepted by `upload`
+            max_workers (int): Maximum number of concurrent uploads
+
+        Returns:
+            list: An `UploadResult` for every item, in the order of `items`
+        """
+        items = list(items)
+        hashes = hashing.md5_many(
+            [content for _, content in items],
+            max_workers=max_workers,
+            return_exceptions=True,
+        )
+
+        known_urls = {}
+        to_upload = {}
+        for (name, content), file_hash in zip(items, hashes):
+            if isinstance(file_hash, Exception) or file_hash in known_urls:
+                continue
+            known_urls[file_hash] = self._find_file_url(file_hash)
+            if known_urls[file_hash] is None:
+                to_upload.setdefault(file_hash, (name, content))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                file_hash: executor.submit(self.upload, name, content)
+                for file_hash, (name, content) in to_upload.items()
+            }
+
+        results = []
+        for (name, _), file_hash in zip(items, hashes):
+            if isinstance(file_hash, Exception):
+                results.append(UploadResult(name, None, file_hash))
+            elif file_hash in futures:
+                error = futures[file_hash].exception()
+                url = None if error else futures[file_hash].result()
+                results.append(UploadResult(name, url, error))
+            else:
+                results.append(UploadResult(name, known_urls[file_hash], None))
+        return results
+
+
+class AsyncUplyfile(_UplyfileBase):
+    """Asyncio counterpart of `Uplyfile`.
+
+    Every API call is a coroutine running on a single pooled `httpx.AsyncClient`,
+    so many uploads and lookups can be in flight from one event loop. Close the
+    client with `aclose()` or use the object as an async context manager.
+
+    Attributes:
+        expiration_time (int): The time after the signature used in a request expires
+        secret_key (str): An Uplyfile's API secret_key key
+        public_key (str): An Uplyfile's API public key
+    """
+
+    def __init__(
+        self,
+        *args,
+        max_connections=100,
+        max_keepalive_connections=20,
+        retry_policy=None,
+        **kwargs,
+    ):
+        """Create an AsyncUplyfile object.
+
+        Accepts the same arguments as `_UplyfileBase` and additionally:
+
+        Args:
+            max_connections (int): Upper bound of concurrently open connections
+            max_keepalive_connections (int): Number of idle connections kept
+                in the pool for reuse
+            retry_policy (RetryPolicy): Decides which failed API calls are
+                retried. Defaults to `RetryPolicy()`
+        """
+        if httpx is None:
+            raise ImportError("AsyncUplyfile requires the 'httpx' package")
+        super().__init__(*args, **kwargs)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self._refresh_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    @property
+    def _client(self):
+        if not hasattr(self, "_client_obj"):
+            self._client_obj = httpx.AsyncClient(limits=self._limits)
+
+        return self._client_obj
+
+    async def aclose(self):
+        """Closes the underlying connection pool"""
+        if hasattr(self, "_client_obj"):
+            await self._client_obj.aclose()
+            del self._client_obj
+
+    async def file_exists(self, url):
+        """Checks if Uplyfile returns 200 HTTP status code for given URL
+
+        Args:
+            url (str): file URL hosted in Uplyfile CDN
+
+        Returns:
+            boolean: True if file exists, False otherwise
+        """
+        response = await self._client.head(url, timeout=self._timeout())
+        return response.status_code == 200
+
+    async def get_file_url(self, content, use_cached=True):
+        """Gets an URL of uploaded file from Uplyfile API
+
+        The md5 sum is computed in the default executor so hashing a large
+        file doesn't stall the event loop. Concurrent calls on a cold cache
+        share a single listing request.
+
+        Args:
+            content (File): A file opened in 'rb' mode
+
+        Returns:
+            str: An URL of a file
+            None: when matching file couldn't be found
+        """
+        loop = asyncio.get_running_loop()
+        file_hash = await loop.run_in_executor(None, self._md5sum, content)
+        return await self._find_file_url(file_hash, use_cached)
+
+    async def _find_file_url(self, file_hash, use_cached=True):
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+
+        if use_cached:
+            answered, url = self._lookup_cached(file_hash)
+            if answered:
+                return url
+
+        loaded_at = self._listing_loaded_at
+        async with self._refresh_lock:
+            if self._listing_loaded_at == loaded_at:
+                started_at = time.time()
+                project_files = [e async for e in self.iter_project_files()]
+                self._set_listing(project_files, started_at)
+
+        return self._lookup_refreshed(file_hash)
+
+    async def iter_project_files(self):
+        """Iterate over all files from the project
+
+        The listing is parsed incrementally while it is downloaded.
+
+        Yields:
+            dict: Details of a file
+        """
+        async with self._client.stream(
+            "GET",
+            self._UPLY_ENDPOINTS["list_project_files"],
+            headers=self._gen_headers(),
+            timeout=self._timeout(),
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                self._handle_api_errors(response.text, response.status_code)
+                response.raise_for_status()
+
+            parser = JsonArrayParser()
+            async for chunk in response.aiter_bytes():
+                for project_file in parser.feed(chunk):
+                    yield project_file
+            for project_file in parser.close():
+                yield project_file
+
+    async def list_project_files(self):
+        """List all files from the project
+
+        Returns:
+            list: List of files details
+        """
+        started_at = time.time()
+        project_files = [e async for e in self.iter_project_files()]
+        self._set_listing(project_files, started_at)
+        return project_files
+
+    async def upload(self, name, content):
+        """Uploads a file with given name to the Uplyfile's API
+
+        The multipart body is streamed from `content`, which is read in the
+        default executor so the event loop isn't blocked by disk reads. The
+        uploaded file is added to the etag cache right away. Failed uploads
+        are retried like those of `Uplyfile`, checking the project listing
+        first in case the file went through.
+
+        Args:
+            name (str): A name for the uploaded file
+            content (File): The uploaded file
+        Returns:
+            str: URL of the API response
+        """
+        encoder = MultipartEncoder("file", name, content, mimetypes.guess_type(name)[0])
+        headers = {**self._gen_headers(), "Content-Type": encoder.content_type}
+        if encoder.length is not None:
+            headers["Content-Length"] = str(encoder.length)
+
+        async def before_retry(error, response):
+            if not encoder.rewindable:
+                if error is not None:
+                    raise error
+                return response
+            if encoder.etag is not None:
+                return await self._find_file_url(encoder.etag, use_cached=False)
+
+        response = await self._call(
+            lambda: self._client.post(
+                self._UPLY_ENDPOINTS["upload"],
+                headers=headers,
+                content=_aiter_in_executor(encoder),
+                timeout=self._timeout(),
+                follow_redirects=True,
+            ),
+            before_retry=before_retry,
+        )
+        if isinstance(response, str):
+            # The previous attempt went through, only its response was lost.
+            return response
+
+        self._handle_api_errors(response.text, response.status_code)
+        response.raise_for_status()
+        url = str(response.url)
+        if encoder.etag is not None:
+            self._remember(
+                {
+                    "etag": encoder.etag,
+                    "original_name": name,
+                    "file_size_bytes": encoder.size,
+                    "url": {"full": url},
+                }
             )
+        return url
 
-    def _group_project_files_by_etag(self, project_files_list):
-        return {e["etag"]: e for e in project_files_list}
+    async def _call(self, send, before_retry=None):
+        """Sends a request, retrying it as `Retrying.call` does
+
+        Args:
+            send (callable): Returns an awaitable of the response
+            before_retry (callable): Coroutine function called with the error
+                (or None) and the failed response (or None) before every
+                retry. A not None result is returned instead of retrying
+
+        Returns:
+            The last response or the value returned by `before_retry`
+        """
+        attempt = 0
+        while True:
+            error, response = None, None
+            try:
+                response = await send()
+            except httpx.TransportError as e:
+                error = e
+
+            retryable = error is not None or (
+                response.status_code in self.retry_policy.retry_statuses
+            )
+            if not retryable or attempt + 1 >= self.retry_policy.max_attempts:
+                if error is not None:
+                    raise error
+                return response
+
+            if before_retry is not None:
+                result = await before_retry(error, response)
+                if result is not None:
+                    return result
+
+            await asyncio.sleep(self.retry_policy.delay(attempt, response))
+            attempt += 1
+
+    def _timeout(self):
+        connect, read = transport.timeout()
+        return httpx.Timeout(read, connect=connect)
 
 
 class AuthException(Exception):
     pass
 
 
+async def _aiter_in_executor(iterable):
+    """Yields items of a blocking iterable, each taken in the default executor"""
+    loop = asyncio.get_running_loop()
+    iterator = iter(iterable)
+    sentinel = object()
+    while True:
+        item = await loop.run_in_executor(None, next, iterator, sentinel)
+        if item is sentinel:
+            return
+        yield item
+
+
+UploadResult = collections.namedtuple("UploadResult", ["name", "url", "error"])
+
+
+class CacheStats:
+    """Counts etag lookups answered by the cache and those which weren't.
+
+    Attributes:
+        hits (int): Lookups answered without downloading the project listing
+        misses (int): Lookups which had to download the project listing
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"CacheStats(hits={self.hits}, misses={self.misses})"
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
 class UplyImage:
     """
     The UplyImage class gives the ability to create Uplyfile URLs.
@@ -197,9 +994,7 @@ class UplyImage:
 
     @property
     def _session(self):
-        if not hasattr(self, "_session_obj"):
-            self._session_obj = requests.Session()
-        return self._session_obj
+        return transport.get_session()
 
     def _raise_if_invalid_url(self, path):
         parse = urlparse(path)
@@ -213,8 +1008,13 @@ class UplyImage:
         start, stop = _proper_filepath_regexp.search(parse.path).span()
         self.base_url = f"{parse.scheme}://{parse.netloc}" + parse.path[start:stop]
 
+    @metrics.timed("image_metadata")
     def _json_load_from_url(self, base_url):
-        open_url = self._session.get(f"{base_url}?metadata=extra")
+        open_url = self._session.get(
+            f"{base_url}?metadata=extra", timeout=transport.timeout()
+        )
+        metrics.count_response("image_metadata", open_url.status_code)
+        metrics.count_bytes_received("image_metadata", len(open_url.content))
         return open_url.json()
 
     # FACES
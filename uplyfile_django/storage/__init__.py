@@ -1,13 +1,25 @@
+import datetime
 import pathlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 
-import requests
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.base import File
 from django.core.files.storage import Storage
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.deconstruct import deconstructible
 
 from . import utils
+from ..lib import metrics, transport
+from ..lib.download_cache import DownloadCache
+from ..lib.etag_index import EtagIndex
+from ..lib.hash_cache import HashCache
+from ..lib.retry import RetryPolicy, close_failed_response
 from ..lib.uplyfile import Uplyfile
 from .file_to_url_mapper import FileToUrlMapper
+from .remote_file import RangeFile, StreamedFile
 from .utils import get_setting
 
 
@@ -17,57 +29,309 @@ class UplyfileStorage(Storage):
         self.mappings_file_name = mappings_file or get_setting(
             "MAPPINGS_FILE", lambda: "uplyfile.json"
         )
-        self.mapper = FileToUrlMapper(self.mappings_file_name)
+        self.mapper = FileToUrlMapper(
+            self.mappings_file_name,
+            backend=get_setting("MAPPINGS_BACKEND", lambda: "json"),
+        )
+        self.exists_ttl = get_setting("EXISTS_TTL", lambda: 300)
+        self.exists_listing_threshold = get_setting(
+            "EXISTS_LISTING_THRESHOLD", lambda: 50
+        )
+        self.open_spool_max_size = get_setting(
+            "OPEN_SPOOL_MAX_SIZE", lambda: 8 * 1024 * 1024
+        )
+        self.open_block_size = get_setting("OPEN_BLOCK_SIZE", lambda: 256 * 1024)
+        self.open_cache_blocks = get_setting("OPEN_CACHE_BLOCKS", lambda: 32)
+        self.download_cache = self._download_cache()
+        self._head_metadata = {}
+        self._verified_at = {}
+        transport.configure(**utils.transport_options())
+        if get_setting("METRICS_ENABLED"):
+            metrics.registry.enabled = True
         self.uplyfile = Uplyfile(
             public_key=public_key
             or get_setting("PUBLIC_KEY", fallback=utils.not_found("PUBLIC_KEY")),
             secret_key=secret_key
             or get_setting("SECRET_KEY", fallback=utils.not_found("SECRET_KEY")),
+            base_api_url=get_setting("BASE_API_URL", lambda: "https://uplycdn.com/api"),
             api_v=get_setting("API_VERSION", lambda: "v1"),
+            absent_ttl=get_setting("ABSENT_TTL", lambda: 60),
+            listing_max_age=get_setting("LISTING_MAX_AGE", lambda: 3600),
+            chunked_upload_threshold=get_setting("CHUNKED_UPLOAD_THRESHOLD"),
+            chunk_size=get_setting("CHUNK_SIZE", lambda: 8 * 1024 * 1024),
+            journal_dir=get_setting("UPLOAD_JOURNAL_DIR"),
+            etag_index=self._etag_index(),
+            hash_cache=self._hash_cache(),
+            retry_policy=RetryPolicy(
+                max_attempts=get_setting("MAX_RETRIES", lambda: 2) + 1,
+                backoff=get_setting("RETRY_BACKOFF", lambda: 0.5),
+            ),
+        )
+
+    def _etag_index(self):
+        path = get_setting("ETAG_INDEX_FILE")
+        if path is None:
+            return None
+        return EtagIndex(
+            path,
+            max_age=get_setting("ETAG_INDEX_MAX_AGE", lambda: 3600),
+            refresh_wait=get_setting("ETAG_INDEX_REFRESH_WAIT", lambda: 10),
+        )
+
+    def _hash_cache(self):
+        path = get_setting("HASH_CACHE_FILE")
+        return HashCache(path) if path is not None else None
+
+    def _download_cache(self):
+        directory = get_setting("DOWNLOAD_CACHE_DIR")
+        if directory is None:
+            return None
+        return DownloadCache(
+            directory,
+            max_bytes=get_setting("DOWNLOAD_CACHE_MAX_BYTES", lambda: 1024**3),
         )
 
     @property
     def _session(self):
-        if not hasattr(self, "_session_obj"):
-            self._session_obj = requests.Session()
-
-        return self._session_obj
+        return transport.get_session()
 
     def save_by_path(self, filepath):
         name = pathlib.PurePath(filepath).name
         with open(filepath, "rb") as f:
             return self._save(name, f)
 
+    @metrics.timed("open")
     def _open(self, name, mode="rb"):
         url = self.mapper.get(name)
-        response = self._session.get(url, timeout=10)
-        if response.status_code == 404:
-            raise IOError(f"File {name} isn't uploaded in Uplyfile")
-        response.raise_for_status()
-        file = ContentFile(response.content)
-        file.name = name
+        if self.download_cache is not None:
+            file = self._open_cached(name, url)
+        else:
+            file = self._open_remote(name, url)
         file.mode = mode
         return file
 
-    def _save(self, name, content):
-        url = self.uplyfile.get_file_url(content)
+    def _open_cached(self, name, url):
+        """Opens a file from the download cache, revalidated with the server"""
+        cached = self.download_cache.get(url)
+        headers = {}
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
 
-        if url is None:
-            url = self.uplyfile.upload(name, content)
+        response = self._get(url, stream=True, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            response.close()
+            return File(cached.file, name)
 
+        if cached is not None:
+            cached.file.close()
+            if response.status_code == 404:
+                self.download_cache.remove(url)
+        self._raise_if_missing(name, response)
+        response.raise_for_status()
+        with response:
+            fileobj = self.download_cache.put(
+                url,
+                metrics.counted_received("open", response.iter_content(64 * 1024)),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+        return File(fileobj, name)
+
+    def _open_remote(self, name, url):
+        response = self._get(
+            url, stream=True, headers={"Range": f"bytes=0-{self.open_block_size - 1}"}
+        )
+        self._raise_if_missing(name, response)
+        if response.status_code != 416:
+            response.raise_for_status()
+
+        size = _content_range_size(response)
+        if size is None and response.status_code in (206, 416):
+            response.close()
+            response = self._get(url, stream=True)
+            response.raise_for_status()
+        if size is None:
+            # The server doesn't support ranges, the whole file is streamed.
+            file = StreamedFile(response, name, self.open_spool_max_size)
+        else:
+            first_block = response.content if response.status_code == 206 else b""
+            metrics.count_bytes_received("open", len(first_block))
+            file = RangeFile(
+                lambda start, end: self._get_range(url, start, end),
+                name,
+                size,
+                block_size=self.open_block_size,
+                cache_blocks=self.open_cache_blocks,
+                first_block=first_block,
+            )
+        return file
+
+    def _raise_if_missing(self, name, response):
+        if response.status_code == 404:
+            response.close()
+            raise IOError(f"File {name} isn't uploaded in Uplyfile")
+
+    def _get(self, url, **kwargs):
+        response = self.uplyfile.retrying.call(
+            lambda: self._session.get(url, timeout=transport.timeout(), **kwargs),
+            before_retry=close_failed_response,
+        )
+        metrics.count_response("open", response.status_code)
+        return response
+
+    def _get_range(self, url, start, end):
+        response = self._get(url, headers={"Range": f"bytes={start}-{end}"})
+        response.raise_for_status()
+        data = response.content
+        if response.status_code != 206:
+            data = data[start : end + 1]
+        metrics.count_bytes_received("open", len(response.content))
+        return data
+
+    @metrics.timed("save")
+    def _save(self, name, content):
+        url = self.uplyfile.get_or_upload(name, content)
         self.mapper.save(name, url)
+        self._verified_at[url] = time.time()
         return name
 
+    @metrics.timed("exists")
     def exists(self, name):
         try:
             url = self.mapper.get(name)
         except KeyError:
             return False
 
-        return self.uplyfile.file_exists(url)
+        return self._is_verified(url) or self._verify(url)
+
+    def exists_many(self, names, max_workers=8):
+        """Checks existence of many files with at most one listing download
+
+        The listing is only downloaded when it is stale and at least
+        `exists_listing_threshold` files weren't seen in the last `exists_ttl`.
+
+        Returns:
+            dict: Whether each file exists, by its name
+        """
+        mapped = self.mapper.get_many(names)
+        urls = {name: mapped.get(name) for name in names}
+        stale = {url for url in urls.values() if url and not self._is_verified(url)}
+        if len(stale) >= self.exists_listing_threshold:
+            # Past the threshold, one listing download is cheaper than a HEAD
+            # request per file. A fresh listing is not downloaded again.
+            self.uplyfile.refresh_listing_if_stale()
+            stale = {url for url in stale if not self._is_verified(url)}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            verified = dict(zip(stale, executor.map(self._verify, stale)))
+        return {
+            name: url is not None and verified.get(url, True)
+            for name, url in urls.items()
+        }
+
+    def _is_verified(self, url):
+        """Whether the file was seen in the project in the last `exists_ttl`"""
+        for seen_at in (self._verified_at.get(url), self.uplyfile.url_listed_at(url)):
+            if seen_at is not None and time.time() - seen_at <= self.exists_ttl:
+                return True
+        return False
+
+    def _verify(self, url):
+        exists = self.uplyfile.file_exists(url)
+        if exists:
+            self._verified_at[url] = time.time()
+        return exists
 
     def url(self, name):
         return self.mapper.get(name)
 
+    def listdir(self, path):
+        return self.mapper.listdir(path)
+
+    def size(self, name):
+        return self._metadata(name, "size")
+
+    def get_modified_time(self, name):
+        return self._metadata(name, "modified")
+
+    def get_created_time(self, name):
+        return self._metadata(name, "created")
+
+    def _metadata(self, name, key):
+        """Returns the size, modification or creation time of a file
+
+        They come from the project listing when it knows the URL of the file,
+        otherwise from a HEAD request, done once per URL. When the response
+        lacks `Content-Length` or `Last-Modified`, e.g. because it is
+        compressed, the listing is downloaded again for them. No body is ever
+        downloaded.
+        """
+        url = self.mapper.get(name)
+        record = self.uplyfile.record_for_url(url)
+        if record is not None and "modified" in record:
+            metadata = _record_metadata(record)
+        else:
+            if url not in self._head_metadata:
+                self._head_metadata[url] = self._head(name, url, record)
+            metadata = self._head_metadata[url]
+
+        if metadata[key] is None:
+            raise IOError(f"Uplyfile doesn't tell the {key} of file {name}")
+        return metadata[key]
+
+    def _head(self, name, url, record):
+        headers = self.uplyfile.file_headers(url)
+        if headers is None:
+            raise IOError(f"File {name} isn't uploaded in Uplyfile")
+
+        length = headers.get("Content-Length")
+        if "Content-Encoding" in headers:
+            # The length of the encoded body, not of the file.
+            length = None
+        last_modified = headers.get("Last-Modified")
+        if length is None or last_modified is None:
+            self.uplyfile.refresh_listing_if_stale()
+            record = self.uplyfile.record_for_url(url) or record
+        metadata = _record_metadata(record or {})
+
+        if length is not None:
+            metadata["size"] = int(length)
+        if last_modified is not None:
+            # Files are immutable, so their last modification is their upload.
+            modified = _datetime(parsedate_to_datetime(last_modified))
+            metadata["modified"] = modified
+            metadata["created"] = metadata["created"] or modified
+        return metadata
+
     def get_valid_name(self, name, **kwargs):
         return utils.normalize_name(name)
+
+
+def _record_metadata(record):
+    """Returns the size, modification and creation time in a listing record"""
+    return {
+        "size": record.get("file_size_bytes"),
+        "modified": _parse_record_datetime(record.get("modified")),
+        "created": _parse_record_datetime(record.get("created")),
+    }
+
+
+def _parse_record_datetime(value):
+    return _datetime(parse_datetime(value)) if value is not None else None
+
+
+def _content_range_size(response):
+    """Returns the total size from a Content-Range header, None when unknown"""
+    if response.status_code not in (206, 416):
+        return None
+    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
+def _datetime(value):
+    """Converts an aware datetime the way storages return times for USE_TZ"""
+    if settings.USE_TZ:
+        return value.astimezone(datetime.timezone.utc)
+    return timezone.make_naive(value)
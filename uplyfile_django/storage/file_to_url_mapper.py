@@ -1,45 +1,72 @@
-import json
-import logging
-from json import JSONDecodeError
+from .mapping_backends import BACKENDS
 
 
 class FileToUrlMapper:
-    def __init__(self, mappings_filename, initial_mappings=None):
-        self._logger = logging.getLogger(__name__)
+    def __init__(self, mappings_filename, initial_mappings=None, backend="json"):
         self.mappings_filename = mappings_filename
-        self.mappings = self._decode_mappings(mappings_filename, initial_mappings)
+        if isinstance(backend, str):
+            backend = BACKENDS[backend]
+        self.backend = backend(mappings_filename, initial_mappings)
 
     def __del__(self):
-        self._encode_mappings(self.mappings, self.mappings_filename)
+        backend = getattr(self, "backend", None)
+        if backend is not None:
+            backend.close()
+
+    @property
+    def mappings(self):
+        return self.backend.mappings
 
     def save(self, filename, url):
-        self.mappings.update({filename: url})
+        self.backend.set_many({filename: url})
+
+    def save_many(self, mappings):
+        self.backend.set_many(mappings)
+
+    def remove(self, filename):
+        return self.backend.remove(filename)
+
+    def names(self, prefix=""):
+        """Yields mapped names starting with `prefix` in sorted order
+
+        Names are kept sorted, so only the matching ones are visited.
+        """
+        return self.backend.names(prefix)
+
+    def listdir(self, path):
+        """Returns names of the directories and files directly in `path`
+
+        A directory is skipped as a whole once found, by searching for the
+        first name after all of its contents.
+        """
+        prefix = f"{path.strip('/')}/" if path.strip("/") else ""
+        directories, files = [], []
+        name = self.backend.next_name(prefix)
+        while name is not None and name.startswith(prefix):
+            rest = name[len(prefix) :]
+            directory, separator, _ = rest.partition("/")
+            if separator:
+                directories.append(directory)
+                # "0" is the character right after "/".
+                name = self.backend.next_name(f"{prefix}{directory}0")
+            else:
+                files.append(rest)
+                name = self.backend.next_name(f"{name}\0")
+        return directories, files
+
+    def flush(self):
+        """Writes pending mappings to the storage of the backend"""
+        self.backend.flush()
 
     def get(self, filename):
-        url = self.mappings.get(filename)
+        url = self.backend.get(filename)
         if url is None:
             raise KeyError(f"Filename {filename} not mapped to any URL")
         return url
 
+    def get_many(self, filenames):
+        """Returns URLs of the mapped ones of `filenames` by filename"""
+        return self.backend.get_many(filenames)
+
     def is_mapped(self, filename):
-        return filename in self.mappings
-
-    def _encode_mappings(self, mappings, filename):
-        _mappings = {}
-        try:
-            with open(filename, "w") as f:
-                _mappings = json.dump(mappings, f)
-        except (IOError, JSONDecodeError) as e:
-            self._logger.critical(f"Error occurred while reading mappings file:\n {e}")
-        finally:
-            return _mappings
-
-    def _decode_mappings(self, filename, initial_mappings=None):
-        mappings = initial_mappings if initial_mappings else {}
-        try:
-            with open(filename) as f:
-                mappings = {**mappings, **json.load(f)}
-        except (IOError, JSONDecodeError) as e:
-            self._logger.critical(f"Error occurred while reading mappings file:\n {e}")
-        finally:
-            return mappings
+        return filename in self.backend
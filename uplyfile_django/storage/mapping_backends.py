@@ -0,0 +1,419 @@
+import bisect
+import json
+import logging
+import os
+import sqlite3
+import stat
+import threading
+import uuid
+from json import JSONDecodeError
+
+from ..lib.file_lock import locked
+
+logger = logging.getLogger(__name__)
+
+
+class JsonMappingBackend:
+    """Keeps all mappings in a dict and writes them to a JSON file at once
+
+    Attributes:
+        filename (str): Path of the mappings file
+        mappings (dict): URLs by names
+    """
+
+    def __init__(self, filename, initial_mappings=None):
+        self.filename = filename
+        self.mappings = self._decode(filename, initial_mappings)
+        self._sorted_names = None
+
+    def get(self, name):
+        return self.mappings.get(name)
+
+    def get_many(self, names):
+        return {name: self.mappings[name] for name in names if name in self.mappings}
+
+    def set_many(self, mappings):
+        if self._sorted_names is not None:
+            new_names = mappings.keys() - self.mappings.keys()
+            if len(new_names) > 1:
+                self._sorted_names = None
+            elif new_names:
+                bisect.insort(self._sorted_names, new_names.pop())
+        self.mappings.update(mappings)
+
+    def remove(self, name):
+        url = self.mappings.pop(name, None)
+        if url is not None and self._sorted_names is not None:
+            del self._sorted_names[bisect.bisect_left(self._sorted_names, name)]
+        return url
+
+    def __contains__(self, name):
+        return name in self.mappings
+
+    def names(self, prefix=""):
+        names = self._names_index()
+        index = bisect.bisect_left(names, prefix)
+        while index < len(names) and names[index].startswith(prefix):
+            yield names[index]
+            index += 1
+
+    def next_name(self, start):
+        """Returns the first name not less than `start` or None"""
+        names = self._names_index()
+        index = bisect.bisect_left(names, start)
+        return names[index] if index < len(names) else None
+
+    def flush(self):
+        self._encode(self.mappings, self.filename)
+
+    def close(self):
+        self.flush()
+
+    def _names_index(self):
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self.mappings)
+        return self._sorted_names
+
+    def _encode(self, mappings, filename):
+        try:
+            # Written to a temporary file first, so readers never see a
+            # partially written mappings file.
+            fd, tmp_filename = _temporary_file(filename)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(mappings, f)
+                os.replace(tmp_filename, filename)
+            except BaseException:
+                _unlink(tmp_filename)
+                raise
+        except (IOError, JSONDecodeError) as e:
+            logger.critical(f"Error occurred while reading mappings file:\n {e}")
+
+    def _decode(self, filename, initial_mappings=None):
+        mappings = initial_mappings if initial_mappings else {}
+        try:
+            with open(filename) as f:
+                mappings = {**mappings, **json.load(f)}
+        except (IOError, JSONDecodeError) as e:
+            logger.critical(f"Error occurred while reading mappings file:\n {e}")
+        finally:
+            return mappings
+
+
+class SqliteMappingBackend:
+    """Keeps mappings in a SQLite database in WAL mode
+
+    Every lookup and write is a single-row operation on the primary key, so
+    nothing is loaded at startup and there is nothing to flush. The
+    database can be shared by many processes.
+
+    Attributes:
+        filename (str): Path of the database file
+    """
+
+    def __init__(self, filename, initial_mappings=None):
+        self.filename = filename
+        self._local = threading.local()
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS mappings ("
+            "name TEXT PRIMARY KEY, url TEXT NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        if initial_mappings:
+            self._insert(initial_mappings, "INSERT OR IGNORE")
+
+    @property
+    def _connection(self):
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.connection = sqlite3.connect(
+                self.filename, timeout=30, isolation_level=None
+            )
+            self._local.connection.execute("PRAGMA journal_mode=WAL")
+            self._local.pid = os.getpid()
+
+        return self._local.connection
+
+    @property
+    def mappings(self):
+        """All mappings loaded into a dict, avoid on large databases"""
+        return dict(self._connection.execute("SELECT name, url FROM mappings"))
+
+    def get(self, name):
+        row = self._connection.execute(
+            "SELECT url FROM mappings WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, names, batch_size=500):
+        names = list(names)
+        found = {}
+        for start in range(0, len(names), batch_size):
+            batch = names[start : start + batch_size]
+            found.update(
+                self._connection.execute(
+                    "SELECT name, url FROM mappings WHERE name IN "
+                    f"({', '.join('?' * len(batch))})",
+                    batch,
+                )
+            )
+        return found
+
+    def set_many(self, mappings):
+        self._insert(mappings, "INSERT OR REPLACE")
+
+    def remove(self, name):
+        with self._connection:
+            url = self.get(name)
+            self._connection.execute("DELETE FROM mappings WHERE name = ?", (name,))
+        return url
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def names(self, prefix=""):
+        cursor = self._connection.execute(
+            "SELECT name FROM mappings WHERE name >= ? ORDER BY name", (prefix,)
+        )
+        for (name,) in cursor:
+            if not name.startswith(prefix):
+                break
+            yield name
+
+    def next_name(self, start):
+        """Returns the first name not less than `start` or None"""
+        row = self._connection.execute(
+            "SELECT name FROM mappings WHERE name >= ? ORDER BY name LIMIT 1",
+            (start,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _insert(self, mappings, statement):
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                f"{statement} INTO mappings (name, url) VALUES (?, ?)",
+                mappings.items(),
+            )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+
+class LogMappingBackend(JsonMappingBackend):
+    """Keeps all mappings in a dict and appends every change to a log file
+
+    Each save or removal is one JSON line written at the end of the file, so
+    it costs the same regardless of the number of mappings and survives the
+    process dying without a flush. Startup replays the log; a line torn by a
+    crash is skipped. Once the log holds more dead (overwritten or removed)
+    records than both `compact_threshold` and the number of live ones, it is
+    rewritten in a background thread. Records appended meanwhile, also by
+    other processes, are carried over to the compacted log.
+
+    A mappings file written by `JsonMappingBackend` is read as a log too.
+
+    Attributes:
+        filename (str): Path of the log file
+        mappings (dict): URLs by names
+        compact_threshold (int): Minimum number of dead records to compact
+        fsync (bool): Whether every append is synced to disk
+    """
+
+    def __init__(
+        self, filename, initial_mappings=None, compact_threshold=10000, fsync=False
+    ):
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._compaction = None
+        self._fd = None
+        self._records = 0
+        super().__init__(filename, initial_mappings)
+        self._open()
+
+    def set_many(self, mappings):
+        with self._lock:
+            super().set_many(mappings)
+            self._append([name, url] for name, url in mappings.items())
+
+    def remove(self, name):
+        with self._lock:
+            url = super().remove(name)
+            if url is not None:
+                self._append([[name, None]])
+        return url
+
+    def flush(self):
+        with self._lock:
+            if self._fd is not None:
+                os.fsync(self._fd)
+
+    def close(self):
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def compact(self):
+        """Rewrites the log with only the live records"""
+        try:
+            with open(self.filename, "rb") as f:
+                inode = os.fstat(f.fileno()).st_ino
+                data = f.read()
+            # Only whole lines are compacted, the rest is carried over.
+            end = data.rfind(b"\n") + 1
+            mappings, _ = _replay(data[:end])
+
+            fd, tmp_filename = _temporary_file(self.filename)
+            try:
+                with os.fdopen(fd, "wb") as tmp:
+                    tmp.write(
+                        _encode_records([name, url] for name, url in mappings.items())
+                    )
+                    with locked(self._lock_filename):
+                        with open(self.filename, "rb") as f:
+                            if os.fstat(f.fileno()).st_ino != inode:
+                                # Compacted by another process meanwhile.
+                                _unlink(tmp_filename)
+                                return
+                            f.seek(end)
+                            tail = f.read()
+                        tmp.write(tail)
+                        tmp.flush()
+                        os.fsync(tmp.fileno())
+                        os.replace(tmp_filename, self.filename)
+            except BaseException:
+                _unlink(tmp_filename)
+                raise
+            with self._lock:
+                self._records = len(self.mappings)
+        except OSError as e:
+            logger.critical(f"Error occurred while compacting mappings log:\n {e}")
+        finally:
+            self._compaction = None
+
+    @property
+    def _lock_filename(self):
+        return f"{self.filename}.lock"
+
+    def _open(self):
+        self._fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        size = os.fstat(self._fd).st_size
+        if size:
+            with open(self.filename, "rb") as f:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    # Ends a line torn by a crash, which replay skips.
+                    os.write(self._fd, b"\n")
+
+    def _append(self, records):
+        data = _encode_records(records)
+        with locked(self._lock_filename, shared=True):
+            if os.fstat(self._fd).st_ino != _inode(self.filename):
+                os.close(self._fd)
+                self._open()
+            os.write(self._fd, data)
+        if self.fsync:
+            os.fsync(self._fd)
+
+        self._records += data.count(b"\n")
+        dead = self._records - len(self.mappings)
+        if (
+            dead > max(self.compact_threshold, len(self.mappings))
+            and self._compaction is None
+        ):
+            self._compaction = threading.Thread(target=self.compact, daemon=True)
+            self._compaction.start()
+
+    def _decode(self, filename, initial_mappings=None):
+        mappings = dict(initial_mappings) if initial_mappings else {}
+        try:
+            with open(filename, "rb") as f:
+                replayed, self._records = _replay(f.read())
+            mappings.update(replayed)
+        except FileNotFoundError:
+            pass
+        except IOError as e:
+            logger.critical(f"Error occurred while reading mappings log:\n {e}")
+        return mappings
+
+
+def _encode_records(records):
+    return b"".join(
+        json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+        for record in records
+    )
+
+
+def _replay(data):
+    """Returns mappings in given log data and the number of its records"""
+    mappings = {}
+    records = 0
+    for line in data.splitlines():
+        try:
+            record = json.loads(line)
+            if isinstance(record, dict):
+                # A whole mappings file written by JsonMappingBackend.
+                mappings.update(record)
+                records += len(record)
+                continue
+            name, url = record
+        except (ValueError, TypeError):
+            continue
+        if url is None:
+            mappings.pop(name, None)
+        else:
+            mappings[name] = url
+        records += 1
+    return mappings, records
+
+
+def _temporary_file(filename):
+    """Creates a file next to `filename` to be renamed over it
+
+    Unlike `tempfile.mkstemp`, which creates files only their owner can read,
+    the file gets the mode of `filename`, or the one given by the umask when
+    `filename` doesn't exist yet, so renaming it keeps the mode.
+
+    Returns:
+        tuple: (file descriptor open for writing, path of the file)
+    """
+    tmp_filename = f"{filename}.{uuid.uuid4().hex}.tmp"
+    fd = os.open(tmp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        os.chmod(tmp_filename, stat.S_IMODE(os.stat(filename).st_mode))
+    except FileNotFoundError:
+        pass
+    return fd, tmp_filename
+
+
+def _unlink(filename):
+    try:
+        os.unlink(filename)
+    except FileNotFoundError:
+        pass
+
+
+def _inode(filename):
+    try:
+        return os.stat(filename).st_ino
+    except FileNotFoundError:
+        return None
+
+
+BACKENDS = {
+    "json": JsonMappingBackend,
+    "sqlite": SqliteMappingBackend,
+    "log": LogMappingBackend,
+}
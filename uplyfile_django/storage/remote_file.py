@@ -0,0 +1,255 @@
+import collections
+import os
+import tempfile
+
+from django.core.files.base import File
+
+from ..lib import metrics
+
+
+class StreamedFile(File):
+    """A read-only file downloaded lazily from a streamed HTTP response
+
+    Data is pulled from the response only as far as it is read or sought,
+    so `chunks()` hands it over as it arrives. Everything received is kept
+    in a `SpooledTemporaryFile`, in memory up to `spool_max_size` bytes and
+    on disk beyond, so the file can be sought and read again.
+    """
+
+    def __init__(self, response, name, spool_max_size, chunk_size=64 * 1024):
+        super().__init__(tempfile.SpooledTemporaryFile(max_size=spool_max_size), name)
+        self.mode = "rb"
+        self._response = response
+        self._chunks = metrics.counted_received(
+            "open", response.iter_content(chunk_size)
+        )
+        self._received = 0
+        self._complete = False
+
+    @property
+    def size(self):
+        length = self._response.headers.get("Content-Length")
+        if length is not None and "Content-Encoding" not in self._response.headers:
+            return int(length)
+        self._receive()
+        return self._received
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            self._receive()
+        else:
+            self._receive(self.file.tell() + size)
+        return self.file.read(size)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def readline(self, size=-1):
+        line = self.file.readline(size)
+        while not line.endswith(b"\n") and (size < 0 or len(line) < size):
+            if not self._receive(self._received + 1):
+                break
+            line += self.file.readline(size - len(line) if size >= 0 else -1)
+        return line
+
+    def readlines(self, hint=-1):
+        return list(iter(self.readline, b""))
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_END:
+            self._receive()
+        elif whence == os.SEEK_CUR:
+            self._receive(self.file.tell() + offset)
+        else:
+            self._receive(offset)
+        return self.file.seek(offset, whence)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def close(self):
+        self._response.close()
+        self.file.close()
+
+    def _receive(self, until=None):
+        """Appends received data to the spool until it holds `until` bytes
+
+        Everything is received when `until` is None. The read position of the
+        spool is kept. Returns whether any data was received.
+        """
+        position = self.file.tell()
+        self.file.seek(0, os.SEEK_END)
+        received = False
+        while not self._complete and (until is None or self._received < until):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._complete = True
+                self._response.close()
+            elif chunk:
+                self.file.write(chunk)
+                self._received += len(chunk)
+                received = True
+        self.file.seek(position)
+        return received
+
+
+class RangeFile(File):
+    """A seekable read-only remote file, read with HTTP Range requests
+
+    Only the blocks covering the bytes actually read are downloaded. Up to
+    `cache_blocks` of them are kept in an LRU cache, so repeated and nearby
+    reads don't go back to the network. Sequential reads fetch more and
+    more blocks ahead with every request, up to half of the cache.
+    """
+
+    def __init__(self, fetch, name, size, block_size, cache_blocks, first_block=None):
+        """Create a RangeFile of given size.
+
+        Args:
+            fetch (callable): Returns the bytes from `start` to `end` (both
+                inclusive) of the remote file
+            name (str): Name of the file
+            size (int): Size of the remote file in bytes
+            block_size (int): Number of bytes fetched and cached together
+            cache_blocks (int): Maximum number of cached blocks
+            first_block (bytes): Already downloaded beginning of the file
+        """
+        super().__init__(None, name)
+        self.mode = "rb"
+        self.size = size
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self._fetch = fetch
+        self._closed = False
+        self._position = 0
+        self._blocks = collections.OrderedDict()
+        self._readahead = 1
+        self._next_block = None
+        if first_block:
+            self._cache(0, first_block)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def read(self, size=-1):
+        self._check_not_closed()
+        end = self.size if size is None or size < 0 else self._position + size
+        end = min(end, self.size)
+
+        data = bytearray()
+        while self._position < end:
+            index = self._position // self.block_size
+            if index in self._blocks:
+                self._blocks.move_to_end(index)
+                start, blocks = index * self.block_size, self._blocks[index]
+            else:
+                start, blocks = self._fetch_blocks(index, (end - 1) // self.block_size)
+            chunk = blocks[self._position - start : end - start]
+            if not chunk:
+                break
+            data += chunk
+            self._position += len(chunk)
+        return bytes(data)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def readline(self, size=-1):
+        line = bytearray()
+        while size < 0 or len(line) < size:
+            # Reads up to the end of the current block, which is then cached.
+            wanted = self.block_size - self._position % self.block_size
+            chunk = self.read(wanted if size < 0 else min(wanted, size - len(line)))
+            newline = chunk.find(b"\n")
+            if newline >= 0:
+                self._position -= len(chunk) - newline - 1
+                chunk = chunk[: newline + 1]
+            line += chunk
+            if not chunk or newline >= 0:
+                break
+        return bytes(line)
+
+    def readlines(self, hint=-1):
+        return list(iter(self.readline, b""))
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._check_not_closed()
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def open(self, mode=None):
+        self._closed = False
+        self.seek(0)
+        return self
+
+    def close(self):
+        self._closed = True
+        self._blocks.clear()
+
+    def _check_not_closed(self):
+        if self._closed:
+            raise ValueError("I/O operation on closed file.")
+
+    def _fetch_blocks(self, first, last):
+        """Fetches blocks from `first` with one request and caches them
+
+        Blocks up to `last` are fetched, or more when reading sequentially,
+        stopping before the first cached one.
+
+        Returns:
+            tuple: (offset of the first block, bytes of all fetched blocks)
+        """
+        if first == self._next_block:
+            self._readahead = min(self._readahead * 2, max(self.cache_blocks // 2, 1))
+        else:
+            self._readahead = 1
+
+        last_block = (self.size - 1) // self.block_size
+        last = min(max(last, first + self._readahead - 1), last_block)
+        for index in range(first + 1, last + 1):
+            if index in self._blocks:
+                last = index - 1
+                break
+
+        start = first * self.block_size
+        data = self._fetch(start, min((last + 1) * self.block_size, self.size) - 1)
+        for offset in range(0, len(data), self.block_size):
+            index = first + offset // self.block_size
+            self._cache(index, data[offset : offset + self.block_size])
+        self._next_block = last + 1
+        return start, data
+
+    def _cache(self, index, block):
+        self._blocks[index] = block
+        self._blocks.move_to_end(index)
+        while len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
@@ -0,0 +1,108 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.utils.deconstruct import deconstructible
+
+from . import UplyfileStorage, sync
+from ..lib import hashing
+from .file_to_url_mapper import FileToUrlMapper
+from .utils import get_setting
+
+
+class StaticManifest(FileToUrlMapper):
+    """Maps names of collected static files to their etag, URL and mtime"""
+
+    def url(self, name):
+        return self.get(name)["url"]
+
+
+@deconstructible
+class UplyfileStaticStorage(UplyfileStorage):
+    """UplyfileStorage for `collectstatic`, answering from a local manifest
+
+    `exists` and `get_modified_time` are answered from the manifest without
+    any network call, so `collectstatic` skips files which weren't modified
+    since they were collected. Files whose content didn't change are then
+    recognized by their etag. Changed files on disk are uploaded in one batch
+    by `post_process`, which also writes the manifest and the mappings, so
+    `collectstatic --no-post-process` must not be used with this storage.
+    """
+
+    def __init__(self, manifest_file=None, **kwargs):
+        super().__init__(**kwargs)
+        self.manifest_file_name = manifest_file or get_setting(
+            "STATIC_MANIFEST_FILE", lambda: "uplyfile-static.json"
+        )
+        self.manifest = StaticManifest(self.manifest_file_name)
+        self.upload_workers = get_setting("STATIC_UPLOAD_WORKERS", lambda: 8)
+        self._pending = {}
+        self._deleted = {}
+
+    def exists(self, name):
+        return self.manifest.is_mapped(name) or name in self._pending
+
+    def get_modified_time(self, name):
+        if name in self._pending:
+            mtime = self._pending[name][1]
+        else:
+            mtime = self.manifest.get(name)["mtime"]
+        if settings.USE_TZ:
+            return datetime.datetime.fromtimestamp(mtime, tz=datetime.timezone.utc)
+        return datetime.datetime.fromtimestamp(mtime)
+
+    def delete(self, name):
+        # Content stays in the project, as other names may share it. The
+        # entry is kept aside so saving the same content again is free.
+        entry = self.manifest.remove(name)
+        if entry is not None:
+            self._deleted[name] = entry
+        self._pending.pop(name, None)
+
+    def url(self, name):
+        return self.manifest.url(name)
+
+    def _save(self, name, content):
+        disk_entry = hashing.disk_entry(content)
+        mtime = disk_entry[1].st_mtime if disk_entry else time.time()
+        etag = self.uplyfile._md5sum(content)
+        known = self.manifest.get_many([name]).get(name) or self._deleted.get(name)
+        if known is not None and known["etag"] == etag:
+            self._record(name, etag, known["url"], mtime)
+        elif disk_entry is not None:
+            path, stat = disk_entry
+            entry = sync.SyncEntry(name, path, stat.st_size, etag, None)
+            self._pending[name] = (entry, mtime)
+        else:
+            self._record(name, etag, self.uplyfile.get_or_upload(name, content), mtime)
+        return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        """Uploads the changed files and writes the manifest and mappings"""
+        if dry_run:
+            return
+
+        pending = list(self._pending.values())
+        self._pending = {}
+        entries = [
+            entry._replace(url=self.uplyfile._find_file_url(entry.etag))
+            for entry, _ in pending
+        ]
+        failed = dict(sync.sync(self, entries, self.upload_workers).failed)
+        for entry, mtime in pending:
+            if entry.name not in failed:
+                url = self.mapper.get(entry.name)
+                self._record(entry.name, entry.etag, url, mtime)
+        self.manifest.flush()
+        self.mapper.flush()
+
+        for entry, _ in pending:
+            if entry.name in failed:
+                yield entry.name, None, failed[entry.name]
+            else:
+                yield entry.name, entry.name, True
+
+    def _record(self, name, etag, url, mtime):
+        self.manifest.save(name, {"etag": etag, "url": url, "mtime": mtime})
+        self.mapper.save(name, url)
+        self._deleted.pop(name, None)
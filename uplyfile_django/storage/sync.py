@@ -0,0 +1,180 @@
+"""Synchronizes a directory tree with an Uplyfile project.
+
+Files are hashed in parallel, through the hash cache of the storage when one
+is configured, and compared with the etags of files already in the project,
+so only missing content is uploaded. Files with identical content are
+uploaded once. The mappings file is written once, after all transfers.
+"""
+
+import collections
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SyncEntry = collections.namedtuple("SyncEntry", ["name", "path", "size", "etag", "url"])
+SyncResult = collections.namedtuple(
+    "SyncResult", ["uploaded", "present", "failed", "sent_bytes", "duration"]
+)
+
+
+def walk(directory, prefix=""):
+    """Yields (name, path) of every file below `directory` in sorted order
+
+    Names are paths relative to `directory` joined with "/" and prefixed
+    with `prefix`.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            relative = os.path.relpath(path, directory).replace(os.sep, "/")
+            yield prefix + relative, path
+
+
+def plan(storage, directory, prefix="", workers=8):
+    """Hashes files of a directory and looks up which of them are uploaded
+
+    Args:
+        storage (UplyfileStorage): Storage the files are synchronized with
+        directory (str): Path of the synchronized directory
+        prefix (str): Prefix of the names the files are mapped under
+        workers (int): Number of hashing threads
+
+    Returns:
+        list: A `SyncEntry` for every file, its url is None when its content
+            isn't in the project yet
+    """
+    uplyfile = storage.uplyfile
+    files = [
+        (storage.get_valid_name(name), path) for name, path in walk(directory, prefix)
+    ]
+
+    def hash_file(path):
+        with open(path, "rb") as f:
+            return os.fstat(f.fileno()).st_size, uplyfile._md5sum(f)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashed = list(executor.map(hash_file, [path for _, path in files]))
+
+    urls = {}
+    for _, etag in hashed:
+        if etag not in urls:
+            urls[etag] = uplyfile._find_file_url(etag)
+
+    return [
+        SyncEntry(name, path, size, etag, urls[etag])
+        for (name, path), (size, etag) in zip(files, hashed)
+    ]
+
+
+def transfers(entries):
+    """Returns the entries whose content has to be uploaded, one per etag"""
+    missing = {}
+    for entry in entries:
+        if entry.url is None:
+            missing.setdefault(entry.etag, entry)
+    return list(missing.values())
+
+
+def sync(storage, entries, workers=8, progress=None):
+    """Uploads missing content of planned entries and maps all of them
+
+    Mappings of all files whose content is in the project are saved with a
+    single write of the mappings file, after every upload finished.
+
+    Args:
+        storage (UplyfileStorage): Storage the files are synchronized with
+        entries (list): Entries returned by `plan`
+        workers (int): Maximum number of concurrent uploads
+        progress (Progress): Reports finished uploads, optional
+
+    Returns:
+        SyncResult: Names of uploaded, already present and failed files
+            (failed ones along with their errors), and the transfer stats
+    """
+    pending = transfers(entries)
+    started = time.monotonic()
+
+    def upload(entry):
+        with open(entry.path, "rb") as f:
+            url = storage.uplyfile.upload(entry.name, f)
+        if progress is not None:
+            progress.uploaded(entry)
+        return url
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {entry.etag: executor.submit(upload, entry) for entry in pending}
+
+    errors = {etag: future.exception() for etag, future in futures.items()}
+    sent_names = {entry.name for entry in pending}
+    mappings = {}
+    uploaded, present, failed = [], [], []
+    for entry in entries:
+        if entry.url is not None:
+            mappings[entry.name] = entry.url
+            present.append(entry.name)
+        elif errors[entry.etag] is not None:
+            failed.append((entry.name, errors[entry.etag]))
+        else:
+            mappings[entry.name] = futures[entry.etag].result()
+            # Only the first file with given content is actually sent.
+            if entry.name in sent_names:
+                uploaded.append(entry.name)
+            else:
+                present.append(entry.name)
+
+    storage.mapper.save_many(mappings)
+    storage.mapper.flush()
+    return SyncResult(
+        uploaded=uploaded,
+        present=present,
+        failed=failed,
+        sent_bytes=sum(e.size for e in pending if errors[e.etag] is None),
+        duration=time.monotonic() - started,
+    )
+
+
+class Progress:
+    """Writes a line for every finished upload with the overall throughput
+
+    Attributes:
+        total (int): Number of planned uploads
+        total_bytes (int): Size of all planned uploads
+    """
+
+    def __init__(self, stream, entries):
+        """Create a Progress reporting planned uploads.
+
+        Args:
+            stream (file): Text stream the lines are written to
+            entries (list): Entries which will be uploaded
+        """
+        self.stream = stream
+        self.total = len(entries)
+        self.total_bytes = sum(entry.size for entry in entries)
+        self._done = 0
+        self._done_bytes = 0
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def uploaded(self, entry):
+        with self._lock:
+            self._done += 1
+            self._done_bytes += entry.size
+            elapsed = time.monotonic() - self._started
+            self.stream.write(
+                f"[{self._done}/{self.total}] {entry.name} "
+                f"({format_size(self._done_bytes)} of "
+                f"{format_size(self.total_bytes)}, "
+                f"{format_rate(self._done_bytes, elapsed)})\n"
+            )
+            self.stream.flush()
+
+
+def format_size(size):
+    return f"{size / 1024 / 1024:.1f} MiB"
+
+
+def format_rate(size, seconds):
+    return f"{format_size(size / seconds if seconds > 0 else 0)}/s"
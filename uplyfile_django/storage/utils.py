@@ -8,7 +8,7 @@ def get_setting(name, fallback=None):
     try:
         return uplyfile_storage[name]
     except KeyError:
-        fallback()
+        return fallback() if fallback else None
 
 
 def not_found(name):
@@ -18,5 +18,20 @@ def not_found(name):
     return raiser
 
 
+def transport_options():
+    settings_names = {
+        "POOL_CONNECTIONS": "pool_connections",
+        "POOL_MAXSIZE": "pool_maxsize",
+        "CONNECT_TIMEOUT": "connect_timeout",
+        "READ_TIMEOUT": "read_timeout",
+        "KEEP_ALIVE": "keep_alive",
+    }
+    options = {
+        option: get_setting(setting_name)
+        for setting_name, option in settings_names.items()
+    }
+    return {option: value for option, value in options.items() if value is not None}
+
+
 def normalize_name(name):
     return unidecode(name)
@@ -0,0 +1,121 @@
+import io
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+from uplyfile_django.emulator import UplyfileEmulator
+from uplyfile_django.emulator.pytest_plugin import (  # noqa: F401
+    PUBLIC_KEY,
+    SECRET_KEY,
+    uplyfile_emulator,
+    uplyfile_emulator_client,
+)
+from uplyfile_django.lib.retry import CircuitBreaker, RetryPolicy
+from uplyfile_django.lib.uplyfile import AuthException, Uplyfile, UplyImage
+
+
+def make_client(emulator, secret_key=SECRET_KEY, **kwargs):
+    return Uplyfile(
+        PUBLIC_KEY,
+        secret_key,
+        base_api_url=emulator.api_url,
+        retry_policy=RetryPolicy(max_attempts=1),
+        circuit_breaker=CircuitBreaker(),
+        **kwargs,
+    )
+
+
+class TestEmulator:
+    def test_upload_is_listed_and_served(self, uplyfile_emulator_client):
+        uply = uplyfile_emulator_client
+
+        url = uply.upload("file.txt", io.BytesIO(b"content"))
+
+        assert uply.file_exists(url)
+        assert requests.get(url).content == b"content"
+        (record,) = uply.list_project_files()
+        assert record["url"]["full"] == url
+        assert uply.get_file_url(io.BytesIO(b"content")) == url
+
+    def test_invalid_signature_is_rejected(self, uplyfile_emulator):
+        with pytest.raises(AuthException):
+            make_client(uplyfile_emulator, secret_key="wrong").list_project_files()
+
+    def test_expired_signature_is_rejected(self, uplyfile_emulator):
+        uply = make_client(uplyfile_emulator, signature_expiration=0)
+        time.sleep(0.01)
+
+        with pytest.raises(AuthException):
+            uply.list_project_files()
+
+    def test_files_are_served_without_signature(self, uplyfile_emulator):
+        record = uplyfile_emulator.store("file.txt", b"content")
+
+        assert requests.head(record["url"]["full"]).status_code == 200
+        assert requests.get(record["url"]["full"]).content == b"content"
+
+    def test_byte_ranges_are_served(self, uplyfile_emulator):
+        url = uplyfile_emulator.store("file.txt", b"content")["url"]["full"]
+
+        partial = requests.get(url, headers={"Range": "bytes=1-3"})
+        suffix = requests.get(url, headers={"Range": "bytes=-4"})
+        unsatisfiable = requests.get(url, headers={"Range": "bytes=7-"})
+
+        assert partial.status_code == 206
+        assert partial.content == b"ont"
+        assert partial.headers["Content-Range"] == "bytes 1-3/7"
+        assert suffix.content == b"tent"
+        assert unsatisfiable.status_code == 416
+        assert unsatisfiable.headers["Content-Range"] == "bytes */7"
+
+    def test_image_metadata(self, uplyfile_emulator):
+        record = uplyfile_emulator.store("cat.png", b"image")
+        uplyfile_emulator.metadata[record["uid"]] = {
+            "labels": ["cat"],
+            "objects": [],
+            "explicit_content": {"adult": "VERY_UNLIKELY"},
+        }
+
+        image = UplyImage(record["url"]["full"])
+
+        assert image.image_labels_list() == ["cat"]
+        assert not image.explicit_content()
+
+    def test_error_rate(self):
+        with UplyfileEmulator(error_rate=1) as emulator:
+            with pytest.raises(requests.HTTPError):
+                make_client(emulator).list_project_files()
+
+    def test_latency(self):
+        with UplyfileEmulator(latency=0.2) as emulator:
+            started_at = time.monotonic()
+            make_client(emulator).list_project_files()
+
+        assert time.monotonic() - started_at >= 0.2
+
+    def test_bandwidth(self):
+        with UplyfileEmulator(bandwidth=1024 * 1024) as emulator:
+            record = emulator.store("file.bin", b"x" * 256 * 1024)
+            started_at = time.monotonic()
+            requests.get(record["url"]["full"])
+
+        assert time.monotonic() - started_at >= 0.25
+
+
+def test_emulator_runs_as_standalone_process():
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uplyfile_django.emulator", "--port", "0"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        api_url = process.stdout.readline().split()[-1]
+        uply = Uplyfile("public", "secret", base_api_url=api_url)
+
+        assert uply.list_project_files() == []
+    finally:
+        process.terminate()
+        process.wait(5)
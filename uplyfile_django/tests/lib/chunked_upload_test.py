@@ -0,0 +1,102 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from uplyfile_django.lib.chunked_upload import UploadJournal
+from uplyfile_django.emulator import UplyfileEmulator
+from uplyfile_django.lib.uplyfile import Uplyfile
+
+CHUNK_SIZE = 64 * 1024
+CONTENT = os.urandom(5 * CHUNK_SIZE + 123)
+
+
+class FailingAfter(io.FileIO):
+    def __init__(self, path, reads):
+        super().__init__(path, "rb")
+        self.reads_left = reads
+
+    def read(self, size=-1):
+        if self.reads_left == 0:
+            raise IOError("Disk went away")
+        self.reads_left -= 1
+        return super().read(size)
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(CONTENT)
+    with open(str(path), "rb") as f:
+        yield f
+
+
+@pytest.fixture
+def server():
+    with UplyfileEmulator() as server:
+        yield server
+
+
+@pytest.fixture
+def make_uplyfile(server, tmp_path):
+    def make():
+        uply = Uplyfile(
+            "public_key",
+            "private_key",
+            base_api_url=server.api_url,
+            chunked_upload_threshold=CHUNK_SIZE,
+            chunk_size=CHUNK_SIZE,
+            journal_dir=str(tmp_path / "journal"),
+        )
+        uply._chunked_uploader.retrying.policy.backoff = 0
+        return uply
+
+    return make
+
+
+class TestChunkedUpload:
+    def test_large_file_is_uploaded_in_chunks(self, server, make_uplyfile, video):
+        url = make_uplyfile().upload("video.mp4", video)
+
+        (record,) = server.files.values()
+        assert url == record["url"]["full"]
+        assert record["etag"] == hashlib.md5(CONTENT).hexdigest()
+        assert server.received_bytes == len(CONTENT)
+
+    def test_failed_chunks_are_retried(self, server, make_uplyfile, video):
+        server.fail_chunks = 3
+
+        make_uplyfile().upload("video.mp4", video)
+
+        assert len(server.files) == 1
+        assert server.received_bytes == len(CONTENT)
+
+    def test_restarted_upload_resumes_from_last_confirmed_chunk(
+        self, server, make_uplyfile, video, tmp_path
+    ):
+        # The file is hashed through mmap without reads, so three reads send
+        # three chunks.
+        with pytest.raises(IOError):
+            make_uplyfile().upload("video.mp4", FailingAfter(video.name, reads=3))
+        assert server.received_bytes == 3 * CHUNK_SIZE
+        assert not server.files
+
+        make_uplyfile().upload("video.mp4", video)
+
+        (record,) = server.files.values()
+        assert record["etag"] == hashlib.md5(CONTENT).hexdigest()
+        assert server.received_bytes == len(CONTENT)
+        assert not os.listdir(str(tmp_path / "journal"))
+
+    def test_journal_entry_of_unknown_upload_starts_a_new_one(
+        self, server, make_uplyfile, video, tmp_path
+    ):
+        key = f"{hashlib.md5(CONTENT).hexdigest()}-{len(CONTENT)}"
+        UploadJournal(str(tmp_path / "journal")).save(
+            key, {"upload_id": "forgotten", "offset": 3 * CHUNK_SIZE}
+        )
+
+        make_uplyfile().upload("video.mp4", video)
+
+        assert server.received_bytes == len(CONTENT)
@@ -0,0 +1,103 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from uplyfile_django.lib.download_cache import DownloadCache
+
+URL = "https://uplycdn.com/p/abc/file.bin"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DownloadCache(str(tmp_path / "downloads"), max_bytes=100)
+
+
+def read(cached):
+    with cached.file as f:
+        return f.read()
+
+
+def test_stored_file_is_returned_with_validators(cache):
+    with cache.put(URL, [b"con", b"tent"], etag='"abc"', last_modified="date") as f:
+        assert f.read() == b"content"
+
+    cached = cache.get(URL)
+    assert read(cached) == b"content"
+    assert cached.etag == '"abc"'
+    assert cached.last_modified == "date"
+
+
+def test_missing_url(cache):
+    assert cache.get(URL) is None
+
+
+def test_least_recently_used_files_are_evicted(cache):
+    for name in ("a", "b"):
+        cache.put(f"{URL}/{name}", [b"x" * 40]).close()
+        past = os.stat(cache._paths(f"{URL}/{name}")[0]).st_mtime - 10
+        os.utime(cache._paths(f"{URL}/{name}")[0], (past, past))
+    read(cache.get(f"{URL}/a"))
+
+    cache.put(f"{URL}/c", [b"x" * 40]).close()
+
+    assert cache.get(f"{URL}/b") is None
+    assert read(cache.get(f"{URL}/a")) == b"x" * 40
+    assert read(cache.get(f"{URL}/c")) == b"x" * 40
+
+
+def test_directory_is_scanned_only_above_max_bytes(cache):
+    cache.put(f"{URL}/a", [b"x" * 40]).close()
+
+    with patch(
+        "uplyfile_django.lib.download_cache.os.scandir", wraps=os.scandir
+    ) as scandir_mock:
+        cache.put(f"{URL}/b", [b"x" * 40]).close()
+        scandir_mock.assert_not_called()
+
+        cache.put(f"{URL}/c", [b"x" * 40]).close()
+        scandir_mock.assert_called_once()
+
+
+def test_running_total_follows_replacements_and_removals(cache):
+    cache.put(URL, [b"x" * 40]).close()
+    cache.put(URL, [b"x" * 10]).close()
+    cache.put(f"{URL}/other", [b"x" * 20]).close()
+    assert cache._add_to_total(0) == 30
+
+    cache.remove(URL)
+    assert cache._add_to_total(0) == 20
+
+
+def test_file_larger_than_the_cache_stays_readable(cache):
+    with cache.put(URL, [b"x" * 150]) as f:
+        assert cache.get(URL) is None
+        assert f.read() == b"x" * 150
+
+
+def test_cache_is_shared_between_instances(cache):
+    cache.put(URL, [b"content"], etag='"abc"').close()
+
+    other = DownloadCache(cache.directory, max_bytes=100)
+    assert read(other.get(URL)) == b"content"
+
+
+def test_failed_download_leaves_nothing_behind(cache):
+    def broken():
+        yield b"con"
+        raise IOError("Connection reset")
+
+    with pytest.raises(IOError):
+        cache.put(URL, broken())
+
+    assert cache.get(URL) is None
+    assert os.listdir(cache.directory) == []
+
+
+def test_removed_file_is_missing(cache):
+    cache.put(URL, [b"content"]).close()
+
+    cache.remove(URL)
+    cache.remove(URL)
+
+    assert cache.get(URL) is None
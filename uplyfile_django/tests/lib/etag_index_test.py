@@ -0,0 +1,181 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from uplyfile_django.lib.etag_index import EtagIndex
+from uplyfile_django.lib.uplyfile import Uplyfile
+
+
+def record(etag, name=None):
+    name = name or f"{etag}.png"
+    return {"etag": etag, "url": {"full": f"https://uplycdn.com/p/{etag}/{name}"}}
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "etags.sqlite3")
+
+
+@pytest.fixture
+def index(index_path):
+    return EtagIndex(index_path, max_age=60)
+
+
+class TestEtagIndex:
+    def test_new_index_is_stale_and_empty(self, index):
+        assert index.is_stale()
+        assert index.get("a") is None
+
+    def test_refresh_makes_records_available(self, index):
+        assert index.refresh(iter([record("a"), record("b")]))
+
+        assert not index.is_stale()
+        assert index.get("a") == record("a")
+        assert index.get("b") == record("b")
+
+    def test_refresh_removes_files_missing_from_listing(self, index):
+        index.refresh([record("a"), record("b")])
+        index.refresh([record("b")], force=True)
+
+        assert index.get("a") is None
+        assert index.get("b") == record("b")
+
+    def test_refresh_of_fresh_index_is_skipped(self, index):
+        index.refresh([record("a")])
+
+        assert not index.refresh([record("b")])
+        assert index.get("b") is None
+
+    def test_has_size_of_indexed_files(self, index):
+        index.refresh([{**record("a"), "file_size_bytes": 7}])
+
+        assert index.has_size(7)
+        assert not index.has_size(8)
+
+    def test_has_url_of_indexed_files(self, index):
+        index.refresh([record("a")])
+
+        assert index.has_url(record("a")["url"]["full"])
+        assert not index.has_url(record("b")["url"]["full"])
+        assert index.get_by_url(record("a")["url"]["full"]) == record("a")
+        assert index.get_by_url(record("b")["url"]["full"]) is None
+
+    def test_index_is_stale_after_max_age(self, index):
+        index.refresh([record("a")])
+        later = time.time() + 61
+
+        with patch("uplyfile_django.lib.etag_index.time.time", return_value=later):
+            assert index.is_stale()
+
+    def test_index_is_shared_between_instances(self, index, index_path):
+        index.refresh([record("a")], force=True)
+        index.add(record("b"))
+
+        other = EtagIndex(index_path, max_age=60)
+        assert not other.is_stale()
+        assert other.get("a") == record("a")
+        assert other.get("b") == record("b")
+
+    def test_failed_refresh_keeps_old_records_and_releases_lease(self, index):
+        index.refresh([record("a")])
+
+        def broken_listing():
+            yield record("b")
+            raise IOError("Connection reset")
+
+        with pytest.raises(IOError):
+            index.refresh(broken_listing(), force=True)
+
+        assert index.get("a") == record("a")
+        assert index.refresh([record("c")], force=True)
+
+    def test_wait_for_refresh_returns_once_lease_is_released(self, index):
+        index._acquire_refresh_lease(force=True)
+
+        assert not index.wait_for_refresh(timeout=0.05, poll_interval=0.01)
+        with index._transaction():
+            index._set_meta("lease_until", None)
+        assert index.wait_for_refresh(timeout=0)
+
+    def test_wait_for_refresh_defaults_to_refresh_wait(self, index_path):
+        index = EtagIndex(index_path, refresh_wait=0.05)
+        index._acquire_refresh_lease(force=True)
+
+        started = time.monotonic()
+        assert not index.wait_for_refresh(poll_interval=0.01)
+        assert time.monotonic() - started < index.lease_timeout
+
+
+class TestGetFileUrlWithEtagIndex:
+    def test_lookup_uses_index_without_listing_project_files(self, index, tmp_path):
+        content = tmp_path / "file.png"
+        content.write_bytes(b"content")
+        uply = Uplyfile("public_key", "private_key", etag_index=index)
+
+        with open(str(content), "rb") as f:
+            etag = uply._md5sum(f)
+            index.refresh([record(etag)])
+
+            with patch.object(Uplyfile, "iter_project_files") as listing_mock:
+                assert uply.get_file_url(f) == record(etag)["url"]["full"]
+                listing_mock.assert_not_called()
+
+    def test_stale_index_is_refreshed_from_listing(self, index, tmp_path):
+        content = tmp_path / "file.png"
+        content.write_bytes(b"content")
+        uply = Uplyfile("public_key", "private_key", etag_index=index)
+
+        with open(str(content), "rb") as f:
+            etag = uply._md5sum(f)
+            with patch.object(Uplyfile, "iter_project_files") as listing_mock:
+                listing_mock.return_value = iter([record(etag)])
+                assert uply.get_file_url(f) == record(etag)["url"]["full"]
+                assert uply.get_file_url(f) == record(etag)["url"]["full"]
+                listing_mock.assert_called_once()
+
+    def test_refresh_by_another_process_is_waited_for(self, index, index_path):
+        uply = Uplyfile("public_key", "private_key", etag_index=index)
+        other = EtagIndex(index_path, max_age=60)
+
+        def wait_for_refresh():
+            # The other process finishes its refresh meanwhile.
+            with other._transaction():
+                other._set_meta("lease_until", None)
+            other.refresh([record("a")], force=True)
+
+        with other._transaction():
+            other._set_meta("lease_until", time.time() + 60)
+        with patch.object(Uplyfile, "iter_project_files"), patch.object(
+            index, "wait_for_refresh", side_effect=wait_for_refresh
+        ):
+            assert uply._find_file_url("a") == record("a")["url"]["full"]
+
+        assert uply._listing_loaded_at is not None
+
+    def test_absence_isnt_remembered_when_refresh_is_skipped(self, index):
+        uply = Uplyfile("public_key", "private_key", etag_index=index)
+        index._acquire_refresh_lease(force=True)
+
+        with patch.object(Uplyfile, "iter_project_files") as listing_mock, patch.object(
+            index, "wait_for_refresh", return_value=False
+        ):
+            assert uply._find_file_url("a") is None
+            listing_mock.assert_called_once()
+
+        assert "a" not in uply._known_absent
+        assert uply._listing_loaded_at is None
+
+    def test_lookup_falls_back_to_stale_index_after_refresh_wait(self, index_path):
+        index = EtagIndex(index_path, max_age=60, refresh_wait=0.05)
+        index.refresh([record("a")])
+        with index._transaction():
+            index._set_meta("refreshed_at", time.time() - 61)
+            index._set_meta("lease_until", time.time() + 60)
+        uply = Uplyfile("public_key", "private_key", etag_index=index)
+
+        with patch.object(Uplyfile, "iter_project_files"):
+            assert uply._find_file_url("a") == record("a")["url"]["full"]
+            assert uply._find_file_url("b") is None
+
+        assert "b" not in uply._known_absent
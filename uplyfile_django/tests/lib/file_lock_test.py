@@ -0,0 +1,45 @@
+import subprocess
+import sys
+import threading
+import time
+
+from uplyfile_django.lib.file_lock import locked
+
+
+def test_exclusive_lock_waits_for_holder(tmp_path):
+    path = str(tmp_path / "lock")
+    events = []
+
+    def hold():
+        with locked(path):
+            events.append("held")
+            time.sleep(0.1)
+            events.append("released")
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    while not events:
+        time.sleep(0.01)
+    with locked(path):
+        events.append("acquired")
+    thread.join()
+
+    assert events == ["held", "released", "acquired"]
+
+
+def test_shared_locks_are_held_at_once(tmp_path):
+    path = str(tmp_path / "lock")
+
+    with locked(path, shared=True):
+        with locked(path, shared=True):
+            pass
+
+
+def test_storage_imports_without_fcntl():
+    code = (
+        "import sys; sys.modules['fcntl'] = None; "
+        "import uplyfile_django.lib.download_cache; "
+        "import uplyfile_django.storage"
+    )
+
+    subprocess.run([sys.executable, "-c", code], check=True)
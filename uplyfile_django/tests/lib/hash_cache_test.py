@@ -0,0 +1,134 @@
+import hashlib
+import io
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+from uplyfile_django.lib import hashing
+from uplyfile_django.lib.hash_cache import HashCache
+from uplyfile_django.lib.uplyfile import Uplyfile
+
+HOUR_AGO = time.time() - 60 * 60
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HashCache(str(tmp_path / "hashes.sqlite3"))
+
+
+@pytest.fixture
+def asset(tmp_path):
+    path = tmp_path / "app.js"
+    write(path, b"console.log(1)")
+    return path
+
+
+def write(path, data, mtime=HOUR_AGO):
+    path.write_bytes(data)
+    os.utime(str(path), (mtime, mtime))
+
+
+def md5sum(cache, path):
+    with open(str(path), "rb") as f:
+        return cache.md5sum(f)
+
+
+@pytest.fixture
+def hash_spy():
+    with patch.object(hashing, "md5sum", wraps=hashing.md5sum) as spy:
+        yield spy
+
+
+class TestHashCache:
+    def test_unchanged_file_is_not_hashed_again(self, cache, asset, hash_spy):
+        assert md5sum(cache, asset) == hashlib.md5(b"console.log(1)").hexdigest()
+        assert md5sum(cache, asset) == hashlib.md5(b"console.log(1)").hexdigest()
+
+        assert hash_spy.call_count == 1
+
+    def test_cache_is_persistent(self, cache, asset, hash_spy):
+        md5sum(cache, asset)
+        md5sum(HashCache(cache.path), asset)
+
+        assert hash_spy.call_count == 1
+
+    def test_changed_mtime_invalidates_entry(self, cache, asset):
+        md5sum(cache, asset)
+        write(asset, b"console.log(2)", mtime=HOUR_AGO - 1)
+
+        assert md5sum(cache, asset) == hashlib.md5(b"console.log(2)").hexdigest()
+
+    def test_changed_size_invalidates_entry(self, cache, asset):
+        stat = asset.stat()
+        md5sum(cache, asset)
+        asset.write_bytes(b"console.log(10)")
+        os.utime(str(asset), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        assert md5sum(cache, asset) == hashlib.md5(b"console.log(10)").hexdigest()
+
+    def test_replaced_file_invalidates_entry(self, cache, asset, tmp_path):
+        stat = asset.stat()
+        md5sum(cache, asset)
+        replacement = tmp_path / "new.js"
+        replacement.write_bytes(b"console.log(3)")
+        os.utime(str(replacement), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(str(replacement), str(asset))
+
+        assert md5sum(cache, asset) == hashlib.md5(b"console.log(3)").hexdigest()
+
+    def test_recently_modified_file_is_not_stored(self, cache, asset, hash_spy):
+        write(asset, b"console.log(1)", mtime=time.time())
+
+        md5sum(cache, asset)
+        md5sum(cache, asset)
+
+        assert hash_spy.call_count == 2
+
+    def test_objects_not_on_disk_are_always_hashed(self, cache, hash_spy):
+        assert cache.md5sum(io.BytesIO(b"a")) == hashlib.md5(b"a").hexdigest()
+        assert cache.md5sum(io.BytesIO(b"b")) == hashlib.md5(b"b").hexdigest()
+
+
+class Response:
+    status_code = 200
+    text = ""
+    url = "https://uply"
+
+    def raise_for_status(self):
+        pass
+
+
+class TestGetOrUploadWithHashCache:
+    @patch.object(Uplyfile, "iter_project_files")
+    @patch.object(Uplyfile, "_session")
+    def test_uploaded_file_is_not_hashed_when_saved_again(
+        self, session_mock, list_mock, cache, asset, hash_spy
+    ):
+        def make_uplyfile():
+            return Uplyfile(
+                "public_key", "private_key", hash_cache=HashCache(cache.path)
+            )
+
+        list_mock.return_value = []
+        session_mock.post.side_effect = lambda *args, data, **kwargs: (
+            b"".join(data),
+            Response(),
+        )[1]
+
+        with open(str(asset), "rb") as f:
+            assert make_uplyfile().get_or_upload("app.js", f) == "https://uply"
+        with open(str(asset), "rb") as f:
+            list_mock.return_value = [
+                {
+                    "etag": hashlib.md5(b"console.log(1)").hexdigest(),
+                    "url": {"full": "https://uply/app.js"},
+                }
+            ]
+            url = make_uplyfile().get_or_upload("app.js", f)
+
+        assert url == "https://uply/app.js"
+
+        session_mock.post.assert_called_once()
+        hash_spy.assert_not_called()
@@ -0,0 +1,91 @@
+import hashlib
+import io
+import tempfile
+from unittest.mock import patch
+
+import pytest
+from django.core.files.base import ContentFile, File
+from django.core.files.uploadedfile import InMemoryUploadedFile
+
+from uplyfile_django.lib import hashing
+
+CONTENT = b"content" * 1000
+ETAG = hashlib.md5(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(CONTENT)
+    return str(path)
+
+
+@pytest.fixture
+def no_reads():
+    with patch.object(hashing, "_md5_read") as read_mock:
+        yield read_mock
+        read_mock.assert_not_called()
+
+
+class TestMd5sum:
+    def test_in_memory_content_is_hashed_from_its_buffer(self, no_reads):
+        assert hashing.md5sum(io.BytesIO(CONTENT)) == ETAG
+        assert hashing.md5sum(ContentFile(CONTENT)) == ETAG
+
+    def test_in_memory_uploaded_file_is_accepted(self, no_reads):
+        uploaded = InMemoryUploadedFile(
+            io.BytesIO(CONTENT), "file", "file.bin", None, len(CONTENT), None
+        )
+
+        assert hashing.md5sum(uploaded) == ETAG
+
+    def test_file_on_disk_is_memory_mapped(self, path, no_reads):
+        with open(path, "rb") as f:
+            assert hashing.md5sum(f) == ETAG
+        with open(path, "rb") as f:
+            assert hashing.md5sum(File(f)) == ETAG
+
+    def test_unflushed_writes_are_hashed(self, no_reads):
+        with tempfile.TemporaryFile() as f:
+            f.write(CONTENT)
+            assert hashing.md5sum(f) == ETAG
+
+    def test_empty_file(self, tmp_path):
+        path = tmp_path / "empty"
+        path.touch()
+
+        with open(str(path), "rb") as f:
+            assert hashing.md5sum(f) == hashlib.md5().hexdigest()
+
+    def test_spooled_file_stays_in_memory(self):
+        with tempfile.SpooledTemporaryFile(max_size=len(CONTENT) * 2) as f:
+            f.write(CONTENT)
+
+            assert hashing.md5sum(f) == ETAG
+            assert not f._rolled
+
+    def test_file_is_rewound(self, path):
+        with open(path, "rb") as f:
+            f.read(10)
+            hashing.md5sum(f)
+            assert f.tell() == 0
+
+    def test_text_mode_is_rejected(self, path):
+        with open(path, "r") as f:
+            with pytest.raises(ValueError):
+                hashing.md5sum(f)
+
+
+def test_md5_many_keeps_order_and_returns_exceptions(path):
+    with open(path, "r") as text, open(path, "rb") as binary:
+        hashes = hashing.md5_many(
+            [io.BytesIO(b"a"), text, binary], return_exceptions=True
+        )
+
+    assert hashes[0] == hashlib.md5(b"a").hexdigest()
+    assert isinstance(hashes[1], ValueError)
+    assert hashes[2] == ETAG
+
+
+def test_md5_path(path):
+    assert hashing.md5_path(path) == ETAG
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from uplyfile_django.lib.json_stream import JsonArrayParser, iter_json_array
+
+DOCUMENT = [
+    {"etag": "a", "url": {"full": "https://uplycdn.com/p/a/zażółć.png"}},
+    12345,
+    "text, with ] and [",
+    [1, [2, 3]],
+    None,
+]
+
+
+def byte_chunks(data, size):
+    return (data[i : i + size] for i in range(0, len(data), size))
+
+
+class TestIterJsonArray:
+    @pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 4096])
+    def test_parses_document_split_into_chunks(self, chunk_size):
+        data = json.dumps(DOCUMENT, ensure_ascii=False, indent=1).encode("utf-8")
+
+        assert list(iter_json_array(byte_chunks(data, chunk_size))) == DOCUMENT
+
+    def test_elements_are_returned_as_soon_as_they_are_complete(self):
+        parser = JsonArrayParser()
+
+        assert parser.feed(b'[{"etag": "a"}, {"etag"') == [{"etag": "a"}]
+        assert parser.feed(b': "b"}, 1') == [{"etag": "b"}]
+        assert parser.feed(b"2]") == [12]
+        assert parser.close() == []
+
+    def test_empty_array(self):
+        assert list(iter_json_array([b" [ ", b"] "])) == []
+
+    @pytest.mark.parametrize(
+        "data", [b"", b'{"a": 1}', b"[1, 2", b"[1,]", b"[1 2]", b"[1] 2"]
+    )
+    def test_malformed_documents_raise_value_error(self, data):
+        with pytest.raises(ValueError):
+            list(iter_json_array(byte_chunks(data, 2)))
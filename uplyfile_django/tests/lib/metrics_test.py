@@ -0,0 +1,139 @@
+import io
+import logging
+from unittest.mock import patch
+
+import pytest
+
+from uplyfile_django.lib import metrics
+from uplyfile_django.lib.retry import CircuitBreaker, RetryPolicy
+from uplyfile_django.lib.uplyfile import Uplyfile
+
+
+class Response:
+    def __init__(self, status_code=200, url="", body=b"[]"):
+        self.status_code = status_code
+        self.url = url
+        self.text = ""
+        self.headers = {}
+        self._body = body
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        return iter([self._body])
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def registry():
+    metrics.registry.enabled = True
+    yield metrics.registry
+    metrics.registry.enabled = False
+    metrics.registry.clear()
+
+
+@pytest.fixture
+def uplyfile():
+    return Uplyfile(
+        "public_key",
+        "private_key",
+        retry_policy=RetryPolicy(backoff=0),
+        circuit_breaker=CircuitBreaker(),
+    )
+
+
+class TestRegistry:
+    def test_histogram_counts_values_in_cumulative_buckets(self):
+        histogram = metrics.Histogram("latency", "Latency", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.7, 3):
+            histogram.observe(value, operation="upload")
+
+        samples = {
+            (suffix, labels.get("le")): value
+            for suffix, labels, value in histogram.samples()
+        }
+        assert samples[("_bucket", "0.1")] == 1
+        assert samples[("_bucket", "1")] == 3
+        assert samples[("_bucket", "+Inf")] == 4
+        assert samples[("_count", None)] == 4
+        assert samples[("_sum", None)] == pytest.approx(4.25)
+
+    def test_prometheus_exporter_renders_text_format(self):
+        registry = metrics.Registry(enabled=True)
+        registry.counter("uplyfile_responses_total", "Responses").inc(
+            operation="upload", status=200
+        )
+
+        text = metrics.PrometheusExporter().render(registry)
+
+        assert text == (
+            "# HELP uplyfile_responses_total Responses\n"
+            "# TYPE uplyfile_responses_total counter\n"
+            'uplyfile_responses_total{operation="upload",status="200"} 1\n'
+        )
+
+    def test_prometheus_exporter_writes_file(self, tmp_path):
+        registry = metrics.Registry(enabled=True)
+        registry.counter("uplyfile_errors_total", "Errors").inc(operation="open")
+        path = tmp_path / "uplyfile.prom"
+        registry.add_exporter(metrics.PrometheusExporter(str(path)))
+
+        registry.export()
+
+        assert 'uplyfile_errors_total{operation="open"} 1' in path.read_text()
+
+    def test_logging_exporter_logs_samples(self, caplog):
+        registry = metrics.Registry(enabled=True)
+        registry.counter("uplyfile_sent_bytes_total", "Sent").inc(5, operation="upload")
+
+        with caplog.at_level(logging.INFO, logger="uplyfile_django.metrics"):
+            metrics.LoggingExporter().export(registry)
+
+        assert 'uplyfile_sent_bytes_total{operation="upload"} 5' in caplog.text
+
+
+class TestInstrumentation:
+    def test_disabled_registry_records_nothing(self, uplyfile):
+        with patch.object(Uplyfile, "_session") as session_mock:
+            session_mock.head.return_value = Response(200)
+            uplyfile.file_exists("https://uplycdn.com/p/abc/file.txt")
+
+        assert metrics.registry.collect() == []
+
+    def test_upload_records_latency_status_and_bytes(self, registry, uplyfile):
+        with patch.object(Uplyfile, "_session") as session_mock:
+            session_mock.post.return_value = Response(200, url="https://uply")
+            uplyfile.upload("file.txt", io.BytesIO(b"content"))
+
+        duration = registry.histogram("uplyfile_operation_duration_seconds", "")
+        responses = registry.counter("uplyfile_responses_total", "")
+        sent = registry.counter("uplyfile_sent_bytes_total", "")
+        assert duration.count(operation="upload") == 1
+        assert responses.value(operation="upload", status=200) == 1
+        assert sent.value(operation="upload") > len(b"content")
+
+    def test_listing_records_bytes_received_and_cache_lookups(self, registry, uplyfile):
+        with patch.object(Uplyfile, "_session") as session_mock:
+            session_mock.get.return_value = Response(200, body=b"[]")
+            uplyfile._find_file_url("abc")
+            uplyfile._find_file_url("abc")
+
+        received = registry.counter("uplyfile_received_bytes_total", "")
+        lookups = registry.counter("uplyfile_cache_lookups_total", "")
+        duration = registry.histogram("uplyfile_operation_duration_seconds", "")
+        assert received.value(operation="list_project_files") == 2
+        assert lookups.value(result="miss") == 1
+        assert lookups.value(result="hit") == 1
+        assert duration.count(operation="list_project_files") == 1
+
+    def test_failures_are_counted(self, registry, uplyfile):
+        with patch.object(Uplyfile, "_session") as session_mock:
+            session_mock.head.side_effect = ValueError("Invalid URL")
+            with pytest.raises(ValueError):
+                uplyfile.file_exists("not an url")
+
+        errors = registry.counter("uplyfile_errors_total", "")
+        assert errors.value(operation="file_exists") == 1
@@ -0,0 +1,124 @@
+import tempfile
+from io import BytesIO
+
+import pytest
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from urllib3 import encode_multipart_formdata
+
+from uplyfile_django.lib.multipart import MultipartEncoder
+
+CONTENT = bytes(range(256)) * 1000
+
+
+class ReadRecorder(BytesIO):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_sizes = []
+
+    def read(self, size=-1):
+        self.read_sizes.append(size)
+        return super().read(size)
+
+
+class NonSeekable(ReadRecorder):
+    def seekable(self):
+        return False
+
+
+class WithoutSeekable:
+    """Seeks without having `seekable`, as SpooledTemporaryFile before 3.11"""
+
+    def __init__(self, content):
+        self._file = BytesIO(content)
+        self.read = self._file.read
+        self.seek = self._file.seek
+        self.tell = self._file.tell
+
+
+def spooled_file(content):
+    f = tempfile.SpooledTemporaryFile(max_size=1024)
+    f.write(content)
+    f.seek(0)
+    return f
+
+
+def expected_body(encoder, name="img.png", content_type="image/png"):
+    body, _ = encode_multipart_formdata(
+        {"file": (name, CONTENT, content_type)}, boundary=encoder.boundary
+    )
+    return body
+
+
+@pytest.fixture
+def temporary_uploaded_file():
+    f = TemporaryUploadedFile("img.png", "image/png", len(CONTENT), None)
+    f.write(CONTENT)
+    f.seek(0)
+    yield f
+    f.close()
+
+
+class TestMultipartEncoder:
+    @pytest.mark.parametrize(
+        "make_file",
+        [
+            lambda: BytesIO(CONTENT),
+            lambda: ContentFile(CONTENT),
+            lambda: File(BytesIO(CONTENT)),
+        ],
+    )
+    def test_body_matches_urllib3_encoding(self, make_file):
+        encoder = MultipartEncoder("file", "img.png", make_file(), "image/png")
+        body = b"".join(encoder)
+
+        assert body == expected_body(encoder)
+        assert len(encoder) == len(body)
+
+    def test_temporary_uploaded_file_is_streamed_from_disk(
+        self, temporary_uploaded_file
+    ):
+        encoder = MultipartEncoder(
+            "file", "img.png", temporary_uploaded_file, "image/png"
+        )
+
+        assert b"".join(encoder) == expected_body(encoder)
+
+    def test_source_is_read_in_fixed_size_chunks(self):
+        source = ReadRecorder(CONTENT)
+        encoder = MultipartEncoder("file", "img.png", source, chunk_size=4096)
+
+        chunks = list(encoder)[1:-1]
+
+        assert set(source.read_sizes) == {4096}
+        assert max(len(chunk) for chunk in chunks) == 4096
+
+    def test_non_seekable_source_has_unknown_length(self):
+        encoder = MultipartEncoder("file", "img.png", NonSeekable(CONTENT), "image/png")
+
+        assert encoder.length is None
+        assert not isinstance(encoder.body, MultipartEncoder)
+        assert b"".join(encoder.body) == expected_body(encoder)
+
+    @pytest.mark.parametrize("make_file", [spooled_file, WithoutSeekable])
+    def test_source_without_seekable_has_known_length(self, make_file):
+        encoder = MultipartEncoder("file", "img.png", make_file(CONTENT), "image/png")
+
+        assert encoder.rewindable
+        assert encoder.length == len(expected_body(encoder))
+        assert b"".join(encoder) == b"".join(encoder) == expected_body(encoder)
+
+    def test_quotes_in_filename_are_escaped(self):
+        encoder = MultipartEncoder("file", 'a"b.png', BytesIO(b""))
+
+        assert b'filename="a%22b.png"' in next(iter(encoder))
+
+    def test_line_breaks_in_filename_are_escaped(self):
+        name = "a\r\nContent-Type: text/html\r\nX: .png"
+        encoder = MultipartEncoder("file", name, BytesIO(b""))
+
+        preamble = next(iter(encoder))
+
+        assert b'filename="a%0D%0AContent-Type: text/html%0D%0AX: .png"' in preamble
+        assert preamble.count(b"\r\n") == 3
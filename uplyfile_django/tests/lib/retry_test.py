@@ -0,0 +1,240 @@
+import hashlib
+import io
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from uplyfile_django.lib.retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    Retrying,
+    RetryPolicy,
+)
+from uplyfile_django.lib.uplyfile import Uplyfile
+
+
+class Response:
+    def __init__(self, status_code=200, headers=None, url=""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.url = url
+        self.text = ""
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"Status code: {self.status_code}")
+
+
+@pytest.fixture(autouse=True)
+def no_sleep():
+    with patch("uplyfile_django.lib.retry.time.sleep") as sleep_mock:
+        yield sleep_mock
+
+
+def sequence(*outcomes):
+    outcomes = iter(outcomes)
+
+    def send():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return send
+
+
+class TestRetryPolicy:
+    def test_delay_is_jittered_below_exponential_bound(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+
+        for attempt, bound in ((0, 1), (1, 2), (2, 4), (3, 5), (10, 5)):
+            for _ in range(20):
+                assert 0 <= policy.delay(attempt) <= bound
+
+    def test_retry_after_seconds_are_honored(self):
+        policy = RetryPolicy(backoff=100, max_backoff=30)
+
+        assert policy.delay(0, Response(429, {"Retry-After": "7"})) == 7
+        assert policy.delay(0, Response(429, {"Retry-After": "120"})) == 30
+
+    def test_retry_after_date_is_honored(self):
+        policy = RetryPolicy()
+        response = Response(503, {"Retry-After": "Wed, 21 Oct 2015 07:28:10 GMT"})
+
+        with patch("uplyfile_django.lib.retry.time.time", return_value=1445412485):
+            assert policy.delay(0, response) == 5
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert not breaker.is_open
+        breaker.record_failure()
+
+        assert breaker.is_open
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_lets_single_trial_through_after_recovery_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+        breaker.record_failure()
+        later = breaker._opened_at + 31
+
+        with patch("uplyfile_django.lib.retry.time.monotonic", return_value=later):
+            breaker.before_call()
+            with pytest.raises(CircuitOpenError):
+                breaker.before_call()
+
+        breaker.record_success()
+        assert not breaker.is_open
+
+    def test_failed_trial_opens_circuit_again(self):
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=30)
+        for _ in range(3):
+            breaker.record_failure()
+        later = breaker._opened_at + 31
+
+        with patch("uplyfile_django.lib.retry.time.monotonic", return_value=later):
+            breaker.before_call()
+            breaker.record_failure()
+            with pytest.raises(CircuitOpenError):
+                breaker.before_call()
+
+
+class TestRetrying:
+    def test_retries_retryable_statuses_and_network_errors(self, no_sleep):
+        retrying = Retrying(RetryPolicy(max_attempts=3), CircuitBreaker())
+        send = sequence(requests.ConnectionError(), Response(503), Response(200))
+
+        assert retrying.call(send).status_code == 200
+        assert no_sleep.call_count == 2
+
+    def test_does_not_retry_client_errors(self, no_sleep):
+        retrying = Retrying(RetryPolicy(max_attempts=3), CircuitBreaker())
+
+        assert retrying.call(sequence(Response(404))).status_code == 404
+        no_sleep.assert_not_called()
+
+    def test_gives_up_after_max_attempts(self):
+        retrying = Retrying(RetryPolicy(max_attempts=2), CircuitBreaker())
+        send = sequence(requests.Timeout(), requests.Timeout("last"))
+
+        with pytest.raises(requests.Timeout, match="last"):
+            retrying.call(send)
+
+    def test_open_circuit_fails_fast(self):
+        retrying = Retrying(
+            RetryPolicy(max_attempts=5), CircuitBreaker(failure_threshold=2)
+        )
+        send = sequence(Response(500), Response(500), Response(200))
+
+        with pytest.raises(CircuitOpenError):
+            retrying.call(send)
+
+    def test_unexpected_error_of_trial_call_ends_the_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+        retrying = Retrying(RetryPolicy(max_attempts=1), breaker)
+        breaker.record_failure()
+        later = breaker._opened_at + 31
+
+        with patch("uplyfile_django.lib.retry.time.monotonic", return_value=later):
+            with pytest.raises(KeyError):
+                retrying.call(sequence(KeyError()))
+
+        assert not breaker._trial_in_progress
+        with patch("uplyfile_django.lib.retry.time.monotonic", return_value=later + 31):
+            assert retrying.call(sequence(Response(200))).status_code == 200
+        assert not breaker.is_open
+
+
+class TestFileExistsRetries:
+    def test_failed_head_request_is_retried(self):
+        uplyfile = Uplyfile(
+            "public_key",
+            "private_key",
+            retry_policy=RetryPolicy(max_attempts=3),
+            circuit_breaker=CircuitBreaker(),
+        )
+
+        with patch.object(Uplyfile, "_session") as session_mock:
+            send = sequence(requests.ConnectionError(), Response(503), Response(200))
+            session_mock.head.side_effect = lambda *args, **kwargs: send()
+
+            assert uplyfile.file_exists("https://uplycdn.com/p/abc/file.txt")
+
+        assert session_mock.head.call_count == 3
+
+
+class TestUploadRetries:
+    @pytest.fixture
+    def uplyfile(self):
+        return Uplyfile(
+            "public_key",
+            "private_key",
+            retry_policy=RetryPolicy(max_attempts=3),
+            circuit_breaker=CircuitBreaker(),
+        )
+
+    def test_timed_out_upload_found_in_listing_is_not_repeated(self, uplyfile):
+        content = io.BytesIO(b"content")
+        url = "https://uplycdn.com/p/abc/file.txt"
+
+        def post(*args, data, **kwargs):
+            b"".join(data)
+            raise requests.ReadTimeout()
+
+        with patch.object(Uplyfile, "_session") as session_mock, patch.object(
+            Uplyfile, "iter_project_files"
+        ) as listing_mock:
+            session_mock.post.side_effect = post
+            listing_mock.side_effect = lambda: iter(
+                [{"etag": hashlib.md5(b"content").hexdigest(), "url": {"full": url}}]
+            )
+
+            assert uplyfile.upload("file.txt", content) == url
+            session_mock.post.assert_called_once()
+
+    def test_upload_failed_with_status_found_in_listing_is_not_repeated(self, uplyfile):
+        content = io.BytesIO(b"content")
+        url = "https://uplycdn.com/p/abc/file.txt"
+
+        def post(*args, data, **kwargs):
+            b"".join(data)
+            return Response(504)
+
+        with patch.object(Uplyfile, "_session") as session_mock, patch.object(
+            Uplyfile, "iter_project_files"
+        ) as listing_mock:
+            session_mock.post.side_effect = post
+            listing_mock.side_effect = lambda: iter(
+                [{"etag": hashlib.md5(b"content").hexdigest(), "url": {"full": url}}]
+            )
+
+            assert uplyfile.upload("file.txt", content) == url
+            session_mock.post.assert_called_once()
+
+    def test_failed_upload_is_retried_with_whole_body(self, uplyfile):
+        content = io.BytesIO(b"content")
+        bodies = []
+
+        def post(*args, data, **kwargs):
+            bodies.append(b"".join(data))
+            if len(bodies) == 1:
+                return Response(503)
+            return Response(200, url="https://uplycdn.com/p/abc/file.txt")
+
+        with patch.object(Uplyfile, "_session") as session_mock, patch.object(
+            Uplyfile, "iter_project_files", side_effect=lambda: iter([])
+        ):
+            session_mock.post.side_effect = post
+
+            assert uplyfile.upload("file.txt", content).endswith("file.txt")
+
+        assert len(bodies) == 2
+        assert bodies[0] == bodies[1]
+        assert b"content" in bodies[1]
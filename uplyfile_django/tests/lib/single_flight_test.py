@@ -0,0 +1,47 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from uplyfile_django.lib.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(flight.do, "key", slow)
+        started.wait(5)
+        followers = [executor.submit(flight.do, "key", slow) for _ in range(3)]
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+
+
+def test_exception_is_shared_and_next_call_runs_again():
+    flight = SingleFlight()
+
+    def broken():
+        raise IOError("Connection reset")
+
+    with pytest.raises(IOError):
+        flight.do("key", broken)
+
+    assert flight.do("key", lambda: "result") == "result"
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    assert flight.do("a", lambda: flight.do("b", lambda: "b")) == "b"
@@ -0,0 +1,73 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from uplyfile_django.lib import transport
+
+
+@pytest.fixture(autouse=True)
+def default_transport():
+    transport.configure(**transport.DEFAULT_OPTIONS)
+    transport.reset()
+    yield
+    transport.configure(**transport.DEFAULT_OPTIONS)
+    transport.reset()
+
+
+class TestTransport:
+    def test_session_is_shared(self):
+        assert transport.get_session() is transport.get_session()
+
+    def test_pool_size_is_configurable(self):
+        transport.configure(pool_connections=3, pool_maxsize=7)
+
+        adapter = transport.get_session().get_adapter("https://uplycdn.com")
+        assert adapter._pool_connections == 3
+        assert adapter._pool_maxsize == 7
+
+    def test_timeouts_are_split(self):
+        transport.configure(connect_timeout=1, read_timeout=30)
+
+        assert transport.timeout() == (1, 30)
+
+    def test_disabled_keep_alive_closes_connections(self):
+        transport.configure(keep_alive=False)
+
+        assert transport.get_session().headers["Connection"] == "close"
+
+    def test_configure_with_same_options_keeps_session(self):
+        session = transport.get_session()
+        transport.configure(**transport.DEFAULT_OPTIONS)
+
+        assert transport.get_session() is session
+
+    def test_configure_with_new_options_replaces_session(self):
+        session = transport.get_session()
+        transport.configure(read_timeout=60)
+
+        assert transport.get_session() is not session
+
+    def test_unknown_option_raises(self):
+        with pytest.raises(ValueError):
+            transport.configure(pool_size=3)
+
+    def test_new_session_is_created_in_another_process(self):
+        session = transport.get_session()
+        with patch("uplyfile_django.lib.transport.os.getpid") as pid_mock:
+            pid_mock.return_value = os.getpid() + 1
+            assert transport.get_session() is not session
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+    def test_forked_child_doesnt_reuse_parent_session(self):
+        parent_session = transport.get_session()
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            reused = transport.get_session() is parent_session
+            os.write(write_end, b"1" if reused else b"0")
+            os._exit(0)
+
+        os.waitpid(pid, 0)
+        assert os.read(read_end, 1) == b"0"
+        assert transport.get_session() is parent_session
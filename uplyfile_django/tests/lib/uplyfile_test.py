@@ -1,10 +1,23 @@
+import asyncio
+import hashlib
+import io
+import json as json_module
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
 from requests import HTTPError
 
-from uplyfile_django.lib.uplyfile import AuthException, Uplyfile
+from uplyfile_django.lib import transport
+from uplyfile_django.lib.retry import CircuitBreaker, RetryPolicy
+from uplyfile_django.lib.uplyfile import (
+    AsyncUplyfile,
+    AuthException,
+    Uplyfile,
+    UplyImage,
+)
 
 
 def resources_path():
@@ -18,7 +31,9 @@ def api_keys():
 
 @pytest.fixture
 def uplyfile(api_keys):
-    return Uplyfile(*api_keys)
+    return Uplyfile(
+        *api_keys, retry_policy=RetryPolicy(backoff=0), circuit_breaker=CircuitBreaker()
+    )
 
 
 def test_image(other_name=False):
@@ -61,6 +76,7 @@ class MockedResponse:
         self.json = lambda: json
         self.status_code = state
         self.url = url
+        self.headers = {}
 
     def raise_for_status(self):
         if self.status_code != 200:
@@ -69,6 +85,39 @@ class MockedResponse:
     def text(self):
         return ""
 
+    def iter_content(self, chunk_size):
+        body = json_module.dumps(self.json()).encode("utf-8")
+        return (body[i : i + chunk_size] for i in range(0, len(body), chunk_size))
+
+    def close(self):
+        pass
+
+
+class AsyncResponse:
+    def __init__(self, status_code, body, chunk_size=7):
+        self.status_code = status_code
+        self.text = body.decode("utf-8")
+        self._chunks = [
+            body[i : i + chunk_size] for i in range(0, len(body), chunk_size)
+        ]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def aread(self):
+        pass
+
+    async def aiter_bytes(self):
+        for chunk in self._chunks:
+            yield chunk
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise HTTPError(f"Status code: {self.status_code}")
+
 
 def upload(_, name, content):
     return f"https://uplycdn.com/2pL19S/YgrvILCbqdjO/{name}"
@@ -83,20 +132,24 @@ class TestUplyfile:
         with pytest.raises(ValueError):
             Uplyfile(*api_keys, signature_expiration=-1000)
 
-    @patch("uplyfile_django.lib.uplyfile.requests.Session")
-    def test_session_is_lazily_instantiated(self, r_mock, api_keys):
+    @patch("uplyfile_django.lib.transport.requests.Session")
+    def test_session_is_lazily_instantiated_and_shared(self, r_mock, api_keys):
+        transport.reset()
         uply = Uplyfile(*api_keys)
 
         r_mock.assert_not_called()
         uply._session
         r_mock.assert_called_once()
         uply._session
+        Uplyfile(*api_keys)._session
+        UplyImage(file_url("test.png"))._session
         r_mock.assert_called_once()
+        transport.reset()
 
 
 class TestUpload:
     @patch.object(Uplyfile, "_session")
-    @patch.object(Uplyfile, "list_project_files", project_files)
+    @patch.object(Uplyfile, "iter_project_files", project_files)
     def test_given_uploaded_file_filename_get_file_url_returns_url(
         self, session_mock, uplyfile
     ):
@@ -115,13 +168,17 @@ class TestUpload:
 class TestFileExists:
     @patch.object(Uplyfile, "_session")
     def test_file_exists_uses_head_for_querying(self, session_mock, uplyfile):
-        uplyfile.file_exists(file_url("test"))
+        session_mock.head.return_value = MockedResponse(state=200)
+
+        assert uplyfile.file_exists(file_url("test"))
 
-        session_mock.head.assert_called_once_with(file_url("test"))
+        session_mock.head.assert_called_once_with(
+            file_url("test"), timeout=transport.timeout()
+        )
 
 
 class TestGetFileUrl:
-    @patch.object(Uplyfile, "list_project_files", project_files)
+    @patch.object(Uplyfile, "iter_project_files", project_files)
     @patch.object(Uplyfile, "upload", upload)
     def test_get_file_url_returns_same_link_for_files_with_same_content(self, uplyfile):
         img_1_path = test_image()
@@ -137,15 +194,15 @@ class TestGetFileUrl:
 
         assert uply_url_1 == uply_url_2
 
-    @patch.object(Uplyfile, "list_project_files", project_files)
+    @patch.object(Uplyfile, "iter_project_files", project_files)
     @patch.object(Uplyfile, "upload", upload)
     def test_get_file_url_returns_none_if_file_isnt_uploaded(self, uplyfile):
         with open(str(test_image_2()), "rb") as f:
             uply_url = uplyfile.get_file_url(f)
         assert uply_url is None
 
-    @patch.object(Uplyfile, "list_project_files")
-    def test_with_cache_list_project_files_is_called_at_most_once(
+    @patch.object(Uplyfile, "iter_project_files")
+    def test_with_cache_project_files_are_listed_at_most_once(
         self, project_files_mock, uplyfile
     ):
         with open("uplyfile_django/tests/resources/dog.webp", "rb") as fp:
@@ -158,6 +215,121 @@ class TestGetFileUrl:
             assert not url
             project_files_mock.assert_called_once()
 
+    @patch.object(Uplyfile, "iter_project_files")
+    def test_empty_project_is_listed_once(self, project_files_mock, uplyfile):
+        project_files_mock.return_value = []
+        with open(str(test_image_2()), "rb") as fp:
+            uplyfile.get_file_url(fp)
+            uplyfile.get_file_url(fp)
+
+        project_files_mock.assert_called_once()
+
+    def test_concurrent_cold_lookups_share_one_listing(self, uplyfile):
+        listings = []
+        with open(str(test_image()), "rb") as fp:
+            record = {"etag": uplyfile._md5sum(fp), "url": {"full": "https://uply"}}
+
+        def slow_listing(_):
+            listings.append(1)
+            time.sleep(0.1)
+            return iter([record])
+
+        def lookup(_):
+            with open(str(test_image()), "rb") as fp:
+                return uplyfile.get_file_url(fp)
+
+        with patch.object(Uplyfile, "iter_project_files", slow_listing):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                urls = list(executor.map(lookup, range(8)))
+
+        assert len(listings) == 1
+        assert urls == ["https://uply"] * 8
+
+    @patch.object(Uplyfile, "iter_project_files")
+    def test_misses_are_answered_by_warm_listing(self, project_files_mock, uplyfile):
+        project_files_mock.return_value = []
+        now = time.time()
+        with open(str(test_image_2()), "rb") as fp:
+            uplyfile.get_file_url(fp)
+            for i in range(1, 6):
+                later = now + i * (uplyfile.absent_ttl + 1)
+                with patch(
+                    "uplyfile_django.lib.uplyfile.time.time", return_value=later
+                ):
+                    assert uplyfile.get_file_url(fp) is None
+            assert uplyfile._md5sum(fp) in uplyfile._known_absent
+
+        project_files_mock.assert_called_once()
+
+    @patch.object(Uplyfile, "iter_project_files")
+    def test_listing_is_downloaded_again_after_max_age(
+        self, project_files_mock, uplyfile
+    ):
+        project_files_mock.return_value = []
+        later = time.time() + uplyfile.listing_max_age + 1
+        with open(str(test_image_2()), "rb") as fp:
+            uplyfile.get_file_url(fp)
+            with patch("uplyfile_django.lib.uplyfile.time.time", return_value=later):
+                uplyfile.get_file_url(fp)
+
+        assert project_files_mock.call_count == 2
+
+    @patch.object(Uplyfile, "iter_project_files")
+    @patch.object(Uplyfile, "_session")
+    def test_uploaded_file_is_written_through_to_cache(
+        self, session_mock, project_files_mock, uplyfile
+    ):
+        def post(url, data, **kwargs):
+            b"".join(data)
+            return MockedResponse(state=200, url=file_url("dog.webp"))
+
+        session_mock.post.side_effect = post
+        with open(str(test_image_2()), "rb") as fp:
+            uploaded_url = uplyfile.upload("dog.webp", fp)
+            assert uplyfile.get_file_url(fp) == uploaded_url
+
+        project_files_mock.assert_not_called()
+        assert uplyfile.cache_stats.hits == 1
+
+    @patch.object(Uplyfile, "iter_project_files")
+    def test_refresh_if_stale_skips_fresh_listing(self, project_files_mock, uplyfile):
+        project_files_mock.return_value = []
+
+        assert uplyfile.refresh_listing_if_stale()
+        assert uplyfile.refresh_listing_if_stale()
+        project_files_mock.assert_called_once()
+
+        later = time.time() + uplyfile.listing_max_age + 1
+        with patch("uplyfile_django.lib.uplyfile.time.time", return_value=later):
+            assert uplyfile.refresh_listing_if_stale()
+        assert project_files_mock.call_count == 2
+
+    def test_file_remembered_during_refresh_is_kept(self, uplyfile):
+        record = {"etag": "uploaded", "url": {"full": "https://uply/uploaded"}}
+
+        def listing(_):
+            # Uploaded by another thread while the listing is downloaded.
+            uplyfile._remember(record)
+            yield {"etag": "listed", "url": {"full": "https://uply/listed"}}
+
+        with patch.object(Uplyfile, "iter_project_files", listing):
+            uplyfile._refresh_listing(force=True)
+
+        assert uplyfile._cached_file_url("uploaded") == "https://uply/uploaded"
+        assert uplyfile._cached_file_url("listed") == "https://uply/listed"
+        assert uplyfile.url_listed_at("https://uply/uploaded") is not None
+
+    @patch.object(Uplyfile, "iter_project_files")
+    def test_cache_stats_count_hits_and_misses(self, project_files_mock, uplyfile):
+        project_files_mock.return_value = []
+        with open(str(test_image_2()), "rb") as fp:
+            for _ in range(4):
+                uplyfile.get_file_url(fp)
+
+        assert uplyfile.cache_stats.misses == 1
+        assert uplyfile.cache_stats.hits == 3
+        assert uplyfile.cache_stats.hit_rate == 0.75
+
 
 class TestListProjectFiles:
     @patch.object(Uplyfile, "_session")
@@ -171,3 +343,269 @@ class TestListProjectFiles:
         session_mock.get.return_value = MockedResponse(state=500)
         with pytest.raises(HTTPError):
             uplyfile.list_project_files()
+
+    @patch.object(Uplyfile, "_session")
+    def test_listing_is_streamed(self, session_mock, uplyfile):
+        session_mock.get.return_value = MockedResponse(json=project_files(None))
+
+        files = uplyfile.iter_project_files(chunk_size=7)
+
+        assert list(files) == project_files(None)
+        assert session_mock.get.call_args[1]["stream"]
+
+    @patch.object(Uplyfile, "_session")
+    def test_list_project_files_fills_the_cache(self, session_mock, uplyfile):
+        session_mock.get.return_value = MockedResponse(json=project_files(None))
+
+        assert uplyfile.list_project_files() == project_files(None)
+        assert uplyfile._cached_project_files_dict == {
+            "cc30f2e1a02160776f14d1718e4967de": project_files(None)[0]
+        }
+
+
+class CountingReader(io.BytesIO):
+    mode = "rb"
+
+    def __init__(self, data, seekable=True):
+        super().__init__(data)
+        self._seekable = seekable
+        self.bytes_read = 0
+
+    def seekable(self):
+        return self._seekable
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+class TestGetOrUpload:
+    def record(self, data, url="https://uplycdn.com/p/abc/file.txt"):
+        return {
+            "etag": hashlib.md5(data).hexdigest(),
+            "file_size_bytes": len(data),
+            "url": {"full": url},
+        }
+
+    @patch.object(Uplyfile, "iter_project_files")
+    @patch.object(Uplyfile, "_session")
+    def test_content_of_unknown_size_is_read_once(
+        self, session_mock, list_mock, uplyfile
+    ):
+        list_mock.return_value = [self.record(b"other content")]
+        session_mock.post.side_effect = lambda *args, data, **kwargs: (
+            b"".join(data),
+            MockedResponse(url="https://uply"),
+        )[1]
+        content = CountingReader(b"content")
+
+        assert uplyfile.get_or_upload("file.txt", content) == "https://uply"
+        assert content.bytes_read == len(b"content")
+        assert uplyfile._cached_record(hashlib.md5(b"content").hexdigest())
+
+    @patch.object(Uplyfile, "iter_project_files")
+    @patch.object(Uplyfile, "upload")
+    def test_known_content_is_not_uploaded(self, upload_mock, list_mock, uplyfile):
+        list_mock.return_value = [self.record(b"content")]
+
+        url = uplyfile.get_or_upload("file.txt", CountingReader(b"content"))
+
+        assert url == self.record(b"content")["url"]["full"]
+        upload_mock.assert_not_called()
+
+    @patch.object(Uplyfile, "iter_project_files")
+    @patch.object(Uplyfile, "upload")
+    def test_content_of_known_size_is_hashed_before_upload(
+        self, upload_mock, list_mock, uplyfile
+    ):
+        list_mock.return_value = [self.record(b"CONTENT")]
+        upload_mock.return_value = "https://uply"
+
+        content = CountingReader(b"content")
+
+        assert uplyfile.get_or_upload("file.txt", content) == "https://uply"
+        upload_mock.assert_called_once_with("file.txt", content)
+        # In-memory content is hashed from its buffer, without reads.
+        assert content.bytes_read == 0
+
+    @patch.object(Uplyfile, "iter_project_files")
+    @patch.object(Uplyfile, "upload")
+    def test_non_seekable_content_is_spooled_once(
+        self, upload_mock, list_mock, uplyfile
+    ):
+        list_mock.return_value = []
+        uploaded = []
+        upload_mock.side_effect = lambda name, content: uploaded.append(content.read())
+        content = CountingReader(b"content", seekable=False)
+
+        uplyfile.get_or_upload("file.txt", content)
+
+        assert uploaded == [b"content"]
+        assert content.bytes_read == len(b"content")
+
+
+class TestUploadMany:
+    @patch.object(Uplyfile, "iter_project_files")
+    @patch.object(Uplyfile, "upload")
+    def test_uploads_identical_content_once(self, upload_mock, list_mock, uplyfile):
+        list_mock.return_value = []
+        upload_mock.side_effect = lambda name, content: file_url(name)
+
+        with open(str(test_image()), "rb") as f_1, open(
+            str(test_image(other_name=True)), "rb"
+        ) as f_2, open(str(test_image_2()), "rb") as f_3:
+            results = uplyfile.upload_many(
+                [("a.webp", f_1), ("b.webp", f_2), ("c.webp", f_3)]
+            )
+
+        assert upload_mock.call_count == 2
+        assert [r.name for r in results] == ["a.webp", "b.webp", "c.webp"]
+        assert results[0].url == results[1].url == file_url("a.webp")
+        assert results[2].url == file_url("c.webp")
+        assert all(r.error is None for r in results)
+
+    @patch.object(Uplyfile, "upload")
+    def test_skips_content_from_etag_cache(self, upload_mock, uplyfile):
+        with open(str(test_image_2()), "rb") as f:
+            etag = uplyfile._md5sum(f)
+            uplyfile._cached_project_files_dict = {
+                etag: {"etag": etag, "url": {"full": file_url("dog.webp")}}
+            }
+            (result,) = uplyfile.upload_many([("dog.webp", f)])
+
+        upload_mock.assert_not_called()
+        assert result.url == file_url("dog.webp")
+
+    @patch.object(Uplyfile, "iter_project_files", lambda _: [])
+    @patch.object(Uplyfile, "upload")
+    def test_reports_failures_per_item(self, upload_mock, uplyfile):
+        upload_mock.side_effect = [file_url("ok.webp"), HTTPError("500")]
+
+        with open(str(test_image()), "rb") as f_1, open(
+            str(test_image_2()), "rb"
+        ) as f_2, open(str(test_image_2()), "r") as f_3:
+            results = uplyfile.upload_many(
+                [("ok.webp", f_1), ("bad.webp", f_2), ("text.webp", f_3)],
+                max_workers=1,
+            )
+
+        assert results[0].url == file_url("ok.webp") and results[0].error is None
+        assert results[1].url is None and isinstance(results[1].error, HTTPError)
+        assert results[2].url is None and isinstance(results[2].error, ValueError)
+
+
+class TestAsyncUplyfile:
+    @patch.object(AsyncUplyfile, "_client")
+    def test_list_project_files_groups_by_etag(self, client_mock, api_keys):
+        uply = AsyncUplyfile(*api_keys)
+        client_mock.stream.return_value = AsyncResponse(
+            200, json_module.dumps(project_files(None)).encode("utf-8")
+        )
+
+        files = asyncio.run(uply.list_project_files())
+
+        assert files == project_files(None)
+        assert "cc30f2e1a02160776f14d1718e4967de" in uply._cached_project_files_dict
+        headers = client_mock.stream.call_args[1]["headers"]
+        assert headers["Uply-Signature"] == uply._gen_signature(headers["Uply-Expires"])
+
+    @patch.object(AsyncUplyfile, "_client")
+    def test_raises_auth_exception_on_403(self, client_mock, api_keys):
+        uply = AsyncUplyfile(*api_keys)
+        client_mock.stream.return_value = AsyncResponse(403, b"")
+
+        with pytest.raises(AuthException):
+            asyncio.run(uply.list_project_files())
+
+    @patch.object(AsyncUplyfile, "iter_project_files")
+    def test_concurrent_get_file_url_lists_project_files_once(
+        self, project_files_mock, api_keys
+    ):
+        uply = AsyncUplyfile(*api_keys)
+
+        async def iter_project_files():
+            await asyncio.sleep(0.01)
+            for project_file in project_files(None):
+                yield project_file
+
+        project_files_mock.side_effect = iter_project_files
+
+        async def lookup():
+            with open(str(test_image_2()), "rb") as fp:
+                return await uply.get_file_url(fp)
+
+        async def lookup_many():
+            return await asyncio.gather(*(lookup() for _ in range(20)))
+
+        assert asyncio.run(lookup_many()) == [None] * 20
+        project_files_mock.assert_called_once()
+
+    @patch.object(AsyncUplyfile, "_client")
+    def test_file_exists_uses_head_for_querying(self, client_mock, api_keys):
+        uply = AsyncUplyfile(*api_keys)
+        client_mock.head = AsyncMock(return_value=MockedResponse(state=200))
+
+        assert asyncio.run(uply.file_exists(file_url("test")))
+        client_mock.head.assert_called_once()
+        assert client_mock.head.call_args[0] == (file_url("test"),)
+        assert client_mock.head.call_args[1]["timeout"].read == transport.timeout()[1]
+
+    @patch.object(AsyncUplyfile, "_client")
+    def test_upload_streams_body_and_remembers_file(self, client_mock, api_keys):
+        uply = AsyncUplyfile(*api_keys)
+        bodies = []
+
+        async def post(url, headers, content, **kwargs):
+            bodies.append(b"".join([chunk async for chunk in content]))
+            assert int(headers["Content-Length"]) == len(bodies[-1])
+            return MockedResponse(state=200, url=file_url("file.txt"))
+
+        client_mock.post = AsyncMock(side_effect=post)
+
+        url = asyncio.run(uply.upload("file.txt", io.BytesIO(b"content")))
+
+        assert url == file_url("file.txt")
+        assert b"content" in bodies[0]
+        etag = hashlib.md5(b"content").hexdigest()
+        assert uply._cached_file_url(etag) == url
+
+    @patch.object(AsyncUplyfile, "_client")
+    def test_failed_upload_found_in_listing_is_not_repeated(
+        self, client_mock, api_keys
+    ):
+        uply = AsyncUplyfile(*api_keys, retry_policy=RetryPolicy(backoff=0))
+        url = file_url("file.txt")
+
+        async def post(url, headers, content, **kwargs):
+            [chunk async for chunk in content]
+            return MockedResponse(state=503)
+
+        async def iter_project_files(_):
+            yield {"etag": hashlib.md5(b"content").hexdigest(), "url": {"full": url}}
+
+        client_mock.post = AsyncMock(side_effect=post)
+        with patch.object(AsyncUplyfile, "iter_project_files", iter_project_files):
+            assert asyncio.run(uply.upload("file.txt", io.BytesIO(b"content"))) == url
+
+        client_mock.post.assert_called_once()
+
+    @patch.object(AsyncUplyfile, "_client")
+    def test_failed_upload_is_retried(self, client_mock, api_keys):
+        uply = AsyncUplyfile(*api_keys, retry_policy=RetryPolicy(backoff=0))
+        statuses = iter([503, 200])
+
+        async def post(url, headers, content, **kwargs):
+            [chunk async for chunk in content]
+            return MockedResponse(state=next(statuses), url=file_url("file.txt"))
+
+        async def iter_project_files(_):
+            return
+            yield
+
+        client_mock.post = AsyncMock(side_effect=post)
+        with patch.object(AsyncUplyfile, "iter_project_files", iter_project_files):
+            url = asyncio.run(uply.upload("file.txt", io.BytesIO(b"content")))
+
+        assert url == file_url("file.txt")
+        assert client_mock.post.call_count == 2
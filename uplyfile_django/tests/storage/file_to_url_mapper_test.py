@@ -64,3 +64,46 @@ class TestFileToUrlMapper:
         non_existent = "not existing filename"
         with pytest.raises(KeyError, match=f".* {non_existent} .*"):
             assert mapper.get(non_existent)
+
+    def test_flush_writes_mappings_file(self, mapper, mappings_file):
+        mapper.save("img.jpg", "someurl/img.jpg")
+        mapper.flush()
+
+        with open(mappings_file) as f:
+            assert json.load(f) == {"img.jpg": "someurl/img.jpg"}
+
+
+class TestNamesIndex:
+    @pytest.fixture(params=["json", "sqlite", "log"])
+    def mapper(self, request, tmp_path):
+        mapper = FileToUrlMapper(str(tmp_path / "map"), backend=request.param)
+        mapper.save_many(
+            {
+                name: f"url/{name}"
+                for name in ("a.txt", "a/b.txt", "a/c/d.txt", "a0.txt", "b.txt")
+            }
+        )
+        return mapper
+
+    def test_names_with_prefix_are_sorted(self, mapper):
+        assert list(mapper.names("a/")) == ["a/b.txt", "a/c/d.txt"]
+        assert list(mapper.names("c")) == []
+
+    def test_index_follows_saves_and_removals(self, mapper):
+        list(mapper.names())
+        mapper.save("a/a.txt", "url")
+        mapper.remove("a/b.txt")
+
+        assert list(mapper.names("a/")) == ["a/a.txt", "a/c/d.txt"]
+
+    def test_listdir_lists_direct_children(self, mapper):
+        assert mapper.listdir("") == (["a"], ["a.txt", "a0.txt", "b.txt"])
+        assert mapper.listdir("a") == (["c"], ["b.txt"])
+        assert mapper.listdir("a/c/") == ([], ["d.txt"])
+        assert mapper.listdir("missing") == ([], [])
+
+    def test_get_many_returns_only_mapped_names(self, mapper):
+        assert mapper.get_many(["a.txt", "missing", "b.txt"]) == {
+            "a.txt": "url/a.txt",
+            "b.txt": "url/b.txt",
+        }
@@ -0,0 +1,186 @@
+import json
+import multiprocessing
+import os
+import stat
+from unittest.mock import patch
+
+import pytest
+
+from uplyfile_django.storage.mapping_backends import (
+    JsonMappingBackend,
+    LogMappingBackend,
+    SqliteMappingBackend,
+)
+
+
+def _save_range(path, start, count):
+    backend = SqliteMappingBackend(path)
+    for i in range(start, start + count):
+        backend.set_many({f"file-{i}": f"url-{i}"})
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "mappings.sqlite3")
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+class TestJsonMappingBackend:
+    def test_new_file_gets_mode_from_umask(self, tmp_path):
+        path = str(tmp_path / "mappings.json")
+        umask = os.umask(0o022)
+        try:
+            JsonMappingBackend(path).flush()
+        finally:
+            os.umask(umask)
+
+        assert mode(path) == 0o644
+
+    def test_flush_keeps_mode_of_file(self, tmp_path):
+        path = tmp_path / "mappings.json"
+        path.write_text("{}")
+        os.chmod(str(path), 0o640)
+
+        JsonMappingBackend(str(path)).flush()
+
+        assert mode(str(path)) == 0o640
+
+    def test_failed_flush_removes_temporary_file(self, tmp_path):
+        backend = JsonMappingBackend(str(tmp_path / "mappings.json"))
+
+        with patch("json.dump", side_effect=IOError("No space left on device")):
+            backend.flush()
+
+        assert os.listdir(str(tmp_path)) == []
+
+
+class TestSqliteMappingBackend:
+    def test_saved_mappings_are_visible_without_flush(self, path):
+        SqliteMappingBackend(path).set_many({"a.txt": "url/a", "b.txt": "url/b"})
+
+        backend = SqliteMappingBackend(path)
+
+        assert backend.get("a.txt") == "url/a"
+        assert "b.txt" in backend
+        assert backend.get("missing") is None
+
+    def test_initial_mappings_dont_override_saved_ones(self, path):
+        SqliteMappingBackend(path).set_many({"a.txt": "saved"})
+
+        backend = SqliteMappingBackend(path, {"a.txt": "initial", "b.txt": "initial"})
+
+        assert backend.mappings == {"a.txt": "saved", "b.txt": "initial"}
+
+    def test_remove_returns_removed_url(self, path):
+        backend = SqliteMappingBackend(path)
+        backend.set_many({"a.txt": "url/a"})
+
+        assert backend.remove("a.txt") == "url/a"
+        assert backend.remove("a.txt") is None
+        assert backend.mappings == {}
+
+    def test_get_many_queries_in_batches(self, path):
+        backend = SqliteMappingBackend(path)
+        backend.set_many({f"file-{i}": f"url-{i}" for i in range(1200)})
+
+        found = backend.get_many([f"file-{i}" for i in range(0, 1300, 2)], 100)
+
+        assert len(found) == 600
+        assert found["file-1198"] == "url-1198"
+
+    def test_processes_write_concurrently(self, path):
+        SqliteMappingBackend(path)
+        processes = [
+            multiprocessing.Process(target=_save_range, args=(path, i * 50, 50))
+            for i in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        assert len(SqliteMappingBackend(path).mappings) == 200
+
+
+class TestLogMappingBackend:
+    def test_saves_are_replayed_without_flush(self, path):
+        backend = LogMappingBackend(path)
+        backend.set_many({"a.txt": "url/a", "b.txt": "url/b"})
+        backend.set_many({"a.txt": "url/a2"})
+        backend.remove("b.txt")
+
+        assert LogMappingBackend(path).mappings == {"a.txt": "url/a2"}
+
+    def test_save_appends_one_line(self, path):
+        backend = LogMappingBackend(path)
+        backend.set_many({"a.txt": "url/a"})
+        size = os.path.getsize(path)
+
+        backend.set_many({"b.txt": "url/b"})
+
+        with open(path, "rb") as f:
+            f.seek(size)
+            assert f.read() == b'["b.txt","url/b"]\n'
+
+    def test_torn_last_line_is_skipped(self, path):
+        LogMappingBackend(path).set_many({"a.txt": "url/a"})
+        with open(path, "ab") as f:
+            f.write(b'["b.txt","ur')
+
+        backend = LogMappingBackend(path)
+        backend.set_many({"c.txt": "url/c"})
+
+        assert LogMappingBackend(path).mappings == {"a.txt": "url/a", "c.txt": "url/c"}
+
+    def test_reads_json_mappings_file(self, path):
+        with open(path, "w") as f:
+            json.dump({"a.txt": "url/a"}, f)
+
+        LogMappingBackend(path).set_many({"b.txt": "url/b"})
+
+        assert LogMappingBackend(path).mappings == {"a.txt": "url/a", "b.txt": "url/b"}
+
+    def test_dead_records_are_compacted(self, path):
+        backend = LogMappingBackend(path, compact_threshold=10)
+        for i in range(20):
+            backend.set_many({"a.txt": f"url/{i}"})
+        backend.close()
+
+        with open(path) as f:
+            lines = f.read().splitlines()
+        assert len(lines) < 20
+        assert LogMappingBackend(path).mappings == {"a.txt": "url/19"}
+
+    def test_compaction_keeps_records_of_other_writers(self, path):
+        backend = LogMappingBackend(path, compact_threshold=1000)
+        other = LogMappingBackend(path)
+        for i in range(5):
+            backend.set_many({"a.txt": f"url/{i}"})
+        other.set_many({"b.txt": "url/b"})
+
+        backend.compact()
+        other.set_many({"c.txt": "url/c"})
+
+        assert LogMappingBackend(path).mappings == {
+            "a.txt": "url/4",
+            "b.txt": "url/b",
+            "c.txt": "url/c",
+        }
+
+    def test_flush_after_close_does_nothing(self, path):
+        backend = LogMappingBackend(path)
+        backend.close()
+
+        backend.flush()
+
+    def test_compaction_keeps_mode_of_log(self, path):
+        backend = LogMappingBackend(path, compact_threshold=1000)
+        backend.set_many({"a.txt": "url/a"})
+        os.chmod(path, 0o640)
+
+        backend.compact()
+
+        assert mode(path) == 0o640
@@ -0,0 +1,180 @@
+import pytest
+
+from uplyfile_django.storage.remote_file import RangeFile, StreamedFile
+
+CONTENT = b"first line\nsecond line\n" + b"x" * 1000
+
+
+class Response:
+    def __init__(self, content=CONTENT, chunk_size=10, headers=None):
+        self.headers = headers or {}
+        self.closed = False
+        self.pulled = 0
+        self._content = content
+        self._chunk_size = chunk_size
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self._content), self._chunk_size):
+            self.pulled += 1
+            yield self._content[start : start + self._chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def response():
+    return Response()
+
+
+def streamed(response, spool_max_size=1024 * 1024):
+    return StreamedFile(response, "file.bin", spool_max_size)
+
+
+def test_reads_receive_only_what_is_needed(response):
+    f = streamed(response)
+
+    assert f.read(15) == CONTENT[:15]
+    assert response.pulled == 2
+    assert f.read() == CONTENT[15:]
+    assert response.closed
+
+
+def test_chunks_are_yielded_as_they_arrive(response):
+    chunks = streamed(response).chunks(chunk_size=10)
+
+    assert next(chunks) == CONTENT[:10]
+    assert response.pulled == 1
+    assert b"".join(chunks) == CONTENT[10:]
+
+
+def test_readline_and_iteration(response):
+    f = streamed(response)
+
+    assert f.readline() == b"first line\n"
+    assert f.readline() == b"second line\n"
+    f.seek(0)
+    assert list(f)[:2] == [b"first line\n", b"second line\n"]
+
+
+def test_seek_receives_up_to_the_position(response):
+    f = streamed(response)
+
+    f.seek(100)
+    assert response.pulled == 10
+    assert f.read(5) == CONTENT[100:105]
+    f.seek(0)
+    assert f.read(5) == CONTENT[:5]
+    assert f.seek(0, 2) == len(CONTENT)
+
+
+def test_large_file_is_spilled_to_disk(response):
+    f = streamed(response, spool_max_size=100)
+
+    assert f.read() == CONTENT
+    assert f.file._rolled
+
+
+def test_size_comes_from_content_length_without_receiving():
+    response = Response(headers={"Content-Length": str(len(CONTENT))})
+
+    assert streamed(response).size == len(CONTENT)
+    assert response.pulled == 0
+
+
+def test_size_without_content_length_receives_everything(response):
+    assert streamed(response).size == len(CONTENT)
+    assert response.closed
+
+
+class Remote:
+    def __init__(self, content=CONTENT):
+        self.content = content
+        self.fetched = []
+
+    def fetch(self, start, end):
+        self.fetched.append((start, end))
+        return self.content[start : end + 1]
+
+
+@pytest.fixture
+def remote():
+    return Remote()
+
+
+def ranged(remote, block_size=100, cache_blocks=4, first_block=None):
+    return RangeFile(
+        remote.fetch,
+        "file.bin",
+        len(remote.content),
+        block_size,
+        cache_blocks,
+        first_block,
+    )
+
+
+class TestRangeFile:
+    def test_only_blocks_read_are_fetched(self, remote):
+        f = ranged(remote)
+
+        f.seek(250)
+        assert f.read(10) == CONTENT[250:260]
+        assert remote.fetched == [(200, 299)]
+
+    def test_cached_blocks_are_not_fetched_again(self, remote):
+        f = ranged(remote, first_block=CONTENT[:100])
+
+        assert f.read(50) == CONTENT[:50]
+        f.seek(10)
+        assert f.read(80) == CONTENT[10:90]
+        assert remote.fetched == []
+
+    def test_least_recently_used_blocks_are_evicted(self, remote):
+        f = ranged(remote, cache_blocks=2)
+        for position in (0, 500, 900, 0):
+            f.seek(position)
+            f.read(1)
+
+        assert remote.fetched == [(0, 99), (500, 599), (900, 999), (0, 99)]
+
+    def test_sequential_reads_fetch_ahead(self, remote):
+        f = ranged(remote, cache_blocks=8)
+
+        data = b"".join(iter(lambda: f.read(100), b""))
+
+        assert data == CONTENT
+        assert remote.fetched == [
+            (0, 99),
+            (100, 299),
+            (300, 699),
+            (700, 1022),
+        ]
+
+    def test_read_larger_than_the_cache(self, remote):
+        f = ranged(remote, cache_blocks=2)
+
+        assert f.read() == CONTENT
+        assert remote.fetched == [(0, 1022)]
+
+    def test_readline_and_seek_from_end(self, remote):
+        f = ranged(remote, block_size=8)
+
+        assert f.readline() == b"first line\n"
+        assert f.readline() == b"second line\n"
+        assert f.seek(-3, 2) == len(CONTENT) - 3
+        assert f.read() == b"xxx"
+        assert f.read() == b""
+
+    def test_empty_file(self):
+        f = ranged(Remote(b""))
+
+        assert f.read() == b""
+        assert f.size == 0
+
+    def test_closed_file_cant_be_read(self, remote):
+        f = ranged(remote)
+        f.close()
+
+        assert f.closed
+        with pytest.raises(ValueError):
+            f.read()
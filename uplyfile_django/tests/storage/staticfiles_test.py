@@ -0,0 +1,137 @@
+import io
+import json
+import os
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from uplyfile_django.emulator.pytest_plugin import (  # noqa: F401
+    PUBLIC_KEY,
+    SECRET_KEY,
+    uplyfile_emulator,
+)
+from uplyfile_django.storage.staticfiles import UplyfileStaticStorage
+
+HOUR_AGO = 1_600_000_000
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    root = tmp_path / "static"
+    (root / "css").mkdir(parents=True)
+    for name, content in [
+        ("css/site.css", b"body {}"),
+        ("css/copy.css", b"body {}"),
+        ("app.js", b"alert(1)"),
+    ]:
+        (root / name).write_bytes(content)
+        os.utime(str(root / name), (HOUR_AGO, HOUR_AGO))
+    return root
+
+
+@pytest.fixture
+def collectstatic(uplyfile_emulator, static_dir, tmp_path):  # noqa: F811
+    options = {
+        "BASE_API_URL": uplyfile_emulator.api_url,
+        "PUBLIC_KEY": PUBLIC_KEY,
+        "SECRET_KEY": SECRET_KEY,
+        "MAPPINGS_FILE": str(tmp_path / "mappings.json"),
+        "STATIC_MANIFEST_FILE": str(tmp_path / "manifest.json"),
+        "MAX_RETRIES": 0,
+    }
+    storages = {
+        "staticfiles": {
+            "BACKEND": "uplyfile_django.storage.staticfiles.UplyfileStaticStorage"
+        }
+    }
+
+    def run():
+        stdout = io.StringIO()
+        with override_settings(
+            UPLYFILE_STORAGE=options,
+            STORAGES=storages,
+            STATICFILES_DIRS=[str(static_dir)],
+            STATIC_URL="/static/",
+            INSTALLED_APPS=["uplyfile_django", "django.contrib.staticfiles"],
+        ):
+            call_command("collectstatic", interactive=False, verbosity=1, stdout=stdout)
+        return stdout.getvalue()
+
+    return run
+
+
+def test_collectstatic_uploads_changed_files_in_one_batch(
+    collectstatic, uplyfile_emulator, tmp_path  # noqa: F811
+):
+    output = collectstatic()
+
+    assert "3 static files copied" in output
+    assert len(uplyfile_emulator.files) == 2
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    mappings = json.loads((tmp_path / "mappings.json").read_text())
+    assert set(manifest) == {"app.js", "css/copy.css", "css/site.css"}
+    assert manifest["css/site.css"]["url"] == manifest["css/copy.css"]["url"]
+    assert manifest["app.js"]["mtime"] == HOUR_AGO
+    assert mappings["app.js"] == manifest["app.js"]["url"]
+
+
+def test_unmodified_files_are_skipped_without_requests(
+    collectstatic, uplyfile_emulator, static_dir  # noqa: F811
+):
+    collectstatic()
+    uplyfile_emulator.error_rate = 1
+
+    output = collectstatic()
+
+    assert "0 static files copied" in output
+    assert "3 unmodified" in output
+
+
+def test_touched_files_with_same_content_are_not_uploaded(
+    collectstatic, uplyfile_emulator, static_dir, tmp_path  # noqa: F811
+):
+    collectstatic()
+    os.utime(str(static_dir / "app.js"), (HOUR_AGO + 60, HOUR_AGO + 60))
+    uplyfile_emulator.error_rate = 1
+
+    output = collectstatic()
+
+    assert "1 static file copied" in output
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert manifest["app.js"]["mtime"] == HOUR_AGO + 60
+
+
+def test_modified_file_is_uploaded(
+    collectstatic, uplyfile_emulator, static_dir, tmp_path  # noqa: F811
+):
+    collectstatic()
+    (static_dir / "app.js").write_bytes(b"alert(2)")
+
+    collectstatic()
+
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert len(uplyfile_emulator.files) == 3
+    assert manifest["app.js"]["url"].endswith("/app.js")
+    assert manifest["app.js"]["etag"] in uplyfile_emulator.files
+
+
+def test_manifest_answers_exists_and_url(
+    collectstatic, uplyfile_emulator, tmp_path  # noqa: F811
+):
+    collectstatic()
+
+    with override_settings(
+        UPLYFILE_STORAGE={
+            "PUBLIC_KEY": PUBLIC_KEY,
+            "SECRET_KEY": SECRET_KEY,
+            "MAPPINGS_FILE": str(tmp_path / "mappings.json"),
+            "STATIC_MANIFEST_FILE": str(tmp_path / "manifest.json"),
+        }
+    ):
+        storage = UplyfileStaticStorage()
+
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert storage.exists("app.js")
+    assert not storage.exists("missing.js")
+    assert storage.url("app.js") == manifest["app.js"]["url"]
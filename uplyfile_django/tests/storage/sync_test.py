@@ -0,0 +1,139 @@
+import io
+import json
+
+import pytest
+from django.test import override_settings
+
+from uplyfile_django import __main__ as cli
+from uplyfile_django.emulator.pytest_plugin import (  # noqa: F401
+    PUBLIC_KEY,
+    SECRET_KEY,
+    uplyfile_emulator,
+)
+from uplyfile_django.storage import UplyfileStorage, sync
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "static"
+    (root / "css").mkdir(parents=True)
+    (root / "css" / "site.css").write_bytes(b"body {}")
+    (root / "css" / "copy.css").write_bytes(b"body {}")
+    (root / "app.js").write_bytes(b"alert(1)")
+    (root / "logo.txt").write_bytes(b"logo")
+    return root
+
+
+@pytest.fixture
+def settings_for(uplyfile_emulator, tmp_path):  # noqa: F811
+    with override_settings(
+        UPLYFILE_STORAGE={
+            "BASE_API_URL": uplyfile_emulator.api_url,
+            "PUBLIC_KEY": PUBLIC_KEY,
+            "SECRET_KEY": SECRET_KEY,
+            "MAPPINGS_FILE": str(tmp_path / "mappings.json"),
+            "MAX_RETRIES": 0,
+        }
+    ):
+        yield tmp_path / "mappings.json"
+
+
+@pytest.fixture
+def storage(settings_for):
+    return UplyfileStorage()
+
+
+def test_walk_yields_sorted_relative_names(tree):
+    assert [name for name, _ in sync.walk(str(tree), "static/")] == [
+        "static/app.js",
+        "static/logo.txt",
+        "static/css/copy.css",
+        "static/css/site.css",
+    ]
+
+
+def test_plan_finds_uploaded_content(storage, tree, uplyfile_emulator):  # noqa: F811
+    record = uplyfile_emulator.store("logo.txt", b"logo")
+
+    entries = {entry.name: entry for entry in sync.plan(storage, str(tree))}
+
+    assert entries["logo.txt"].url == record["url"]["full"]
+    assert entries["app.js"].url is None
+    assert [entry.name for entry in sync.transfers(entries.values())] == [
+        "app.js",
+        "css/copy.css",
+    ]
+
+
+def test_sync_uploads_missing_content_once_and_writes_mappings(
+    storage, tree, settings_for, uplyfile_emulator  # noqa: F811
+):
+    uplyfile_emulator.store("logo.txt", b"logo")
+    entries = sync.plan(storage, str(tree))
+    stream = io.StringIO()
+
+    result = sync.sync(
+        storage, entries, progress=sync.Progress(stream, sync.transfers(entries))
+    )
+
+    assert result.uploaded == ["app.js", "css/copy.css"]
+    assert result.present == ["logo.txt", "css/site.css"]
+    assert result.failed == []
+    assert len(uplyfile_emulator.files) == 3
+    assert stream.getvalue().count("\n") == 2
+    mappings = json.loads(settings_for.read_text())
+    assert set(mappings) == {"app.js", "logo.txt", "css/copy.css", "css/site.css"}
+    assert mappings["css/copy.css"] == mappings["css/site.css"]
+
+
+def test_failed_uploads_are_reported_and_not_mapped(
+    storage, tree, settings_for, uplyfile_emulator  # noqa: F811
+):
+    entries = sync.plan(storage, str(tree))
+    uplyfile_emulator.error_rate = 1
+
+    result = sync.sync(storage, entries)
+
+    assert sorted(name for name, _ in result.failed) == [
+        "app.js",
+        "css/copy.css",
+        "css/site.css",
+        "logo.txt",
+    ]
+    assert json.loads(settings_for.read_text()) == {}
+
+
+class TestCommand:
+    def run(self, *argv):
+        stdout = io.StringIO()
+        status = cli.run_sync(cli.parse_args(argv), stdout)
+        return status, stdout.getvalue()
+
+    def test_dry_run_lists_transfers_without_uploading(
+        self, settings_for, tree, uplyfile_emulator  # noqa: F811
+    ):
+        status, output = self.run("sync", str(tree), "--dry-run", "--prefix", "s/")
+
+        assert status == 0
+        assert output.splitlines() == [
+            "4 files, 3 to upload (0.0 MiB)",
+            "upload s/app.js (0.0 MiB)",
+            "upload s/logo.txt (0.0 MiB)",
+            "upload s/css/copy.css (0.0 MiB)",
+        ]
+        assert uplyfile_emulator.files == {}
+        assert not settings_for.exists() or json.loads(settings_for.read_text()) == {}
+
+    def test_sync_reports_summary(
+        self, settings_for, tree, uplyfile_emulator, tmp_path  # noqa: F811
+    ):
+        mappings_file = tmp_path / "other.json"
+
+        status, output = self.run(
+            "sync", str(tree), "--mappings-file", str(mappings_file)
+        )
+
+        assert status == 0
+        assert "Uploaded 3 files" in output
+        assert "1 already present, 0 failed" in output
+        assert len(json.loads(mappings_file.read_text())) == 4
@@ -1,14 +1,22 @@
+import time
 from io import BytesIO
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 import pytest
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
-from django.core.files.base import ContentFile
+from django.core.files.base import File
 from django.test import override_settings
 from requests import HTTPError
 
+from uplyfile_django.emulator.pytest_plugin import (  # noqa: F401
+    PUBLIC_KEY,
+    SECRET_KEY,
+    uplyfile_emulator,
+)
+from uplyfile_django.lib.uplyfile import Uplyfile
 from uplyfile_django.storage import UplyfileStorage
+from uplyfile_django.storage.remote_file import RangeFile
 
 
 @pytest.fixture
@@ -22,6 +30,7 @@ def file_url(name):
 
 class MockedResponse:
     def __init__(self, state=404):
+        self.headers = {}
         if state == 404:
             self.status_code = 404
             self.content = "\xde\xad"
@@ -40,18 +49,24 @@ class MockedResponse:
         if self.status_code != 200:
             raise HTTPError(f"Status code: {self.status_code}")
 
+    def iter_content(self, chunk_size):
+        return iter([self.content.encode("latin-1")])
+
+    def close(self):
+        pass
+
 
 class TestStorage:
     @override_settings(UPLYFILE_STORAGE={})
-    def test_creating_storage_without_pub_or_secret_keys_should_raise(self):
+    def test_creating_storage_without_pub_or_secret_keys_should_raise(self, tmp_path):
         with pytest.raises(ImproperlyConfigured):
-            UplyfileStorage()
+            UplyfileStorage(mappings_file=tmp_path / "mappings.json")
 
     @override_settings()
-    def test_creating_storage_without_UPLYFILE_STORAGE_should_raise(self):
+    def test_creating_storage_without_UPLYFILE_STORAGE_should_raise(self, tmp_path):
         del settings.UPLYFILE_STORAGE
         with pytest.raises(ImproperlyConfigured):
-            UplyfileStorage()
+            UplyfileStorage(mappings_file=tmp_path / "mappings.json")
 
     def test_exists_return_false_when_file_not_mapped(self, storage):
         assert not storage.exists("any_file")
@@ -61,6 +76,7 @@ class TestStorage:
         self, uply_mock, storage
     ):
         uply_mock.file_exists.return_value = False
+        uply_mock.url_listed_at.return_value = None
         storage.uplyfile = uply_mock
 
         storage.mapper.save("uploaded", "https://uplycdn.com/project/file/file.png")
@@ -70,6 +86,7 @@ class TestStorage:
     @patch("uplyfile_django.storage.Uplyfile")
     def test_exists_returns_true_when_file_mapped_and_hosted(self, uply_mock, storage):
         uply_mock.file_exists.return_value = True
+        uply_mock.url_listed_at.return_value = None
         storage.uplyfile = uply_mock
 
         storage.mapper.save(
@@ -87,6 +104,71 @@ class TestStorage:
         assert not storage.exists("polydactyl_cat")
         uply_mock.file_exists.assert_not_called()
 
+    @patch("uplyfile_django.storage.Uplyfile")
+    def test_exists_is_answered_from_fresh_listing(self, uply_mock, storage):
+        uply_mock.url_listed_at.return_value = time.time() - 10
+        storage.uplyfile = uply_mock
+
+        storage.mapper.save("cat", file_url("cat"))
+
+        assert storage.exists("cat")
+        uply_mock.url_listed_at.assert_called_once_with(file_url("cat"))
+        uply_mock.file_exists.assert_not_called()
+
+    @patch("uplyfile_django.storage.Uplyfile")
+    def test_exists_is_verified_once_per_ttl(self, uply_mock, storage):
+        uply_mock.url_listed_at.return_value = time.time() - storage.exists_ttl - 1
+        uply_mock.file_exists.return_value = True
+        storage.uplyfile = uply_mock
+
+        storage.mapper.save("cat", file_url("cat"))
+
+        assert storage.exists("cat")
+        assert storage.exists("cat")
+        uply_mock.file_exists.assert_called_once_with(file_url("cat"))
+
+        later = time.time() + storage.exists_ttl + 1
+        with patch("uplyfile_django.storage.time.time", return_value=later):
+            assert storage.exists("cat")
+        assert uply_mock.file_exists.call_count == 2
+
+    @patch("uplyfile_django.storage.Uplyfile")
+    def test_exists_many_downloads_listing_once_for_stale_names(
+        self, uply_mock, storage
+    ):
+        listed = {}
+        uply_mock.url_listed_at.side_effect = listed.get
+        uply_mock.refresh_listing_if_stale.side_effect = lambda: listed.update(
+            {file_url("a"): time.time(), file_url("b"): time.time()}
+        )
+        uply_mock.file_exists.return_value = False
+        storage.uplyfile = uply_mock
+        storage.exists_listing_threshold = 3
+        for name in ("a", "b", "c"):
+            storage.mapper.save(name, file_url(name))
+
+        assert storage.exists_many(["a", "b", "c", "unmapped"]) == {
+            "a": True,
+            "b": True,
+            "c": False,
+            "unmapped": False,
+        }
+        uply_mock.refresh_listing_if_stale.assert_called_once_with()
+        uply_mock.file_exists.assert_called_once_with(file_url("c"))
+
+    @patch("uplyfile_django.storage.Uplyfile")
+    def test_exists_many_below_threshold_uses_head_requests(self, uply_mock, storage):
+        uply_mock.url_listed_at.return_value = None
+        uply_mock.file_exists.return_value = True
+        storage.uplyfile = uply_mock
+        storage.exists_listing_threshold = 3
+        for name in ("a", "b"):
+            storage.mapper.save(name, file_url(name))
+
+        assert storage.exists_many(["a", "b"]) == {"a": True, "b": True}
+        uply_mock.refresh_listing_if_stale.assert_not_called()
+        assert uply_mock.file_exists.call_count == 2
+
     def test_url_returns_url_associated_with_given_name(self, storage):
         storage.mapper.save("some_url", "name")
         assert storage.url("some_url") == "name"
@@ -108,8 +190,7 @@ class TestStoreRetrieveFiles:
     @patch("uplyfile_django.storage.Uplyfile")
     def test_saving_new_file_returns_name(self, uply_mock, storage):
         NAME = "example"
-        uply_mock.get_file_url.return_value = None
-        uply_mock.upload.return_value = file_url(NAME)
+        uply_mock.get_or_upload.return_value = file_url(NAME)
         storage.uplyfile = uply_mock
 
         from_save = storage._save(NAME, BytesIO())
@@ -121,8 +202,7 @@ class TestStoreRetrieveFiles:
         self, uply_mock, tmp_path, storage
     ):
         NAME = "example"
-        uply_mock.get_file_url.return_value = None
-        uply_mock.upload.return_value = file_url(NAME)
+        uply_mock.get_or_upload.return_value = file_url(NAME)
         storage.uplyfile = uply_mock
 
         file = tmp_path / NAME
@@ -149,7 +229,7 @@ class TestStoreRetrieveFiles:
         req_mock.get.assert_called_once()
 
     @patch.object(UplyfileStorage, "_session")
-    def test_opening_mapped_and_uploaded_file_should_return_content_file(
+    def test_opening_mapped_and_uploaded_file_should_return_streamed_file(
         self, req_mock, storage
     ):
         NAME = "existing"
@@ -157,6 +237,227 @@ class TestStoreRetrieveFiles:
         storage.mapper.save(NAME, file_url(NAME))
 
         f = storage._open(NAME)
-        assert isinstance(f, ContentFile)
+        assert isinstance(f, File)
+        assert f.read() == b"\xca\xfe\xba\xbe"
 
         req_mock.get.assert_called_once()
+
+    @patch("uplyfile_django.lib.retry.time.sleep")
+    @patch.object(UplyfileStorage, "_session")
+    def test_failed_streamed_response_is_closed_before_retry(
+        self, req_mock, sleep_mock, storage
+    ):
+        failed = Mock(status_code=503, headers={})
+        req_mock.get.side_effect = [failed, MockedResponse(state=200)]
+        storage.mapper.save("existing", file_url("existing"))
+
+        assert storage._open("existing").read() == b"\xca\xfe\xba\xbe"
+
+        assert req_mock.get.call_count == 2
+        failed.close.assert_called_once_with()
+
+
+class TestRangeReads:
+    @pytest.fixture
+    def record(self, uplyfile_emulator, storage):  # noqa: F811
+        record = uplyfile_emulator.store("file.bin", bytes(range(256)) * 4096)
+        storage.mapper.save("file.bin", record["url"]["full"])
+        return record
+
+    def test_reading_the_header_downloads_the_first_block_only(self, storage, record):
+        with patch.object(
+            UplyfileStorage, "_get", autospec=True, side_effect=UplyfileStorage._get
+        ) as get_mock:
+            f = storage._open("file.bin")
+            header = f.read(16)
+            f.seek(100)
+            f.read(100)
+
+        assert isinstance(f, RangeFile)
+        assert header == bytes(range(16))
+        assert f.size == 256 * 4096
+        get_mock.assert_called_once()
+
+    def test_whole_file_is_read(self, storage, record):
+        f = storage._open("file.bin")
+        f.seek(storage.open_block_size * 2 + 5)
+        tail = f.read()
+        f.seek(0)
+
+        assert f.read() == bytes(range(256)) * 4096
+        assert tail == (bytes(range(256)) * 4096)[storage.open_block_size * 2 + 5 :]
+
+    def test_empty_file(self, uplyfile_emulator, storage):  # noqa: F811
+        record = uplyfile_emulator.store("empty.bin", b"")
+        storage.mapper.save("empty.bin", record["url"]["full"])
+
+        assert storage._open("empty.bin").read() == b""
+
+
+class TestDownloadCache:
+    @pytest.fixture
+    def cached_storage(self, tmp_path):
+        with override_settings(
+            UPLYFILE_STORAGE={
+                **settings.UPLYFILE_STORAGE,
+                "DOWNLOAD_CACHE_DIR": str(tmp_path / "downloads"),
+            }
+        ):
+            return UplyfileStorage(mappings_file=tmp_path / "mappings.json")
+
+    @pytest.fixture
+    def url(self, uplyfile_emulator, cached_storage):  # noqa: F811
+        url = uplyfile_emulator.store("file.txt", b"content")["url"]["full"]
+        cached_storage.mapper.save("file.txt", url)
+        return url
+
+    def test_revalidated_file_is_served_from_disk(self, cached_storage, url):
+        statuses = []
+        get = UplyfileStorage._get
+
+        def recording_get(storage, url, **kwargs):
+            response = get(storage, url, **kwargs)
+            statuses.append(response.status_code)
+            return response
+
+        with patch.object(UplyfileStorage, "_get", recording_get):
+            for _ in range(2):
+                with cached_storage._open("file.txt") as f:
+                    assert f.read() == b"content"
+
+        assert statuses == [200, 304]
+
+    def test_changed_file_is_downloaded_again(
+        self, cached_storage, url, uplyfile_emulator  # noqa: F811
+    ):
+        cached_storage._open("file.txt").close()
+        uid = next(iter(uplyfile_emulator.contents))
+        uplyfile_emulator.contents[uid] = b"changed"
+        uplyfile_emulator.etags[uid] = "changed"
+        uplyfile_emulator.modified[uid] += 60
+
+        with cached_storage._open("file.txt") as f:
+            assert f.read() == b"changed"
+
+    def test_deleted_file_is_removed_from_the_cache(
+        self, cached_storage, url, uplyfile_emulator  # noqa: F811
+    ):
+        cached_storage._open("file.txt").close()
+        uplyfile_emulator.contents.clear()
+
+        with pytest.raises(IOError):
+            cached_storage._open("file.txt")
+
+        assert cached_storage.download_cache.get(url) is None
+
+
+class TestMetadata:
+    @pytest.fixture
+    def emulated_storage(self, uplyfile_emulator, tmp_path):  # noqa: F811
+        with override_settings(
+            UPLYFILE_STORAGE={
+                "BASE_API_URL": uplyfile_emulator.api_url,
+                "PUBLIC_KEY": PUBLIC_KEY,
+                "SECRET_KEY": SECRET_KEY,
+            }
+        ):
+            return UplyfileStorage(mappings_file=tmp_path / "mappings.json")
+
+    def test_metadata_comes_from_the_listing(
+        self, emulated_storage, uplyfile_emulator  # noqa: F811
+    ):
+        record = uplyfile_emulator.store("file.txt", b"content")
+        emulated_storage.mapper.save("file.txt", record["url"]["full"])
+        emulated_storage.uplyfile.list_project_files()
+
+        with patch.object(Uplyfile, "file_headers") as head_mock:
+            assert emulated_storage.size("file.txt") == 7
+            modified = emulated_storage.get_modified_time("file.txt")
+            created = emulated_storage.get_created_time("file.txt")
+
+        head_mock.assert_not_called()
+        assert modified.timestamp() == pytest.approx(
+            uplyfile_emulator.modified[record["uid"]], abs=1e-3
+        )
+        assert created == modified
+
+    def test_head_metadata_is_fetched_once_per_url(
+        self, emulated_storage, uplyfile_emulator  # noqa: F811
+    ):
+        record = uplyfile_emulator.store("file.txt", b"content")
+        emulated_storage.mapper.save("file.txt", record["url"]["full"])
+
+        with patch.object(
+            Uplyfile,
+            "file_headers",
+            autospec=True,
+            side_effect=Uplyfile.file_headers,
+        ) as head_mock:
+            assert emulated_storage.size("file.txt") == 7
+            modified = emulated_storage.get_modified_time("file.txt")
+
+        head_mock.assert_called_once()
+        assert int(modified.timestamp()) == int(
+            uplyfile_emulator.modified[record["uid"]]
+        )
+
+    def test_missing_head_metadata_comes_from_the_listing(
+        self, emulated_storage, uplyfile_emulator  # noqa: F811
+    ):
+        record = uplyfile_emulator.store("file.txt", b"content")
+        emulated_storage.mapper.save("file.txt", record["url"]["full"])
+        headers = {"Content-Encoding": "gzip", "Content-Length": "27"}
+
+        with patch.object(Uplyfile, "file_headers", return_value=headers):
+            assert emulated_storage.size("file.txt") == 7
+            modified = emulated_storage.get_modified_time("file.txt")
+
+        assert modified.timestamp() == pytest.approx(
+            uplyfile_emulator.modified[record["uid"]], abs=1e-3
+        )
+
+    def test_missing_head_metadata_downloads_listing_once(
+        self, emulated_storage, uplyfile_emulator  # noqa: F811
+    ):
+        for name in ("a.txt", "b.txt", "c.txt"):
+            record = uplyfile_emulator.store(name, name.encode())
+            emulated_storage.mapper.save(name, record["url"]["full"])
+        headers = {"Content-Encoding": "gzip", "Content-Length": "27"}
+
+        with patch.object(Uplyfile, "file_headers", return_value=headers), patch.object(
+            Uplyfile,
+            "iter_project_files",
+            autospec=True,
+            side_effect=Uplyfile.iter_project_files,
+        ) as listing_mock:
+            for name in ("a.txt", "b.txt", "c.txt"):
+                assert emulated_storage.size(name) == 5
+
+        listing_mock.assert_called_once()
+
+    def test_metadata_unknown_to_head_and_listing_raises(
+        self, emulated_storage, uplyfile_emulator  # noqa: F811
+    ):
+        emulated_storage.mapper.save("file.txt", f"{uplyfile_emulator.url}/other")
+        headers = {"Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"}
+
+        with patch.object(Uplyfile, "file_headers", return_value=headers):
+            assert emulated_storage.get_modified_time("file.txt").year == 2015
+            with pytest.raises(IOError, match="size"):
+                emulated_storage.size("file.txt")
+
+    def test_metadata_of_missing_file_raises(
+        self, emulated_storage, uplyfile_emulator  # noqa: F811
+    ):
+        record = uplyfile_emulator.store("file.txt", b"content")
+        emulated_storage.mapper.save("file.txt", record["url"]["full"])
+        del uplyfile_emulator.contents[record["uid"]]
+
+        with pytest.raises(IOError):
+            emulated_storage.size("file.txt")
+
+    def test_listdir_lists_mapped_names(self, storage):
+        storage.mapper.save_many({"a/b.txt": "1", "a/c/d.txt": "2", "e.txt": "3"})
+
+        assert storage.listdir("") == (["a"], ["e.txt"])
+        assert storage.listdir("a/") == (["c"], ["b.txt"])